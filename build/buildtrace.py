@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""Traces a build for buildtrace=1.
+
+Every task SCons executes is recorded, configure checks included:
+- its start and end time
+- the worker slot (job thread) that ran it
+- the peak resident set size of the commands it spawned
+- the sizes of its targets and sources
+
+At exit the trace is written to cache/buildtrace.json in the Trace Event
+format, which chrome://tracing (or https://ui.perfetto.dev) displays as one
+row per worker slot. A summary of the slowest translation units and of the
+critical path follows: the chain of dependent tasks that took longest,
+which no amount of parallelism can shorten.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+import SCons.Node.FS
+import SCons.Taskmaster
+
+import timing
+
+TRACE_FILE = 'buildtrace.json'
+SUMMARY_ENTRIES = 10
+
+OBJECT_SUFFIXES = ('.o', '.os', '.obj')
+
+
+def classify(path):
+    """Returns the kind of action that builds path."""
+    name = os.path.basename(path)
+    if '.sconf_temp' in path:
+        return 'configure'
+    if name.endswith(OBJECT_SUFFIXES):
+        return 'compile'
+    if name.startswith('moc_') or name.endswith('.moc') or \
+            name.startswith('mocs_compilation_'):
+        return 'moc'
+    if name.startswith('ui_'):
+        return 'uic'
+    if name.startswith('qrc_') or name.endswith('.rcc'):
+        return 'qrc'
+    if '.pb.' in name:
+        return 'protoc'
+    if name.endswith(('.qm', '.ts')):
+        return 'translations'
+    if name.endswith(('.a', '.lib', '.so', '.dylib', '.dll', '.exe')) or \
+            '.' not in name:
+        return 'link'
+    return 'other'
+
+
+def _size(node):
+    try:
+        return os.path.getsize(node.abspath)
+    except (OSError, AttributeError):
+        return 0
+
+
+class BuildTrace(object):
+
+    def __init__(self, build):
+        self.path = os.path.join(build.get_cache_dir(), TRACE_FILE)
+        self.start = time.time()
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.slots = {}
+
+    def _slot(self):
+        ident = threading.current_thread().ident
+        with self.lock:
+            return self.slots.setdefault(ident, len(self.slots))
+
+    def install(self, env):
+        """Wraps SPAWN of env and the execution of all SCons tasks."""
+        spawn = timing.measured_spawn(env['SPAWN'])
+        trace = self
+
+        def traced_spawn(sh, escape, cmd, args, spawn_env):
+            result = spawn(sh, escape, cmd, args, spawn_env)
+            trace.local.peak_rss = max(getattr(trace.local, 'peak_rss', 0),
+                                       getattr(timing.usage, 'peak_rss', 0))
+            return result
+        traced_spawn.measured = getattr(spawn, 'measured', False)
+        env['SPAWN'] = traced_spawn
+
+        execute = SCons.Taskmaster.Task.execute
+
+        def traced_execute(task):
+            trace.local.peak_rss = 0
+            start = time.time()
+            try:
+                return execute(task)
+            finally:
+                trace.record(task, start, time.time(),
+                             trace.local.peak_rss)
+        SCons.Taskmaster.Task.execute = traced_execute
+        atexit.register(self.finish)
+
+    def record(self, task, start, end, peak_rss):
+        targets = task.targets
+        if not targets:
+            return
+        name = str(targets[0])
+        if isinstance(targets[0], SCons.Node.FS.File):
+            kind = classify(targets[0].get_abspath())
+        else:
+            # Aliases, directories and values.
+            kind = 'other'
+        sources = []
+        for target in targets:
+            sources.extend(target.sources)
+        event = {
+            'name': name,
+            'cat': kind,
+            'ph': 'X',
+            'ts': int((start - self.start) * 1e6),
+            'dur': int((end - start) * 1e6),
+            'pid': 1,
+            'tid': self._slot(),
+            'args': {
+                'peak_rss_kb': peak_rss,
+                'target_bytes': sum(_size(node) for node in targets),
+                'source_bytes': sum(_size(node) for node in sources),
+            },
+        }
+        with self.lock:
+            self.events.append((event, targets))
+
+    def critical_path(self):
+        """Returns the events of the longest chain of dependent tasks."""
+        by_node = {}
+        for event, targets in self.events:
+            for node in targets:
+                by_node[node] = event
+        # node -> (total duration of the longest chain ending in it, chain)
+        longest = {}
+
+        def chain(node):
+            if node in longest:
+                return longest[node]
+            # Mark the node to stop at dependency cycles.
+            longest[node] = (0, [])
+            best = (0, [])
+            pending = list(node.children(scan=0))
+            seen = set()
+            while pending:
+                child = pending.pop()
+                if child in seen:
+                    continue
+                seen.add(child)
+                if child in by_node:
+                    candidate = chain(child)
+                    if candidate[0] > best[0]:
+                        best = candidate
+                else:
+                    # Look through untraced nodes, e.g. up-to-date sources
+                    # and aliases.
+                    pending.extend(child.children(scan=0))
+            event = by_node.get(node)
+            # Targets built by the same task share its event.
+            if event is not None and event not in best[1]:
+                best = (best[0] + event['dur'], best[1] + [event])
+            longest[node] = best
+            return best
+
+        result = (0, [])
+        for node in by_node:
+            candidate = chain(node)
+            if candidate[0] > result[0]:
+                result = candidate
+        return result
+
+    def summary(self):
+        events = [event for event, _ in self.events]
+        compiles = sorted((event for event in events
+                           if event['cat'] == 'compile'),
+                          key=lambda event: -event['dur'])
+        if compiles:
+            print "Slowest translation units:"
+            for event in compiles[:SUMMARY_ENTRIES]:
+                print "  %7.2fs %7d MB  %s" % (
+                    event['dur'] / 1e6, event['args']['peak_rss_kb'] / 1024,
+                    event['name'])
+        total, path = self.critical_path()
+        wall = max(event['ts'] + event['dur'] for event in events)
+        print "Critical path: %.1fs of %.1fs wall time in %d steps" % (
+            total / 1e6, wall / 1e6, len(path))
+        for event in sorted(path, key=lambda event: -event['dur'])[
+                :SUMMARY_ENTRIES]:
+            print "  %7.2fs %-11s %s" % (event['dur'] / 1e6, event['cat'],
+                                         event['name'])
+
+    def finish(self):
+        if not self.events:
+            return
+        events = [event for event, _ in self.events]
+        names = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': slot,
+                  'args': {'name': 'worker %d' % slot}}
+                 for slot in sorted(self.slots.itervalues())]
+        try:
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump({'traceEvents': names + events,
+                           'displayTimeUnit': 'ms'}, f)
+            os.rename(self.path + '.tmp', self.path)
+        except (IOError, OSError):
+            return
+        self.summary()
+        print "Build trace written to %s (open it in chrome://tracing)." % \
+            self.path
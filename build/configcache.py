@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+"""Persistent cache for Dependence/Feature configure results.
+
+Every Dependence.configure() call in SConscript.env runs a number of
+conf.CheckLib / CheckHeader / CheckForPKG probes which each compile and link
+a test program. The results only change when the toolchain, the build flags
+or the libraries on the system change, so we record the side effects each
+configure() had on the environment and replay them on the next run instead
+of probing again.
+
+The cache is stored in cache/configure.cache. It is keyed globally by the
+compiler identity, the relevant environment variables, the flags from
+cache/custom.py and the build scripts themselves. Each dependency entry is
+additionally keyed by a fingerprint of the libraries, headers and pkg-config
+files it probed, so upgrading a single library only re-runs the configure()
+of the dependencies that looked at it.
+"""
+
+import cPickle as pickle
+import hashlib
+import logging
+import os
+import sys
+import UserList
+
+import SCons
+from SCons import Script
+
+CACHE_VERSION = 1
+CACHE_FILE = 'configure.cache'
+
+# Shell environment variables that influence the outcome of configure checks.
+ENVIRONMENT_VARIABLES = ['CC', 'CXX', 'CFLAGS', 'CXXFLAGS', 'LDFLAGS', 'PATH',
+                         'CPATH', 'LIBRARY_PATH', 'LD_LIBRARY_PATH',
+                         'PKG_CONFIG_PATH', 'PKG_CONFIG_LIBDIR', 'QTDIR',
+                         'LIBDIR', 'BINDIR', 'SHAREDIR']
+
+# The build scripts that implement configure(). Editing one of them
+# invalidates the whole cache.
+BUILD_SCRIPTS = ['mixxx.py', 'depends.py', 'features.py', 'util.py',
+                 'configcache.py']
+
+# conf methods whose arguments we record as inputs of a dependency.
+LIBRARY_CHECKS = ['CheckLib', 'CheckLibWithHeader']
+HEADER_CHECKS = ['CheckHeader', 'CheckCHeader', 'CheckCXXHeader']
+PKG_CHECKS = ['CheckForPKG']
+
+DEFAULT_LIBRARY_DIRS = ['/lib', '/lib64', '/usr/lib', '/usr/lib64',
+                        '/usr/local/lib', '/opt/local/lib', '/sw/lib']
+DEFAULT_INCLUDE_DIRS = ['/usr/include', '/usr/local/include',
+                        '/opt/local/include', '/sw/include']
+DEFAULT_PKG_CONFIG_DIRS = ['/usr/lib/pkgconfig', '/usr/lib64/pkgconfig',
+                           '/usr/share/pkgconfig', '/usr/local/lib/pkgconfig',
+                           '/usr/local/share/pkgconfig',
+                           '/usr/libdata/pkgconfig',
+                           '/usr/local/libdata/pkgconfig']
+
+
+def _is_plain(value):
+    """Returns whether value can be compared, pickled and restored."""
+    if value is None or isinstance(value, (basestring, bool, int, long,
+                                           float)):
+        return True
+    if isinstance(value, (list, tuple, UserList.UserList)):
+        return all(_is_plain(item) for item in value)
+    return False
+
+
+def _normalize(value):
+    """Converts SCons list types (CLVar, NodeList) to plain lists."""
+    if isinstance(value, UserList.UserList):
+        return [_normalize(item) for item in value.data]
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_normalize(item) for item in value)
+    return value
+
+
+class _Opaque(object):
+    """Stands in for a value we cannot restore (functions, Nodes, ...). It
+    only allows us to detect that such a value was changed."""
+
+    def __init__(self, value):
+        self.value = repr(value)
+
+    def __eq__(self, other):
+        return isinstance(other, _Opaque) and self.value == other.value
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def snapshot_environment(env):
+    """Returns a dictionary of all construction variables of env.
+
+    Variables of the shell environment (env['ENV']) are returned with an
+    'ENV:' prefix."""
+    snapshot = {}
+    for key, value in env.Dictionary().iteritems():
+        if key != 'ENV':
+            snapshot[key] = _normalize(value) if _is_plain(value) \
+                else _Opaque(value)
+    for key, value in env['ENV'].iteritems():
+        snapshot['ENV:' + key] = _normalize(value) if _is_plain(value) \
+            else _Opaque(value)
+    return snapshot
+
+
+def diff_snapshots(before, after):
+    """Returns a list of (key, old, new) for every variable that changed.
+    A missing variable is represented by the KeyError class."""
+    changes = []
+    for key in set(before) | set(after):
+        old = before.get(key, KeyError)
+        new = after.get(key, KeyError)
+        if old != new:
+            changes.append((key, old, new))
+    changes.sort()
+    return changes
+
+
+def _restore_value(current, value):
+    """Restores value using the type of the value it replaces."""
+    if isinstance(current, SCons.Util.CLVar) and isinstance(value, list):
+        return SCons.Util.CLVar(value)
+    return value
+
+
+def apply_changes(env, changes):
+    """Applies changes recorded by diff_snapshots to env.
+
+    Returns False without touching env if env does not hold the recorded
+    'old' values, i.e. the change was recorded against a different state."""
+    snapshot = snapshot_environment(env)
+    for key, old, new in changes:
+        if snapshot.get(key, KeyError) != old:
+            return False
+    for key, old, new in changes:
+        if key.startswith('ENV:'):
+            container, key = env['ENV'], key[len('ENV:'):]
+        else:
+            container = env
+        if new is KeyError:
+            del container[key]
+        else:
+            container[key] = _restore_value(container.get(key), new)
+    return True
+
+
+def rebase_changes(snapshot, changes):
+    """Rewrites changes recorded against another state so they apply to the
+    environment described by snapshot.
+
+    Values that still hold the recorded old value are simply replaced. Lists
+    that were only appended or prepended to get the same items appended or
+    prepended to their current value. Returns None if a change cannot be
+    rebased unambiguously, e.g. if an appended item is already present (in
+    which case AppendUnique and Append would disagree)."""
+    rebased = []
+    for key, old, new in changes:
+        current = snapshot.get(key, KeyError)
+        if current == old:
+            rebased.append((key, current, new))
+            continue
+        if old is KeyError:
+            old = []
+        if not (isinstance(current, list) and isinstance(old, list) and
+                isinstance(new, list) and len(new) > len(old)):
+            return None
+        added = len(new) - len(old)
+        if new[:len(old)] == old:
+            items, value = new[len(old):], current + new[len(old):]
+        elif new[added:] == old:
+            items, value = new[:added], new[:added] + current
+        else:
+            return None
+        if any(item in current for item in items):
+            return None
+        rebased.append((key, current, value))
+    return rebased
+
+
+def _plain_items(dictionary):
+    return dict((key, _normalize(value))
+                for key, value in dictionary.iteritems()
+                if _is_plain(value))
+
+
+def state_digest(env, flags):
+    """Returns a digest of everything configure checks see: the
+    construction variables of env and the build flags."""
+    snapshot = sorted((key, value.value if isinstance(value, _Opaque)
+                       else value)
+                      for key, value in snapshot_environment(env).iteritems())
+    return hashlib.sha1(repr((snapshot, sorted(_plain_items(flags).items())))
+                        ).hexdigest()
+
+
+def _hash_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except IOError:
+        return None
+
+
+class _DirectoryIndex(object):
+    """Memoizes directory listings so fingerprinting a dependency does not
+    stat every candidate file name in every search directory."""
+
+    def __init__(self):
+        self._listings = {}
+
+    def find(self, directories, names):
+        found = []
+        for directory in directories:
+            listing = self._listings.get(directory)
+            if listing is None:
+                try:
+                    listing = frozenset(os.listdir(directory))
+                except OSError:
+                    listing = frozenset()
+                self._listings[directory] = listing
+            for name in names:
+                if name in listing:
+                    path = os.path.join(directory, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((path, st.st_size, int(st.st_mtime)))
+        return found
+
+
+class _RecordingConf(object):
+    """Wraps a SCons Configure context and records which libraries, headers
+    and pkg-config packages a dependency probes."""
+
+    def __init__(self, conf, inputs):
+        self._conf = conf
+        self._inputs = inputs
+
+    def __getattr__(self, name):
+        attr = getattr(self._conf, name)
+        if name in LIBRARY_CHECKS:
+            kind = 'lib'
+        elif name in HEADER_CHECKS:
+            kind = 'header'
+        elif name in PKG_CHECKS:
+            kind = 'pkg'
+        else:
+            return attr
+
+        def recorder(*args, **kwargs):
+            # The first argument of all recorded checks is a name or a list
+            # of names. CheckLibWithHeader also takes a header.
+            if args:
+                self._inputs.add_names(kind, args[0])
+            if name == 'CheckLibWithHeader' and len(args) > 1:
+                self._inputs.add_names('header', args[1])
+            return attr(*args, **kwargs)
+        return recorder
+
+
+class _Inputs(object):
+    """The set of external files a dependency's configure() looked at."""
+
+    def __init__(self):
+        self.libs = set()
+        self.headers = set()
+        self.pkgs = set()
+
+    def add_names(self, kind, names):
+        if isinstance(names, basestring):
+            names = [names]
+        target = {'lib': self.libs, 'header': self.headers,
+                  'pkg': self.pkgs}[kind]
+        for name in names:
+            if isinstance(name, basestring):
+                target.add(name)
+
+    def add_parse_config(self, command):
+        # "pkg-config libusb-1.0 --silence-errors --cflags --libs"
+        command = command if isinstance(command, basestring) \
+            else ' '.join(command)
+        words = command.split()
+        if words and os.path.basename(words[0]) == 'pkg-config':
+            for word in words[1:]:
+                if not word.startswith('-'):
+                    self.pkgs.add(word)
+
+    def state(self):
+        return (sorted(self.libs), sorted(self.headers), sorted(self.pkgs))
+
+
+class ConfigureCache(object):
+
+    def __init__(self, build):
+        self.build = build
+        self.env = build.env
+        self.enabled = int(Script.ARGUMENTS.get('configcache', 1)) and \
+            Script.GetOption('config') != 'force'
+        self.path = os.path.join(build.get_cache_dir(), CACHE_FILE)
+        self.key = self._global_key()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._index = _DirectoryIndex()
+        if self.enabled:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError, ValueError,
+                AttributeError, ImportError, IndexError):
+            return
+        if data.get('version') != CACHE_VERSION or data.get('key') != self.key:
+            logging.info('Configure cache is stale, re-running all checks.')
+            return
+        self.entries = data.get('entries', {})
+
+    def save(self):
+        if not self.enabled:
+            return
+        data = {'version': CACHE_VERSION,
+                'key': self.key,
+                'entries': self.entries}
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, self.path)
+
+    def _compiler_identity(self):
+        identity = []
+        for tool in ('CC', 'CXX', 'LINK'):
+            command = self.env.subst('$' + tool)
+            identity.append(command)
+            path = self.env.WhereIs(command.split()[0]) if command else None
+            if path:
+                path = os.path.realpath(path)
+                st = os.stat(path)
+                identity.append((path, st.st_size, int(st.st_mtime)))
+        return identity
+
+    def _global_key(self):
+        build = self.build
+        key = hashlib.sha1()
+
+        def add(value):
+            key.update(repr(value))
+            key.update('\0')
+
+        add(CACHE_VERSION)
+        add(sys.version)
+        add(SCons.__version__)
+        add((build.platform, build.machine, build.build, build.toolchain,
+             build.crosscompile, build.static_dependencies))
+        add(self._compiler_identity())
+        add([(name, os.environ.get(name)) for name in ENVIRONMENT_VARIABLES])
+        add(sorted(Script.ARGUMENTS.iteritems()))
+        add(_hash_file(os.path.join(build.get_cache_dir(), 'custom.py')))
+        build_dir = os.path.dirname(os.path.abspath(__file__))
+        add([_hash_file(os.path.join(build_dir, name))
+             for name in BUILD_SCRIPTS])
+        return key.hexdigest()
+
+    def _library_dirs(self):
+        dirs = [self._resolve_dir(d) for d in self.env.get('LIBPATH', [])]
+        dirs.extend(os.environ.get('LIBRARY_PATH', '').split(os.pathsep))
+        dirs.append('/usr/lib/%s-linux-gnu' % self.build.machine)
+        dirs.extend(DEFAULT_LIBRARY_DIRS)
+        return [d for d in dirs if d]
+
+    def _include_dirs(self):
+        dirs = [self._resolve_dir(d) for d in self.env.get('CPPPATH', [])]
+        dirs.extend(os.environ.get('CPATH', '').split(os.pathsep))
+        dirs.extend(DEFAULT_INCLUDE_DIRS)
+        return [d for d in dirs if d]
+
+    def _pkg_config_dirs(self):
+        dirs = os.environ.get('PKG_CONFIG_PATH', '').split(os.pathsep)
+        dirs.extend(os.environ.get('PKG_CONFIG_LIBDIR', '').split(os.pathsep))
+        dirs.extend(os.path.join(d, 'pkgconfig')
+                    for d in self._library_dirs())
+        dirs.extend(DEFAULT_PKG_CONFIG_DIRS)
+        return [d for d in dirs if d]
+
+    def _resolve_dir(self, directory):
+        if not isinstance(directory, basestring):
+            return directory.abspath
+        directory = self.env.subst(directory)
+        if directory.startswith('#'):
+            return Script.Dir(directory).abspath
+        return directory
+
+    def _fingerprint(self, inputs):
+        libs, headers, pkgs = inputs
+        library_names = []
+        for lib in libs:
+            for name in (lib, 'lib' + lib):
+                library_names.extend([name + '.so', name + '.a',
+                                      name + '.dylib', name + '.lib',
+                                      name + '.dll.a', name + '.tbd'])
+        # Unlike libraries, headers are looked up with their directory part
+        # (e.g. FLAC/stream_decoder.h).
+        include_dirs = self._include_dirs()
+        header_files = []
+        for header in headers:
+            subdir, name = os.path.split(header)
+            header_files.extend(self._index.find(
+                [os.path.join(d, subdir) for d in include_dirs], [name]))
+        return (self._index.find(self._library_dirs(), library_names),
+                header_files,
+                self._index.find(self._pkg_config_dirs(),
+                                 [pkg + '.pc' for pkg in pkgs]))
+
+    def is_fresh(self, dependency):
+        """Returns whether the cached entry of dependency is still valid,
+        regardless of the state of the environment."""
+        entry = self.entries.get(dependency.name) if self.enabled else None
+        return entry is not None and \
+            self._fingerprint(entry['inputs']) == entry['fingerprint']
+
+    def replay(self, dependency, entry, rebase=False):
+        """Applies the side effects recorded in entry. With rebase, the
+        environment changes are replayed on top of the current environment
+        (see rebase_changes) instead of requiring the recorded state."""
+        changes = entry['env']
+        if rebase:
+            changes = rebase_changes(snapshot_environment(self.env), changes)
+            if changes is None:
+                return False
+        if not apply_changes(self.env, changes):
+            return False
+        self.build.flags.update(entry['flags'])
+        for name, value in entry['attributes'].iteritems():
+            setattr(dependency, name, value)
+        return True
+
+    def lookup(self, dependency):
+        """Replays the cached side effects of dependency.configure() if none
+        of its inputs changed since the last run. Returns whether it did."""
+        name = dependency.name
+        if not self.is_fresh(dependency) or \
+                not self.replay(dependency, self.entries[name]):
+            return False
+        self.hits += 1
+        print "Configuring %s (cached)" % name
+        return True
+
+    def record(self, dependency, build, conf):
+        """Runs dependency.configure(build, conf) and returns an entry
+        describing its side effects, or None if they cannot be replayed."""
+        inputs = _Inputs()
+        env_before = snapshot_environment(self.env)
+        flags_before = _plain_items(build.flags)
+        attributes_before = _plain_items(dependency.__dict__)
+
+        parse_config = self.env.ParseConfig
+
+        def recording_parse_config(command, *args, **kwargs):
+            inputs.add_parse_config(command)
+            return parse_config(command, *args, **kwargs)
+        self.env.ParseConfig = recording_parse_config
+        try:
+            # Exceptions (unmet dependencies) propagate and are not cached.
+            dependency.configure(build, _RecordingConf(conf, inputs))
+        finally:
+            del self.env.ParseConfig
+
+        changes = diff_snapshots(env_before, snapshot_environment(self.env))
+        if any(isinstance(old, _Opaque) or isinstance(new, _Opaque)
+               for key, old, new in changes):
+            logging.debug('Not caching configure results of %s: it changed '
+                          'construction variables that cannot be restored.'
+                          % dependency.name)
+            return None
+
+        flags_after = _plain_items(build.flags)
+        attributes_after = _plain_items(dependency.__dict__)
+        return {
+            'inputs': inputs.state(),
+            'fingerprint': self._fingerprint(inputs.state()),
+            'env': changes,
+            'flags': dict((key, value)
+                          for key, value in flags_after.iteritems()
+                          if flags_before.get(key, KeyError) != value),
+            'attributes': dict((key, value)
+                               for key, value in attributes_after.iteritems()
+                               if attributes_before.get(key, KeyError) != value),
+        }
+
+    def store(self, dependency, entry):
+        if entry is None:
+            self.entries.pop(dependency.name, None)
+        else:
+            self.entries[dependency.name] = entry
+
+    def configure(self, dependency, build, conf):
+        """Runs dependency.configure(build, conf) or replays its recorded
+        side effects if none of its inputs changed since the last run."""
+        if self.lookup(dependency):
+            return
+        self.misses += 1
+        self.entries.pop(dependency.name, None)
+        print "Configuring %s" % dependency.name
+        self.store(dependency, self.record(dependency, build, conf))
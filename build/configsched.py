@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""Runs Dependence/Feature configure probes in parallel.
+
+Most configure() methods take little from each other: they run a couple of
+CheckLib/CheckHeader probes and append the results to LIBS, CPPPATH and
+CPPDEFINES. Before SConscript.env walks the dependency graph serially, the
+ConfigureScheduler walks the depends() DAG the same way and runs the
+configure() of every node in a forked worker process, up to configure_jobs
+at a time.
+
+A probe must see the same environment as in the serial walk, so a worker
+replays the results of all nodes that precede its node in that order, not
+only of the ones that pulled it in. Those results are not known yet when the
+workers start, so the workers use predictions: the cached results of the last
+run and, in later waves, the results of the previous wave. Every worker
+reports a digest of the environment its probes ran against and of the one
+they left behind. A result is exact if it started from the environment the
+exact result before it left behind. The next wave re-runs the nodes after
+the exact ones, with better predictions, up to MAX_WAVES waves.
+
+Workers only report the side effects of configure() (see configcache). The
+serial walk in SConscript.env stays in charge: for every node it visits it
+applies the side effects the worker recorded only if the current environment
+has the digest the worker started from. Otherwise, if the worker failed or if
+the node was not prefetched, configure() runs in-process like it always did.
+Output of the workers is printed when their results are applied, so the log
+reads the same as a serial run.
+
+Workers need fork(), so on Windows or with configure_jobs=1 everything runs
+serially. Without configure_jobs the job count given with -j is used; the one
+JobScheduler picks when -j is not given is not.
+"""
+
+import cPickle as pickle
+import logging
+import os
+import StringIO
+import sys
+import tempfile
+
+import SCons
+from SCons import Script
+
+from configcache import state_digest
+from jobs import user_gave_jobs
+
+# Every worker numbers its conftest files starting at a different offset so
+# workers do not overwrite each other's test programs in .sconf_temp.
+CONFTEST_COUNTER_STRIDE = 100000
+# Waves of workers to run before leaving the remaining nodes to the serial
+# walk. Each wave settles at least one more node.
+MAX_WAVES = 3
+
+
+def _fork_map(function, items, jobs):
+    """Returns [function(index, item) for each item], running each call in a
+    forked child, at most jobs at a time. Results must be picklable. The
+    result of a child that crashed is None."""
+    results = [None] * len(items)
+    pending = list(reversed(list(enumerate(items))))
+    running = {}
+    while pending or running:
+        while pending and len(running) < jobs:
+            index, item = pending.pop()
+            fd, path = tempfile.mkstemp(prefix='mixxx-configure-')
+            # Do not let the children flush our buffered output again.
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    result = function(index, item)
+                    with os.fdopen(fd, 'wb') as f:
+                        pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+                    status = 0
+                finally:
+                    os._exit(status)
+            os.close(fd)
+            running[pid] = (index, path)
+
+        pid, status = os.wait()
+        if pid not in running:
+            continue
+        index, path = running.pop(pid)
+        try:
+            if status == 0:
+                with open(path, 'rb') as f:
+                    results[index] = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            pass
+        finally:
+            os.remove(path)
+    return results
+
+
+class _Node(object):
+    """A dependency to prefetch and its position in the serial walk."""
+
+    def __init__(self, dependency, position):
+        self.dependency = dependency
+        self.position = position
+
+
+class ConfigureScheduler(object):
+
+    def __init__(self, build, conf, config_cache):
+        self.build = build
+        self.conf = conf
+        self.cache = config_cache
+        # Only an explicit -j sets the default: the job count JobScheduler
+        # picks by itself does not turn on forked configure.
+        jobs = int(Script.ARGUMENTS.get('configure_jobs', 0)) or \
+            (Script.GetOption('num_jobs') if user_gave_jobs() else 1)
+        if not hasattr(os, 'fork'):
+            jobs = 1
+        self.jobs = max(jobs, 1)
+        # The nodes in the order of the serial walk.
+        self.order = []
+        # dependency name -> entry its successors replay
+        self.predictions = {}
+        # dependency name -> (status, entry, output, digest it started from)
+        self.results = {}
+
+    def _plan(self, features):
+        """Walks the depends() DAG like SConscript.env does and returns the
+        nodes in the order it configures them."""
+        build = self.build
+        order = []
+        visited = set()
+
+        def visit(dependency_class):
+            if dependency_class in visited:
+                return
+            visited.add(dependency_class)
+            dependency = dependency_class()
+            order.append(_Node(dependency, len(order)))
+            for sub_dependency in dependency.depends(build):
+                visit(sub_dependency)
+
+        for feature in features:
+            order.append(_Node(feature, len(order)))
+            try:
+                # enabled() may change once configure() ran; the serial walk
+                # then finds other digests and configures in-process.
+                if not feature.enabled(build):
+                    continue
+                for dependency in feature.depends(build):
+                    visit(dependency)
+            except Exception, e:
+                logging.debug('Not prefetching dependencies of %s: %s'
+                              % (feature.name, e))
+        return order
+
+    def _digest(self):
+        return state_digest(self.build.env, self.build.flags)
+
+    def _configure_node(self, index, node):
+        """Runs in a worker. Replays the predicted results of the nodes
+        before this one and records the side effects of its configure().
+        Returns (status, entry, output, digest before, digest after)."""
+        counter = getattr(SCons.SConf, '_ac_build_counter', None)
+        if counter is not None:
+            SCons.SConf._ac_build_counter = \
+                counter + (index + 1) * CONFTEST_COUNTER_STRIDE
+        # Concurrent writes would garble config.log. The serial walk logs
+        # every check that is not replayed from a worker.
+        self.conf.logstream = None
+
+        for previous in self.order[:node.position]:
+            entry = self.predictions.get(previous.dependency.name)
+            if entry is not None:
+                # A wrong prediction only shows in the digests.
+                self.cache.replay(previous.dependency, entry, rebase=True)
+        before = self._digest()
+        output = StringIO.StringIO()
+        sys.stdout = output
+        try:
+            # Like the serial walk, use a cached result where it applies.
+            if self.cache.lookup(node.dependency):
+                status = 'cached'
+                entry = self.cache.entries[node.dependency.name]
+            else:
+                entry = self.cache.record(node.dependency, self.build,
+                                          self.conf)
+                status = 'ok' if entry is not None else 'uncacheable'
+        except Exception, e:
+            status, entry = 'error', str(e)
+        finally:
+            sys.stdout = sys.__stdout__
+        return (status, entry, output.getvalue(), before, self._digest())
+
+    def prefetch(self, features):
+        """Configures all dependencies reachable from features in parallel
+        and keeps their results for configure()."""
+        if self.jobs < 2:
+            return
+        self.order = self._plan(features)
+        self.predictions = dict(self.cache.entries)
+        # The nodes before position are settled, the last one left the
+        # environment with the digest exact.
+        position = 0
+        exact = self._digest()
+        for _ in xrange(MAX_WAVES):
+            nodes = self.order[position:]
+            if not nodes:
+                break
+            results = _fork_map(self._configure_node, nodes, self.jobs)
+            for node, result in zip(nodes, results):
+                if result is None:
+                    continue
+                status, entry, output, before, after = result
+                name = node.dependency.name
+                self.results[name] = (status, entry, output, before)
+                if status in ('ok', 'cached'):
+                    self.predictions[name] = entry
+                else:
+                    self.predictions.pop(name, None)
+            settled = position
+            for result in results:
+                if result is None or result[3] != exact:
+                    break
+                exact = result[4]
+                position += 1
+            if position == settled or position == len(self.order):
+                break
+            # Nothing after a node that changed the environment in a way
+            # that cannot be replayed can start from the right one.
+            name = self.order[position - 1].dependency.name
+            if name not in self.predictions and \
+                    self.results[name][3] != exact:
+                break
+
+    def configure(self, dependency, build, conf):
+        """Applies the prefetched results of dependency.configure() if they
+        were recorded against the current environment, falling back to
+        running it in-process (through the configure cache)."""
+        if self.cache.lookup(dependency):
+            return
+        name = dependency.name
+        status, entry, output, before = \
+            self.results.pop(name, (None, None, None, None))
+        if status == 'ok' and before == self._digest() and \
+                self.cache.replay(dependency, entry):
+            print "Configuring %s" % name
+            sys.stdout.write(output)
+            self.cache.misses += 1
+            self.cache.store(dependency, entry)
+            return
+        self.cache.configure(dependency, build, conf)
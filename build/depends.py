@@ -997,14 +997,16 @@ class MixxxCore(Feature):
 
         proto_args = {
             'PROTOCPROTOPATH': ['src'],
-            'PROTOCPYTHONOUTDIR': '',  # set to None to not generate python
+            'PROTOCPYTHONOUTDIR': '',  # set to a directory to generate python
             'PROTOCOUTDIR': build.build_dir,
             'PROTOCCPPOUTFLAGS': '',
             #'PROTOCCPPOUTFLAGS': "dllexport_decl=PROTOCONFIG_EXPORT:"
         }
+        # All protos are compiled by a single protoc run.
         proto_sources = SCons.Glob('proto/*.proto')
-        proto_objects = [build.env.Protoc([], proto_source, **proto_args)[0]
-                         for proto_source in proto_sources]
+        proto_objects = [target for target in
+                         build.env.Protoc([], proto_sources, **proto_args)
+                         if str(target).endswith('.pb.cc')]
         sources.extend(proto_objects)
 
         # Uic these guys (they're moc'd automatically after this) - Generates
@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+"""Finds the shared libraries Mixxx needs on Linux and bundles them.
+
+load() reads DT_SONAME, DT_NEEDED, DT_RPATH and DT_RUNPATH from the dynamic
+section of an ELF file, memoized by path and invalidated by mtime and size.
+
+Resolver looks libraries up like ld.so(8) does: in the DT_RPATH of the
+object and of the executable unless the object has a DT_RUNPATH, in
+LD_LIBRARY_PATH, in the DT_RUNPATH, and then in the directories of
+/etc/ld.so.conf and the default directories. It counts the directories it
+probes on the way. Resolver.closure() walks the DT_NEEDED of the programs
+and plugins transitively, reading every library once.
+
+The Bundle builder copies mixxx, the plugins it is given and all
+libraries of the closure that are not part of the base system (see
+SYSTEM_LIBRARIES) into a directory, and points their DT_RUNPATH at the
+bundled libraries with $ORIGIN, using patchelf. It writes bundle-report.txt
+there. For every bundled library it compares where ld.so finds it and how
+many directories it probes for it, from the bundle and from the system. It
+also gives the time ld.so takes to load the libraries of the bundled and of
+the unbundled program, measured like ldd(1) does it.
+
+Only the builder imports SCons, so the reader and the resolver also work
+without it. build/tests/test_elfdeps.py checks them against the fixture
+binaries.
+"""
+
+import fnmatch
+import glob
+import hashlib
+import os
+import shutil
+import stat
+import struct
+import subprocess
+import time
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_STRSZ = 10
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+PT_LOAD = 1
+PT_DYNAMIC = 2
+
+# Libraries that belong to the base system and are never bundled: the C
+# library, and the libraries that have to match the running drivers, display
+# and sound servers.
+SYSTEM_LIBRARIES = [
+    'ld-linux*', 'linux-vdso.so*', 'libc.so*', 'libm.so*', 'libmvec.so*',
+    'libdl.so*', 'libpthread.so*', 'librt.so*', 'libresolv.so*',
+    'libutil.so*', 'libnsl.so*', 'libanl.so*', 'libnss_*', 'libthread_db*',
+    'libgcc_s.so*', 'libstdc++.so*',
+    'libGL.so*', 'libGLX*', 'libGLdispatch.so*', 'libEGL.so*',
+    'libOpenGL.so*', 'libglapi.so*', 'libdrm.so*', 'libgbm.so*',
+    'libX11.so*', 'libX11-xcb.so*', 'libxcb*', 'libICE.so*', 'libSM.so*',
+    'libfontconfig.so*', 'libfreetype.so*', 'libexpat.so*', 'libz.so*',
+    'libasound.so*', 'libjack.so*', 'libjackserver.so*', 'libpulse*',
+    'libudev.so*', 'libusb-1.0.so*', 'libdbus-1.so*', 'libuuid.so*',
+]
+
+DEFAULT_DIRECTORIES = {
+    1: ['/lib', '/usr/lib'],
+    2: ['/lib64', '/usr/lib64', '/lib', '/usr/lib'],
+}
+
+REPORT_FILE = 'bundle-report.txt'
+# Runs of ld.so per program whose shortest time the report gives.
+LOAD_TIME_RUNS = 20
+
+
+class ElfError(Exception):
+    pass
+
+
+class Elf(object):
+    """The dynamic section of an ELF file: soname, needed (the DT_NEEDED in
+    order), rpath and runpath (lists of directories, None if absent)."""
+
+    def __init__(self, path, elfclass, machine, soname, needed, rpath,
+                 runpath):
+        self.path = path
+        self.elfclass = elfclass
+        self.machine = machine
+        self.soname = soname
+        self.needed = needed
+        self.rpath = rpath
+        self.runpath = runpath
+
+    def __repr__(self):
+        return 'Elf(%r, soname=%r, needed=%r, rpath=%r, runpath=%r)' % (
+            self.path, self.soname, self.needed, self.rpath, self.runpath)
+
+
+def parse(data, path=None):
+    """Returns the Elf for the contents data of an ELF file. Raises ElfError
+    if it is none, and for static executables and object files."""
+    try:
+        if data[:4] != '\x7fELF':
+            raise ElfError('not an ELF file')
+        elfclass, encoding = ord(data[4]), ord(data[5])
+        if elfclass not in (1, 2) or encoding not in (1, 2):
+            raise ElfError('unknown ELF class or encoding')
+        endian = '<' if encoding == 1 else '>'
+        if elfclass == 1:
+            machine, = struct.unpack_from(endian + 'H', data, 18)
+            phoff, = struct.unpack_from(endian + 'I', data, 28)
+            phentsize, phnum = struct.unpack_from(endian + 'HH', data, 42)
+            program_header = endian + 'IIIIIIII'
+            dynamic_entry = endian + 'iI'
+        else:
+            machine, = struct.unpack_from(endian + 'H', data, 18)
+            phoff, = struct.unpack_from(endian + 'Q', data, 32)
+            phentsize, phnum = struct.unpack_from(endian + 'HH', data, 54)
+            program_header = endian + 'IIQQQQQQ'
+            dynamic_entry = endian + 'qQ'
+
+        loads = []
+        dynamic = None
+        for index in xrange(phnum):
+            fields = struct.unpack_from(program_header, data,
+                                        phoff + index * phentsize)
+            if elfclass == 1:
+                p_type, p_offset, p_vaddr, _, p_filesz = fields[:5]
+            else:
+                p_type, _, p_offset, p_vaddr, _, p_filesz = fields[:6]
+            if p_type == PT_LOAD:
+                loads.append((p_vaddr, p_filesz, p_offset))
+            elif p_type == PT_DYNAMIC:
+                dynamic = (p_offset, p_filesz)
+        if dynamic is None:
+            raise ElfError('no dynamic section')
+
+        entries = []
+        entry_size = struct.calcsize(dynamic_entry)
+        for position in xrange(dynamic[0], dynamic[0] + dynamic[1],
+                               entry_size):
+            tag, value = struct.unpack_from(dynamic_entry, data, position)
+            if tag == DT_NULL:
+                break
+            entries.append((tag, value))
+
+        strtab = [value for tag, value in entries if tag == DT_STRTAB]
+        if not strtab:
+            raise ElfError('no string table')
+        for vaddr, size, offset in loads:
+            if vaddr <= strtab[0] < vaddr + size:
+                strtab = strtab[0] - vaddr + offset
+                break
+        else:
+            raise ElfError('string table is in no segment')
+
+        def string(value):
+            end = data.find('\0', strtab + value)
+            if end < 0:
+                raise ElfError('unterminated string')
+            return data[strtab + value:end]
+
+        def paths(tag):
+            values = [string(value) for t, value in entries if t == tag]
+            if not values:
+                return None
+            return [directory for value in values
+                    for directory in value.split(':') if directory]
+
+        sonames = [string(value) for tag, value in entries
+                   if tag == DT_SONAME]
+        needed = [string(value) for tag, value in entries
+                  if tag == DT_NEEDED]
+        return Elf(path, elfclass, machine, sonames[0] if sonames else None,
+                   needed, paths(DT_RPATH), paths(DT_RUNPATH))
+    except struct.error:
+        raise ElfError('%s: truncated ELF file' % path)
+    except ElfError, e:
+        raise ElfError('%s: %s' % (path, e))
+
+
+_cache = {}
+
+
+def load(path):
+    """Returns the Elf for the file at path."""
+    st = os.stat(path)
+    key = (st.st_mtime, st.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, 'rb') as f:
+        result = parse(f.read(), path)
+    _cache[path] = (key, result)
+    return result
+
+
+def ld_so_conf(path='/etc/ld.so.conf', seen=None):
+    """Returns the directories listed in path and the files it includes."""
+    seen = seen if seen is not None else set()
+    if path in seen:
+        return []
+    seen.add(path)
+    directories = []
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except IOError:
+        return []
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if line.startswith('include '):
+            pattern = line[len('include '):].strip()
+            if not os.path.isabs(pattern):
+                pattern = os.path.join(os.path.dirname(path), pattern)
+            for included in sorted(glob.glob(pattern)):
+                directories.extend(ld_so_conf(included, seen))
+        elif line and not line.startswith('hwcap '):
+            directories.append(line)
+    return directories
+
+
+def is_system_library(name):
+    return any(fnmatch.fnmatch(name, pattern)
+               for pattern in SYSTEM_LIBRARIES)
+
+
+class Resolver(object):
+    """Resolves the DT_NEEDED of an executable and its libraries.
+
+    library_path stands for LD_LIBRARY_PATH and system for the directories
+    of /etc/ld.so.conf and the default ones. Every object is read and every
+    name resolved once."""
+
+    def __init__(self, library_path=(), system=None):
+        self.library_path = list(library_path)
+        self.system = system if system is not None else ld_so_conf()
+        # (name, search path) -> (absolute path or None, probes)
+        self.resolved = {}
+
+    def _expand(self, directories, origin, elf):
+        result = []
+        for directory in directories or []:
+            directory = directory.replace('${ORIGIN}', origin)
+            directory = directory.replace('$ORIGIN', origin)
+            directory = directory.replace(
+                '$LIB', 'lib64' if elf.elfclass == 2 else 'lib')
+            result.append(directory)
+        return result
+
+    def search_path(self, elf, executable):
+        """Returns the directories ld.so searches for the DT_NEEDED of
+        elf, loaded by the program executable."""
+        origin = os.path.dirname(os.path.abspath(elf.path)) if elf.path else ''
+        directories = []
+        if elf.runpath is None:
+            directories += self._expand(elf.rpath, origin, elf)
+            if executable is not None and executable is not elf and \
+                    executable.runpath is None:
+                directories += self._expand(
+                    executable.rpath,
+                    os.path.dirname(os.path.abspath(executable.path)),
+                    executable)
+        directories += self.library_path
+        directories += self._expand(elf.runpath, origin, elf)
+        directories += self.system + DEFAULT_DIRECTORIES[elf.elfclass]
+        return directories
+
+    def resolve(self, name, elf, executable=None):
+        """Returns the absolute path that name, needed by elf, resolves to
+        (None if it is not found) and how many directories were probed."""
+        if '/' in name:
+            return os.path.abspath(name), 0
+        directories = tuple(self.search_path(elf, executable))
+        key = (name, elf.elfclass, elf.machine, directories)
+        if key not in self.resolved:
+            result = (None, len(directories))
+            for probes, directory in enumerate(directories):
+                path = os.path.join(directory, name)
+                if not os.path.isfile(path):
+                    continue
+                try:
+                    candidate = load(path)
+                except (ElfError, IOError, OSError):
+                    continue
+                # Skip libraries of other architectures, e.g. in lib32.
+                if (candidate.elfclass, candidate.machine) == \
+                        (elf.elfclass, elf.machine):
+                    result = (os.path.abspath(path), probes + 1)
+                    break
+            self.resolved[key] = result
+        return self.resolved[key]
+
+    def closure(self, roots, executable=None):
+        """Returns {name: absolute path or None} for every library that the
+        files roots need, directly or not, apart from the system ones."""
+        executable = load(executable) if executable else None
+        libraries = {}
+        seen = set()
+        pending = list(roots)
+        while pending:
+            path = pending.pop()
+            if path in seen:
+                continue
+            seen.add(path)
+            elf = load(path)
+            for name in elf.needed:
+                if is_system_library(name) or name in libraries:
+                    continue
+                resolved, _ = self.resolve(name, elf, executable)
+                libraries[name] = resolved
+                if resolved is not None:
+                    pending.append(resolved)
+        return libraries
+
+
+def _digest(path):
+    if path is None:
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_time(program, runs=LOAD_TIME_RUNS):
+    """Returns the shortest time in seconds ld.so took in runs runs to find
+    and map the libraries of program, or None if the program cannot run
+    here. Like ldd(1), it sets LD_TRACE_LOADED_OBJECTS so that ld.so exits
+    once the libraries are loaded, without running the program."""
+    env = dict(os.environ, LD_TRACE_LOADED_OBJECTS='1')
+    env.pop('LD_LIBRARY_PATH', None)
+    best = None
+    with open(os.devnull, 'w') as devnull:
+        for _ in xrange(runs):
+            start = time.time()
+            try:
+                if subprocess.call([program], env=env, stdout=devnull,
+                                   stderr=devnull, close_fds=True):
+                    return None
+            except OSError:
+                return None
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(bundle_dir, executable, plugins, libraries, resolver,
+           unbundled_executable=None):
+    """Returns the lines of a report that compares how resolver finds the
+    libraries of the bundle from it and from the system, and how long
+    ld.so takes to load the libraries of executable and of
+    unbundled_executable."""
+    lines = ['Directories ld.so probes for each bundled library:', '',
+             '%-40s %7s %7s  %s' % ('library', 'bundle', 'system',
+                                    'found on the system')]
+    bundled = 0
+    bundled_probes = 0
+    system_probes = 0
+    differing = 0
+    missing = 0
+    main = load(executable)
+    # Without the bundle the libraries would come from the system
+    # directories.
+    unbundled = Elf(None, main.elfclass, main.machine, None, [], None, None)
+    for name in sorted(libraries):
+        bundled_path, probes = resolver.resolve(name, main, main)
+        if not bundled_path or not bundled_path.startswith(bundle_dir):
+            continue
+        system_path, unbundled_probes = resolver.resolve(name, unbundled)
+        bundled += 1
+        bundled_probes += probes
+        system_probes += unbundled_probes
+        if system_path is None:
+            missing += 1
+            note = 'not installed'
+        elif _digest(system_path) != _digest(bundled_path):
+            differing += 1
+            note = '%s (differs)' % system_path
+        else:
+            note = system_path
+        lines.append('%-40s %7d %7d  %s' % (name, probes, unbundled_probes,
+                                            note))
+    for plugin in plugins:
+        plugin_elf = load(plugin)
+        unresolved = [name for name in plugin_elf.needed
+                      if not is_system_library(name) and
+                      resolver.resolve(name, plugin_elf, main)[0] is None]
+        if unresolved:
+            lines.append('%s does not find %s' % (
+                os.path.relpath(plugin, bundle_dir), ', '.join(unresolved)))
+    lines.append('')
+    lines.append('%d bundled libraries are found with %d directory probes, '
+                 'from the system it would take %d.' % (
+                     bundled, bundled_probes, system_probes))
+    lines.append('%d differ from the system versions and %d are not '
+                 'installed on this system.' % (differing, missing))
+    bundled_time = load_time(executable)
+    unbundled_time = load_time(unbundled_executable) \
+        if unbundled_executable else None
+    if bundled_time is None or unbundled_time is None:
+        lines.append('The load times were not measured: the programs do not '
+                     'run here.')
+    else:
+        lines.append('ld.so loads the libraries in %.1f ms from the bundle '
+                     'and in %.1f ms for %s (the shortest of %d runs).' % (
+                         bundled_time * 1000, unbundled_time * 1000,
+                         unbundled_executable, LOAD_TIME_RUNS))
+    return lines
+
+
+def _copy(source, target):
+    directory = os.path.dirname(target)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    shutil.copyfile(source, target)
+    os.chmod(target, os.stat(source).st_mode | stat.S_IWUSR)
+
+
+def _set_runpath(env, path, runpath):
+    import SCons.Errors
+    if subprocess.call([env['PATCHELF'], '--set-rpath', runpath, path],
+                       env=env['ENV']):
+        raise SCons.Errors.BuildError(
+            errstr='patchelf failed to set the runpath of %s' % path)
+
+
+def build_bundle(target, source, env):
+    """Fills BUNDLE_DIR with the program (the first source), the plugins in
+    BUNDLE_PLUGINS ({directory: plugins}) and the libraries they need."""
+    import SCons.Errors
+    if not env.get('PATCHELF'):
+        raise SCons.Errors.StopError('The bundle target needs patchelf.')
+    bundle_dir = env['BUNDLE_DIR']
+    program = source[0].abspath
+    plugins = [(directory, node.abspath) for directory, nodes in
+               sorted(env['BUNDLE_PLUGINS'].iteritems()) for node in nodes]
+    resolver = Resolver(library_path=env['BUNDLE_LIBRARY_PATH'])
+    libraries = resolver.closure([program] + [path for _, path in plugins],
+                                 program)
+    unresolved = sorted(name for name, path in libraries.iteritems()
+                        if path is None)
+    if unresolved:
+        raise SCons.Errors.StopError(
+            'Libraries not found for the bundle: %s' % ', '.join(unresolved))
+
+    lib_dir = os.path.join(bundle_dir, 'lib')
+    if os.path.isdir(lib_dir):
+        shutil.rmtree(lib_dir)
+    installed_program = os.path.join(bundle_dir, os.path.basename(program))
+    _copy(program, installed_program)
+    _set_runpath(env, installed_program, '$ORIGIN/lib')
+    for name, path in sorted(libraries.iteritems()):
+        bundled = os.path.join(lib_dir, name)
+        _copy(path, bundled)
+        _set_runpath(env, bundled, '$ORIGIN')
+    installed_plugins = []
+    for directory, path in plugins:
+        bundled = os.path.join(bundle_dir, directory, os.path.basename(path))
+        _copy(path, bundled)
+        _set_runpath(env, bundled, '$ORIGIN/%s' % os.path.relpath(
+            lib_dir, os.path.dirname(bundled)))
+        installed_plugins.append(bundled)
+
+    if env.get('BUNDLE_LAUNCHER'):
+        launcher = os.path.join(bundle_dir, env['BUNDLE_LAUNCHER'][0])
+        with open(launcher, 'w') as f:
+            f.write(env['BUNDLE_LAUNCHER'][1])
+        os.chmod(launcher, 0755)
+
+    # Look the libraries up again from the bundle, without the build's
+    # library path.
+    lines = report(bundle_dir, installed_program, installed_plugins,
+                   libraries, Resolver(), program)
+    with open(target[0].abspath, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print '\n'.join(lines[-3:])
+    return 0
+
+
+def build_bundle_string(target, source, env):
+    return 'Bundling %s with its libraries in %s' % (source[0],
+                                                     env['BUNDLE_DIR'])
+
+
+def Bundle(env, directory, program, plugins, library_path=(),
+           launcher=None):
+    """Bundles program and plugins ({directory in the bundle: plugins})
+    with the libraries they need into directory. library_path is searched
+    like LD_LIBRARY_PATH, before the system directories. launcher is an
+    optional (name, contents) of a script to write into the bundle."""
+    import SCons.Action
+    bundle_dir = env.Dir(directory)
+    sources = [program] + [node for nodes in plugins.values()
+                           for node in nodes]
+    result = env.Command(bundle_dir.File(REPORT_FILE), sources,
+                         SCons.Action.Action(build_bundle,
+                                             build_bundle_string),
+                         BUNDLE_DIR=bundle_dir.abspath,
+                         BUNDLE_PLUGINS=plugins,
+                         BUNDLE_LIBRARY_PATH=[env.Dir(path).abspath
+                                              for path in library_path],
+                         BUNDLE_LAUNCHER=launcher,
+                         PATCHELF=env.WhereIs('patchelf'))
+    # The libraries come from outside the build.
+    env.AlwaysBuild(result)
+    return result
+
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import multiprocessing
 import os
 import util
 from mixxx import Feature
 import SCons.Script as SCons
 import depends
+import pch
+import pgo
+import timing
 
 class OpenGLES(Feature):
 	def description(self):
@@ -651,6 +655,150 @@ class BuildTime(Feature):
             build.env.Append(CPPDEFINES='DISABLE_BUILDTIME')
 
 
+class PrecompiledHeaders(Feature):
+    def description(self):
+        return "Precompiled headers"
+
+    def enabled(self, build):
+        build.flags['pch'] = util.get_flags(build.env, 'pch', 0)
+        return bool(int(build.flags['pch']))
+
+    def add_options(self, build, vars):
+        vars.Add('pch', 'Set to 1 to precompile the headers most sources include.', 0)
+        vars.Add('pch_threshold',
+                 'Percentage of sources that must include a header for it to be precompiled.',
+                 pch.DEFAULT_THRESHOLD)
+        vars.Add('pch_timing',
+                 'Set to 1 to record compile times for "scons pch-report".', 0)
+
+    def configure(self, build, conf):
+        if not self.enabled(build):
+            return
+
+        if not build.toolchain_is_gnu and not build.toolchain_is_msvs:
+            raise Exception('Precompiled headers are only supported with the gnu and msvs toolchains.')
+
+    def post_sources(self, build, sources):
+        timer = pch.CompileTimer(build, 'pch' if self.enabled(build) else 'nopch')
+        build.env.AlwaysBuild(build.env.Alias(
+            'pch-report', [],
+            SCons.Action(lambda target, source, env: timer.report(), None)))
+        if int(util.get_flags(build.env, 'pch_timing', 0)):
+            timer.install(build.env)
+
+        if not self.enabled(build):
+            return sources
+        threshold = int(util.get_flags(build.env, 'pch_threshold',
+                                       pch.DEFAULT_THRESHOLD))
+        return sources + pch.precompile(build, sources, threshold)
+
+
+class FastLink(Feature):
+    # Linkers in order of preference and the flags that make them use all
+    # cores.
+    LINKERS = [('lld', ['-Wl,--threads=%d']),
+               ('gold', ['-Wl,--threads', '-Wl,--thread-count=%d'])]
+    TIMINGS_FILE = 'link_times'
+
+    # The linker configure() picked, if any.
+    linker = None
+
+    def description(self):
+        return "Fast linking"
+
+    def enabled(self, build):
+        build.flags['fastlink'] = util.get_flags(build.env, 'fastlink', 0)
+        return bool(int(build.flags['fastlink']))
+
+    def add_options(self, build, vars):
+        vars.Add('fastlink',
+                 'Set to 1 to link with lld or gold, split DWARF and a gdb index (gnu toolchain only).', 0)
+
+    def configure(self, build, conf):
+        if not self.enabled(build):
+            return
+
+        if not build.toolchain_is_gnu or \
+                not (build.platform_is_linux or build.platform_is_bsd):
+            self.status = "Disabled (needs the gnu toolchain on Linux or BSD)"
+            return
+
+        for linker, thread_flags in self.LINKERS:
+            if conf.CheckLinkFlags(['-fuse-ld=%s' % linker]):
+                break
+        else:
+            self.status = "Disabled (neither lld nor gold was found)"
+            return
+        self.linker = linker
+        build.env.Append(LINKFLAGS='-fuse-ld=%s' % linker)
+        features = [linker]
+
+        # Leave the debug info in .dwo files next to the objects instead of
+        # copying it through the linker, and let the linker write the index
+        # gdb would otherwise build on every start.
+        if conf.CheckCXXFlags(['-gsplit-dwarf']) and \
+                conf.CheckLinkFlags(['-Wl,--gdb-index']):
+            build.env.Append(CCFLAGS='-gsplit-dwarf')
+            build.env.Append(LINKFLAGS='-Wl,--gdb-index')
+            features.append('split DWARF')
+
+        thread_flags = [flag % multiprocessing.cpu_count() if '%d' in flag
+                        else flag for flag in thread_flags]
+        if conf.CheckLinkFlags(thread_flags):
+            build.env.Append(LINKFLAGS=thread_flags)
+            features.append('%d threads' % multiprocessing.cpu_count())
+        self.status = ', '.join(features)
+
+    def _is_link(self, env):
+        linker = os.path.basename(env.subst('$LINK').split()[0])
+        return lambda args, target: \
+            os.path.basename(args[0]) == linker and not timing.is_compile(args)
+
+    def _emit_dwo(self, env):
+        """Makes the .dwo files part of the targets of the objects, so they
+        are cleaned and stored in the object cache with them."""
+        def make_emitter(emitter):
+            def emit_dwo(target, source, env):
+                target, source = emitter(target, source, env)
+                dwo = os.path.splitext(str(target[0]))[0] + '.dwo'
+                return target + [dwo], source
+            return emit_dwo
+        for name in ('StaticObject', 'SharedObject'):
+            builder = env['BUILDERS'][name]
+            if not isinstance(builder.emitter, dict):
+                continue
+            for suffix, emitter in builder.emitter.items():
+                if callable(emitter):
+                    builder.add_emitter(suffix, make_emitter(emitter))
+
+    def post_sources(self, build, sources):
+        if not build.toolchain_is_gnu:
+            return sources
+        if '-gsplit-dwarf' in build.env['CCFLAGS']:
+            self._emit_dwo(build.env)
+
+        # Time all links, so the summary can compare with the default linker.
+        mode = self.linker or 'default'
+        timer = timing.CommandTimer(
+            os.path.join(build.get_cache_dir(), self.TIMINGS_FILE), mode,
+            self._is_link(build.env))
+        timer.install(build.env)
+        timings = timer.load()
+        times = timings.get(mode, {})
+        if not self.enabled(build) or not times:
+            return sources
+        default_times = timings.get('default', {})
+        links = []
+        for target in sorted(times):
+            link = '%s %.1fs' % (os.path.basename(target), times[target])
+            if self.linker and target in default_times:
+                link += ' (%.1fs with the default linker)' % \
+                    default_times[target]
+            links.append(link)
+        self.status += '; last links: ' + ', '.join(links)
+        return sources
+
+
 class QDebug(Feature):
     def description(self):
         return "Debugging message output"
@@ -696,6 +844,7 @@ class Verbose(Feature):
             build.env['RANLIBCOMSTR'] = '[RANLIB] $TARGET'
             build.env['LDMODULECOMSTR'] = '[LD] $TARGET'
             build.env['LINKCOMSTR'] = '[LD] $TARGET'
+            build.env['PCHCOMSTR'] = '[PCH] $SOURCE'
 
             build.env['QT4_LUPDATECOMSTR'] = '[LUPDATE] $SOURCE'
             build.env['QT4_LRELEASECOMSTR'] = '[LRELEASE] $SOURCE'
@@ -703,12 +852,14 @@ class Verbose(Feature):
             build.env['QT4_UICCOMSTR'] = '[UIC4] $SOURCE'
             build.env['QT4_MOCFROMHCOMSTR'] = '[MOC] $SOURCE'
             build.env['QT4_MOCFROMCXXCOMSTR'] = '[MOC] $SOURCE'
+            build.env['QT4_MOCSCOMSTR'] = '[MOCS] $TARGET'
 
             build.env['QT5_LUPDATECOMSTR'] = '[LUPDATE] $SOURCE'
             build.env['QT5_LRELEASECOMSTR'] = '[LRELEASE] $SOURCE'
             build.env['QT5_QRCCOMSTR'] = '[QRC] $SOURCE'
             build.env['QT5_UICCOMSTR'] = '[UIC5] $SOURCE'
             build.env['QT5_MOCCOMSTR'] = '[MOC] $SOURCE'
+            build.env['QT5_MOCSCOMSTR'] = '[MOCS] $TARGET'
 
 
 class Profiling(Feature):
@@ -738,6 +889,47 @@ class Profiling(Feature):
             build.env.Append(LINKFLAGS='-lSaturn')
 
 
+class CoreLibrary(Feature):
+    def description(self):
+        return "Shared Mixxx core library"
+
+    def enabled(self, build):
+        # mixxx and mixxx-test always link against libmixxx-core. Making it
+        # a shared library saves linking and storing the core twice, so a
+        # change to the core relinks one library and two small programs.
+        # But every object is then compiled with -fPIC, calls into the core
+        # go through the PLT, ld.so resolves its symbols at every start and
+        # mixxx no longer runs without the library next to it or installed.
+        # So releases keep the static core and only test builds, which link
+        # both programs, default to the shared one. We only support it on
+        # Linux and BSD.
+        default = 0
+        if (build.platform_is_linux or build.platform_is_bsd) and \
+                int(util.get_flags(build.env, 'test', 0)):
+            default = 1
+        build.flags['shared_core'] = util.get_flags(build.env, 'shared_core',
+                                                    default)
+        return bool(int(build.flags['shared_core']))
+
+    def add_options(self, build, vars):
+        vars.Add('shared_core',
+                 'Set to 1 to build libmixxx-core as a shared library (Linux and BSD only), which links faster but makes mixxx need the library at runtime. Defaults to 1 for test builds.',
+                 None)
+
+    def configure(self, build, conf):
+        if not self.enabled(build):
+            return
+
+        if not build.platform_is_linux and not build.platform_is_bsd:
+            raise Exception('A shared core library is only supported on Linux and BSD.')
+
+        # Some sources are built with StaticObject in cloned environments.
+        # Build everything position independent so they can go into the
+        # shared library, too.
+        build.env.Append(CCFLAGS='-fPIC')
+        build.env['STATIC_AND_SHARED_OBJECTS_ARE_THE_SAME'] = 1
+
+
 class TestSuite(Feature):
     def description(self):
         return "Mixxx Test Suite"
@@ -970,6 +1162,7 @@ class Optimize(Feature):
     LEVEL_PORTABLE = 'portable'
     LEVEL_NATIVE = 'native'
     LEVEL_LEGACY = 'legacy'
+    LEVEL_PGO = 'pgo'
 
     LEVEL_DEFAULT = LEVEL_PORTABLE
 
@@ -1001,9 +1194,10 @@ class Optimize(Feature):
             optimize_level = Optimize.LEVEL_OFF
 
         if optimize_level not in (Optimize.LEVEL_OFF, Optimize.LEVEL_PORTABLE,
-                                  Optimize.LEVEL_NATIVE, Optimize.LEVEL_LEGACY):
+                                  Optimize.LEVEL_NATIVE, Optimize.LEVEL_LEGACY,
+                                  Optimize.LEVEL_PGO):
             raise Exception("optimize={} is not supported. "
-                            "Use portable, native, legacy or off"
+                            "Use portable, native, legacy, pgo or off"
                             .format(optimize_level))
         return optimize_level
 
@@ -1017,8 +1211,12 @@ class Optimize(Feature):
                         '  portable: sse2 CPU (>= Pentium 4)\n' \
                         '  native: optimized for the CPU of this system\n' \
                         '  legacy: pure i386 code' \
+                        '  pgo: portable, optimized with a profile of the engine tests and benchmarks' \
                         '  off: no optimization' \
                         , Optimize.LEVEL_DEFAULT)
+        vars.Add('pgo_drift',
+                 'Percentage of sources that may change before optimize=pgo needs a new profile.',
+                 pgo.DEFAULT_DRIFT)
 
     def configure(self, build, conf):
         if not self.enabled(build):
@@ -1030,6 +1228,9 @@ class Optimize(Feature):
             self.status = "off: no optimization"
             return
 
+        if optimize_level == Optimize.LEVEL_PGO and not build.toolchain_is_gnu:
+            raise Exception("optimize=pgo is only supported with the gnu toolchain.")
+
         if build.toolchain_is_msvs:
             # /GL : http://msdn.microsoft.com/en-us/library/0zza0de8.aspx
             # !!! /GL is incompatible with /ZI, which is set by mscvdebug
@@ -1102,8 +1303,10 @@ class Optimize(Feature):
             if not int(build.flags['profiling']):
                 build.env.Append(CCFLAGS='-fomit-frame-pointer')
 
-            if optimize_level == Optimize.LEVEL_PORTABLE:
+            if optimize_level in (Optimize.LEVEL_PORTABLE, Optimize.LEVEL_PGO):
                 # portable: sse2 CPU (>= Pentium 4)
+                # pgo: the same, stage specific flags are added in
+                # post_sources.
                 if build.architecture_is_x86:
                     self.status = "portable: sse2 CPU (>= Pentium 4)"
                     build.env.Append(CCFLAGS='-mtune=generic')
@@ -1165,6 +1368,39 @@ class Optimize(Feature):
             # -O3 -fomit-frame-pointer -mtune=native -malign-double
             # -fstrict-aliasing -fno-schedule-insns -ffast-math
 
+    def post_sources(self, build, sources):
+        # Whether a profile can be used depends on the sources, which the
+        # configure cache does not track, so this is decided on every run.
+        if build.flags.get('optimize') != Optimize.LEVEL_PGO:
+            return sources
+        store = pgo.ProfileStore(build)
+        store.set_sources(sources)
+        stage = store.stage()
+        ccflags, linkflags = store.flags(stage)
+        build.env.Append(CCFLAGS=ccflags, LINKFLAGS=linkflags)
+
+        if stage == pgo.STAGE_USE:
+            # Retraining rewrites the manifest, which rebuilds the objects
+            # and keeps the object cache from mixing up profiles.
+            util.depend_on(build.env, build.env.File(store.manifest_path),
+                           pgo.SOURCE_SUFFIXES)
+            self.status = "pgo: using the profile in %s (%.0f%% drift)" % (
+                store.profile_dir, store.drift)
+            train = lambda target, source, env: store.report_current()
+            test_program = []
+        else:
+            self.status = "pgo: instrumented, run 'scons optimize=pgo " \
+                "test=1 pgo-train' to train"
+            train = lambda target, source, env: store.train(
+                source[0].abspath)
+            test_program = build.env.File('mixxx-test')
+            if not int(build.flags.get('test', 0)):
+                train = lambda target, source, env: store.report_no_tests()
+                test_program = []
+        build.env.AlwaysBuild(build.env.Alias(
+            'pgo-train', test_program, SCons.Action(train, None)))
+        return sources
+
 
 class AutoDjCrates(Feature):
     def description(self):
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Memory-aware scheduling of the commands SCons runs.
+
+With -j$(nproc) the links of mixxx, mixxx-test and the plugins and the
+heaviest translation units can run at once and exhaust the memory. The
+JobScheduler:
+
+- picks the job count if none is given with -j, from the number of CPUs and
+  the memory that is available,
+- gives every command a weight: the peak RSS it had when its target was last
+  built, or otherwise the typical peak RSS of its kind (compile, link, lto or
+  tool),
+- only starts a command while the weights of the running commands fit into
+  the available memory (a command always starts if nothing else runs), and
+- runs at most link_jobs links (and fewer LTO links) at the same time.
+
+The peak RSS of every command is measured with wait4() (see
+timing.measured_spawn) and kept in cache/job_memory for the next runs.
+"""
+
+import atexit
+import cPickle as pickle
+import ctypes
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+
+from SCons import Script
+
+import timing
+
+MEMORY_FILE = 'job_memory'
+# Part of the available memory the running commands may use.
+MEMORY_BUDGET = 0.85
+# Peak RSS in kB of the kinds of commands, until they are measured.
+DEFAULT_WEIGHTS = {
+    'compile': 600 * 1024,
+    'link': 2 * 1024 * 1024,
+    'lto': 6 * 1024 * 1024,
+    'tool': 100 * 1024,
+}
+# Percentile of the measured peaks that stands for a kind.
+KIND_PERCENTILE = 0.9
+
+LINKERS = ('gcc', 'g++', 'cc', 'c++', 'clang', 'clang++', 'ld', 'link',
+           'lld', 'ld.gold', 'ld.lld')
+
+
+def available_memory():
+    """Returns the available memory in kB, or None if it is unknown."""
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1])
+        except (IOError, ValueError):
+            return None
+    elif sys.platform == 'darwin':
+        try:
+            total = subprocess.Popen(['sysctl', '-n', 'hw.memsize'],
+                                     stdout=subprocess.PIPE).communicate()[0]
+            # There is no cheap measure of available memory; assume half.
+            return int(total) / 1024 / 2
+        except (OSError, ValueError):
+            return None
+    elif sys.platform == 'win32':
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong),
+                        ('dwMemoryLoad', ctypes.c_ulong),
+                        ('ullTotalPhys', ctypes.c_ulonglong),
+                        ('ullAvailPhys', ctypes.c_ulonglong),
+                        ('ullTotalPageFile', ctypes.c_ulonglong),
+                        ('ullAvailPageFile', ctypes.c_ulonglong),
+                        ('ullTotalVirtual', ctypes.c_ulonglong),
+                        ('ullAvailVirtual', ctypes.c_ulonglong),
+                        ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys / 1024
+    return None
+
+
+def classify(args):
+    """Returns the kind of the command line args."""
+    if timing.is_compile(args):
+        return 'compile'
+    program = os.path.basename(args[0]).lower() if args else ''
+    if program.endswith('.exe'):
+        program = program[:-len('.exe')]
+    # Cross toolchains prefix the names, e.g. i686-w64-mingw32-g++.
+    if program.rsplit('-', 1)[-1] in LINKERS or program in LINKERS:
+        if any(arg.startswith('-flto') or arg.upper().startswith('/LTCG')
+               for arg in args):
+            return 'lto'
+        return 'link'
+    return 'tool'
+
+
+def user_gave_jobs():
+    """Returns whether -j was given on the command line or in SCONSFLAGS.
+    The job count install() picks otherwise is only meant for SCons' own
+    commands."""
+    arguments = sys.argv[1:] + os.environ.get('SCONSFLAGS', '').split()
+    return any(argument.startswith(('-j', '--jobs')) for argument in
+               arguments)
+
+
+class JobScheduler(object):
+
+    def __init__(self, build):
+        self.path = os.path.join(build.get_cache_dir(), MEMORY_FILE)
+        # target -> (kind, peak RSS in kB)
+        self.peaks = self._load()
+        self.measured = {}
+        self.weights = self._kind_weights()
+        memory = available_memory()
+        self.budget = int(memory * MEMORY_BUDGET) if memory else None
+        self.used = 0
+        self.running = 0
+        self.condition = threading.Condition()
+
+        link_jobs = int(Script.ARGUMENTS.get('link_jobs', 0))
+        if not link_jobs:
+            link_jobs = self._fitting(self.weights['link'])
+        lto_jobs = min(link_jobs, self._fitting(self.weights['lto']))
+        self.link_slots = threading.BoundedSemaphore(link_jobs)
+        self.lto_slots = threading.BoundedSemaphore(lto_jobs)
+        self.link_jobs, self.lto_jobs = link_jobs, lto_jobs
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+            return {}
+
+    def save(self):
+        if not self.measured:
+            return
+        peaks = self._load()
+        peaks.update(self.measured)
+        try:
+            with open(self.path + '.tmp', 'wb') as f:
+                pickle.dump(peaks, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(self.path + '.tmp', self.path)
+        except (IOError, OSError):
+            return
+        self.measured = {}
+
+    def _kind_weights(self):
+        weights = dict(DEFAULT_WEIGHTS)
+        by_kind = {}
+        for kind, peak in self.peaks.itervalues():
+            by_kind.setdefault(kind, []).append(peak)
+        for kind, peaks in by_kind.iteritems():
+            peaks.sort()
+            weights[kind] = peaks[min(int(len(peaks) * KIND_PERCENTILE),
+                                      len(peaks) - 1)]
+        return weights
+
+    def _fitting(self, weight):
+        """Returns how many commands of weight fit into the budget."""
+        if self.budget is None:
+            return multiprocessing.cpu_count()
+        return max(self.budget / max(weight, 1), 1)
+
+    def default_jobs(self):
+        """Returns the job count to use if none was given with -j."""
+        return max(min(multiprocessing.cpu_count(),
+                       self._fitting(self.weights['compile'])), 1)
+
+    def _acquire(self, weight):
+        with self.condition:
+            while self.running and self.budget is not None and \
+                    self.used + weight > self.budget:
+                self.condition.wait()
+            self.used += weight
+            self.running += 1
+
+    def _release(self, weight):
+        with self.condition:
+            self.used -= weight
+            self.running -= 1
+            self.condition.notify_all()
+
+    def install(self, env):
+        """Sets the default job count and wraps SPAWN of env."""
+        if not user_gave_jobs():
+            jobs = self.default_jobs()
+            Script.SetOption('num_jobs', jobs)
+            print "Using -j%d (%d CPUs, %s available memory)" % (
+                jobs, multiprocessing.cpu_count(),
+                '%d MB' % (self.budget / MEMORY_BUDGET / 1024)
+                if self.budget else 'unknown')
+
+        spawn = timing.measured_spawn(env['SPAWN'])
+        scheduler = self
+
+        def scheduled_spawn(sh, escape, cmd, args, spawn_env):
+            kind = classify(args)
+            target = timing.command_target(args)
+            weight = scheduler.peaks.get(target, (kind, None))[1] or \
+                scheduler.weights[kind]
+            slots = {'link': scheduler.link_slots,
+                     'lto': scheduler.lto_slots}.get(kind)
+            if slots is not None:
+                slots.acquire()
+            scheduler._acquire(weight)
+            try:
+                result = spawn(sh, escape, cmd, args, spawn_env)
+            finally:
+                scheduler._release(weight)
+                if slots is not None:
+                    slots.release()
+            peak = getattr(timing.usage, 'peak_rss', 0)
+            if result == 0 and target and peak:
+                scheduler.measured[target] = (kind, peak)
+            return result
+        scheduled_spawn.measured = getattr(spawn, 'measured', False)
+        env['SPAWN'] = scheduled_spawn
+        atexit.register(self.save)
@@ -12,6 +12,9 @@ import shutil
 import SCons
 from SCons import Script
 
+import buildtrace
+import jobs
+import objcache
 import util
 
 
@@ -209,6 +212,24 @@ class MixxxBuild(object):
         self.compiler_is_gcc = 'gcc' in self.env['CC']
         self.compiler_is_clang = 'clang' in self.env['CC']
 
+        util.set_git_cache_dir(self.get_cache_dir())
+
+        # Before anything runs, so the configure checks are scheduled and
+        # traced too.
+        if int(Script.ARGUMENTS.get('jobsched', 1)):
+            jobs.JobScheduler(self).install(self.env)
+        if int(Script.ARGUMENTS.get('buildtrace', 0)):
+            buildtrace.BuildTrace(self).install(self.env)
+
+        self.object_cache = objcache.ObjectCache(self)
+        self.object_cache.setup(self.env)
+
+        # Compile the moc output of the headers in units of this many files
+        # (see _Automoc in qt4.py/qt5.py).
+        mocs_batch = int(Script.ARGUMENTS.get('mocs_batch', 0))
+        self.env['QT4_MOCSBATCH'] = mocs_batch
+        self.env['QT5_MOCSBATCH'] = mocs_batch
+
         self.virtualize_build_dir()
 
         if self.toolchain_is_gnu:
@@ -417,7 +438,33 @@ class MixxxBuild(object):
         vars = Script.Variables(cachefile)
         vars.Add('prefix', 'Set to your install prefix', '/usr/local')
         vars.Add('virtualize',
-                 'Dynamically swap out the build directory when switching Git branches.', 1)
+                 'Dynamically swap out the build directory when switching Git branches. Defaults to 0 if objcache is set.', 1)
+        vars.Add('unity',
+                 'Compile sources in batches of about this many files per directory. 0 disables unity builds.', 0)
+        vars.Add('mocs_batch',
+                 'Compile the moc output of about this many headers per mocs_compilation unit. 0 compiles each one on its own.', 0)
+        vars.Add('qrc_shards',
+                 'Split the Qt resources into this many shards that are compiled in parallel.', 1)
+        vars.Add('qrc_binary',
+                 'Set to 1 to build the Qt resources into binary .rcc bundles next to the executable instead of compiling them in.', 0)
+        vars.Add('dll_closure',
+                 'Set to 0 to install every DLL of the winlib on Windows instead of only the ones the programs and plugins import.', 1)
+        vars.Add('install_link',
+                 'How "scons install" puts the resources on Linux: reflink (clone if the file system can, else copy), hardlink (clone, else hard link, else copy) or copy.', 'reflink')
+        vars.Add('jobsched',
+                 'Set to 0 to not pick the job count from the CPUs and memory and not hold back commands while memory is short.', 1)
+        vars.Add('link_jobs',
+                 'Maximum number of links running at the same time. Defaults to as many as fit into the available memory.', 0)
+        vars.Add('buildtrace',
+                 'Set to 1 to write a Chrome trace of the build to cache/buildtrace.json and print the slowest steps.', 0)
+        vars.Add('objcache',
+                 'Set to 1 or to a directory to share built objects between branches and build types. See "scons cache-stats".', 0)
+        vars.Add('objcache_size',
+                 'Size limit of the object cache in megabytes.', objcache.DEFAULT_CACHE_SIZE_MB)
+        vars.Add('configcache',
+                 'Set to 0 to re-run all configure checks instead of replaying cached results.', 1)
+        vars.Add('configure_jobs',
+                 'Number of configure checks to run in parallel. Defaults to the value given with -j.', 0)
         vars.Add('qtdir', 'Set to your QT4 directory', '/usr/share/qt4')
         vars.Add('qt_sqlite_plugin', 'Set to 1 to package the Qt SQLite plugin.'
                  '\n           Set to 0 if SQLite support is compiled into QtSQL.', 0)
@@ -454,7 +501,10 @@ class MixxxBuild(object):
         # seem to work fine but eventually cause strange build issues (not
         # re-building a necessary object file, etc.) and cause instability.
         # See also: asantoni's warning in get_cache_dir. rryan 6/2013
-        should_virtualize = int(Script.ARGUMENTS.get('virtualize', 1))
+        # With the object cache, switching branches is cheap without moving
+        # build directories around, so only virtualize if asked to.
+        should_virtualize = int(Script.ARGUMENTS.get(
+            'virtualize', 0 if self.object_cache.enabled else 1))
         if not should_virtualize:
             return
 
@@ -638,3 +688,8 @@ class Feature(Dependence):
 
     def add_options(self, build, vars):
         pass
+
+    def post_sources(self, build, sources):
+        """Called for every feature, enabled or not, once the sources of all
+        active dependencies are known. Returns the sources to build."""
+        return sources
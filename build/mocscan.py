@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Cached source scanning for the automoc emitters of the qt4 and qt5 tools.
+
+Automoc needs to know two things about every C++ source and its header:
+whether it contains a Q_OBJECT macro and which files it #includes with
+quotes (to find out whether moc output is included directly). Reading and
+scanning hundreds of files for that on every SCons run is slow (see
+qobjectscan for the scan itself), so the results are kept in
+cache/automoc_scan, keyed by the content signature SCons keeps for every
+source anyway. Files that are not cached yet are scanned by a pool of worker
+processes.
+"""
+
+import atexit
+import cPickle as pickle
+import multiprocessing
+import os
+
+from SCons import Script
+
+import qobjectscan
+
+CACHE_FILE = 'automoc_scan'
+# Bump when the scan results change.
+CACHE_VERSION = 2
+
+# Below this number of files to scan the pool costs more than it saves.
+POOL_THRESHOLD = 32
+
+HEADER_EXTENSIONS = ('.h', '.hxx', '.hpp', '.hh', '.H')
+
+
+def _wants_includes(path):
+    # Automoc only looks for Q_OBJECT in headers.
+    return not path.endswith(HEADER_EXTENSIONS)
+
+
+def _scan_path(path):
+    try:
+        return qobjectscan.scan_file(path, _wants_includes(path))
+    except (IOError, OSError):
+        return None
+
+
+def _node_path(node):
+    """Returns the path of the file get_contents() of node reads."""
+    for candidate in (node.rfile(), node.srcnode().rfile()):
+        if os.path.isfile(candidate.abspath):
+            return candidate.abspath
+    return None
+
+
+class ScanCache(object):
+
+    def __init__(self, path):
+        self.path = path
+        # path -> (content signature, scan result)
+        self.entries = self._load()
+        self.dirty = False
+        self.jobs = Script.GetOption('num_jobs') or 1
+        atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                version, entries = pickle.load(f)
+            if version == CACHE_VERSION:
+                return entries
+        except (IOError, EOFError, pickle.UnpicklingError, ValueError,
+                TypeError):
+            pass
+        return {}
+
+    def save(self):
+        if not self.dirty:
+            return
+        entries = dict((key, value) for key, value in self.entries.iteritems()
+                       if os.path.exists(key))
+        try:
+            with open(self.path + '.tmp', 'wb') as f:
+                pickle.dump((CACHE_VERSION, entries), f,
+                            pickle.HIGHEST_PROTOCOL)
+            os.rename(self.path + '.tmp', self.path)
+        except (IOError, OSError):
+            return
+        self.dirty = False
+
+    def _lookup(self, node):
+        """Returns (path, signature, cached result or None)."""
+        key = _node_path(node)
+        if key is None:
+            return None, None, None
+        signature = node.get_csig()
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == signature:
+            return key, signature, entry[1]
+        return key, signature, None
+
+    def prefetch(self, nodes):
+        """Scans the nodes that are not cached yet, in parallel if there
+        are enough of them."""
+        misses = []
+        for node in nodes:
+            if node.has_builder():
+                continue
+            key, signature, result = self._lookup(node)
+            if key is not None and result is None:
+                misses.append((key, signature))
+        if len(misses) < POOL_THRESHOLD or self.jobs < 2 or \
+                not hasattr(os, 'fork'):
+            return
+        pool = multiprocessing.Pool(self.jobs)
+        try:
+            results = pool.map(_scan_path, [key for key, _ in misses])
+        finally:
+            pool.close()
+            pool.join()
+        for (key, signature), result in zip(misses, results):
+            if result is not None:
+                self.entries[key] = (signature, result)
+                self.dirty = True
+
+    def scan(self, node):
+        """Returns the scan result for node (see qobjectscan.scan_buffer).
+        Raises IOError if node cannot be read."""
+        if node.has_builder():
+            # Generated sources may not exist yet and must not get their
+            # signature computed before they are built.
+            return qobjectscan.scan_buffer(node.get_contents(),
+                                           _wants_includes(node.name))
+        key, signature, result = self._lookup(node)
+        if key is None:
+            raise IOError("Cannot read '%s'" % node)
+        if result is None:
+            result = _scan_path(key)
+            if result is None:
+                raise IOError("Cannot read '%s'" % node)
+            self.entries[key] = (signature, result)
+            self.dirty = True
+        return result
+
+
+_caches = {}
+
+
+def get_cache(env):
+    """Returns the ScanCache stored in the cache directory of env."""
+    cache_dir = env.get('CACHEDIR') or Script.Dir('#cache').abspath
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    path = os.path.join(cache_dir, CACHE_FILE)
+    if path not in _caches:
+        _caches[path] = ScanCache(path)
+    return _caches[path]
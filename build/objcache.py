@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed object cache shared by all branches and build types.
+
+Enable it with objcache=1 (stored in cache/objcache) or objcache=<path>.
+This uses SCons' CacheDir: every target is stored under its build
+signature, which only depends on the contents of its sources and on the
+command that builds it. Switching to a branch or build type we never built
+before therefore only compiles the files that differ from anything we built
+earlier.
+
+On top of CacheDir we keep hit/miss statistics (see "scons cache-stats") and
+limit the size of the cache to objcache_size megabytes, evicting the least
+recently used files at exit. The statistics need a SCons whose CacheDir
+takes a custom class (3.1.2 or later); older ones only get the size limit.
+The size of the cache after the last eviction is kept with the statistics,
+so the cache directory is only walked when the files stored since then may
+have taken it over the limit.
+"""
+
+import atexit
+import cPickle as pickle
+import os
+import threading
+
+import SCons.CacheDir
+from SCons import Script
+
+DEFAULT_CACHE_NAME = 'objcache'
+DEFAULT_CACHE_SIZE_MB = 5000
+STATS_FILE = 'stats'
+STAT_KEYS = ['hits', 'misses', 'bytes_saved', 'pushes', 'bytes_pushed',
+             'evictions', 'bytes_evicted']
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return '%.1f %s' % (size, unit)
+        size /= 1024.0
+
+
+class _StatsCacheDir(SCons.CacheDir.CacheDir):
+    """A CacheDir that counts hits and misses and marks the files it
+    retrieves as recently used. SCons creates it from the path alone, so
+    ObjectCache.setup() subclasses it with the stats to count into."""
+
+    stats = None
+    lock = threading.Lock()
+
+    def _count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+    def retrieve(self, node):
+        retrieved = SCons.CacheDir.CacheDir.retrieve(self, node)
+        if not self.is_enabled():
+            return retrieved
+        if retrieved:
+            self._count('hits')
+            try:
+                self._count('bytes_saved', os.path.getsize(node.abspath))
+                # The eviction below is based on mtime.
+                os.utime(self.cachepath(node)[1], None)
+            except OSError:
+                pass
+        else:
+            self._count('misses')
+        return retrieved
+
+    def push(self, node):
+        result = SCons.CacheDir.CacheDir.push(self, node)
+        if self.is_enabled():
+            self._count('pushes')
+            try:
+                self._count('bytes_pushed', os.path.getsize(node.abspath))
+            except OSError:
+                pass
+        return result
+
+
+class ObjectCache(object):
+
+    def __init__(self, build):
+        self.build = build
+        self.path = None
+        self.size_limit = int(Script.ARGUMENTS.get(
+            'objcache_size', DEFAULT_CACHE_SIZE_MB)) * 1024 * 1024
+        self.stats = dict((key, 0) for key in STAT_KEYS)
+        # Whether this SCons lets us count what is stored in the cache.
+        self.counting = False
+
+        path = Script.ARGUMENTS.get('objcache', '0')
+        if path == '1':
+            path = os.path.join(build.get_cache_dir(), DEFAULT_CACHE_NAME)
+        elif path == '0':
+            path = None
+        if path is not None:
+            self.path = os.path.abspath(path)
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def setup(self, env):
+        """Makes env use the cache and registers the cache-stats alias."""
+        report = Script.Action(lambda target, source, env: self.report(),
+                               None)
+        env.AlwaysBuild(env.Alias('cache-stats', [], report))
+        if not self.enabled:
+            return
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        cache_class = type('ObjectCacheDir', (_StatsCacheDir,),
+                           {'stats': self.stats})
+        try:
+            env.CacheDir(self.path, cache_class)
+            self.counting = True
+        except TypeError:
+            # SCons before 3.1.2 has no custom_class argument.
+            env.CacheDir(self.path)
+        atexit.register(self.finish)
+
+    def _stats_path(self):
+        return os.path.join(self.path, STATS_FILE)
+
+    def load_stats(self):
+        try:
+            with open(self._stats_path(), 'rb') as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+            return dict((key, 0) for key in STAT_KEYS)
+
+    def total_stats(self):
+        """Returns the statistics of all earlier runs plus this one."""
+        stats = self.load_stats()
+        for key in STAT_KEYS:
+            stats[key] = stats.get(key, 0) + self.stats[key]
+        return stats
+
+    def _cached_files(self):
+        files = []
+        for root, dirs, names in os.walk(self.path):
+            for name in names:
+                if root == self.path:
+                    # Our own files and the CacheDir config live at the top.
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def evict(self):
+        """Removes the least recently used files until the cache fits into
+        its size limit and returns the size of the cache."""
+        files = self._cached_files()
+        total = sum(size for mtime, size, path in files)
+        files.sort()
+        for mtime, size, path in files:
+            if total <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.stats['evictions'] += 1
+            self.stats['bytes_evicted'] += size
+        return total
+
+    def finish(self):
+        size = self.load_stats().get('size')
+        if self.counting and size is not None and \
+                size + self.stats['bytes_pushed'] <= self.size_limit:
+            # Nothing can be evicted yet.
+            size += self.stats['bytes_pushed']
+        else:
+            size = self.evict()
+        stats = self.total_stats()
+        stats['size'] = size
+        temp_path = self._stats_path() + '.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump(stats, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_path, self._stats_path())
+        except (IOError, OSError):
+            return
+        for key in STAT_KEYS:
+            self.stats[key] = 0
+
+    def report(self):
+        if not self.enabled:
+            print "Object cache is disabled. Enable it with objcache=1."
+            return
+        stats = self.total_stats()
+        files = self._cached_files()
+        lookups = stats['hits'] + stats['misses']
+        print "Object cache: %s" % self.path
+        print "  size:        %s of %s in %d files" % (
+            _format_bytes(sum(size for mtime, size, path in files)),
+            _format_bytes(self.size_limit), len(files))
+        print "  lookups:     %d (%d hits, %d misses)" % (
+            lookups, stats['hits'], stats['misses'])
+        print "  hit rate:    %.1f%%" % (
+            100.0 * stats['hits'] / lookups if lookups else 0.0)
+        print "  bytes saved: %s" % _format_bytes(stats['bytes_saved'])
+        print "  stored:      %d files (%s)" % (
+            stats['pushes'], _format_bytes(stats['bytes_pushed']))
+        print "  evicted:     %d files (%s)" % (
+            stats['evictions'], _format_bytes(stats['bytes_evicted']))
@@ -23,6 +23,9 @@ import SCons
 from SCons.Builder import Builder
 from SCons.Script import *
 import otool
+import macho
+import installnames
+import util
 
 #Dev info:
 #http://doc.trolltech.com/qq/qq09-mac-deployment.html
@@ -216,20 +219,23 @@ def build_app(target, source, env):
 
     #todo: precache all this shit, in case we have to change the install names of a lot of libraries
 
+    #all the install name changes and strips are planned first and then run with one install_name_tool per binary, see installnames.py
+    plan = installnames.RewritePlan()
+
     def automagic_references(embedded): #XXX bad name
-        "modify a binary file to patch up all it's references"
+        "plan to patch up all the references of a binary file"
 
         for ref in otool.dependencies(embedded):
             if ref in locals:
                 embd = locals[ref][1] #the path that this reference is getting embedded at
-                otool.change_ref(str(embedded), ref, relative(embd))
+                plan.change_ref(str(embedded), ref, relative(embd))
 
 
     def patch_lib(embedded):
-        otool.change_id(embedded, relative(embedded)) #change the name the library knows itself as
+        plan.change_id(embedded, relative(embedded)) #change the name the library knows itself as
         automagic_references(embedded)
         if strip: #XXX stripping seems to only work on libs compiled a certain way, todo: try out ALL the options, see if can adapt it to work on every sort of lib
-            system("strip -S '%s' 2>/dev/null" % embedded), #(the stripping fails with ""symbols referenced by relocation entries that can't be stripped"" for some obscure Apple-only reason sometimes, related to their hacks to gcc---it depends on how the file was compiled; since we don't /really/ care about this we just let it silently fail)
+            plan.strip(embedded, ['-S']) #(the stripping fails with ""symbols referenced by relocation entries that can't be stripped"" for some obscure Apple-only reason sometimes, related to their hacks to gcc---it depends on how the file was compiled; since we don't /really/ care about this the plan lets it silently fail)
 
 
 
@@ -245,8 +251,9 @@ def build_app(target, source, env):
     #precache the list of names of libs we are using so we can figure out if a lib is local or not (and therefore a ref to it needs to be updated) #XXX it seems kind of wrong to only look at the basename (even if, by the nature of libraries, that must be enough) but there is no easy way to compute the abspath
     locals = {} # [ref] => (absolute_path, embedded_path) (ref is the original reference from looking at otool -L; we use this to decide if two libs are the same)
 
-    #XXX it would be handy if embed_dependencies returned the otool list for each ref it reads..
-    for ref, path in otool.embed_dependencies(str(binary), LOCAL=otool_local_paths, SYSTEM=otool_system_paths):
+    #the graph remembers every lib it has read and resolved, so the plugins below only read the libs the binary does not use
+    graph = macho.DependencyGraph(otool_local_paths, otool_system_paths)
+    for ref, path in otool.embed_dependencies(str(binary), graph=graph):
         locals[ref] = (path, embed_lib(path))
 
     plugins_l = [] #XXX bad name #list of tuples (source, embed) of plugins to stick under the plugins/ dir
@@ -262,7 +269,7 @@ def build_app(target, source, env):
     print "Scanning plugins for new dependencies:"
     for p, ep in plugins_l:
         print "Scanning plugin", p
-        for ref, path in otool.embed_dependencies(p, LOCAL=otool_local_paths, SYSTEM=otool_system_paths):
+        for ref, path in otool.embed_dependencies(p, graph=graph):
             if ref not in locals:
                 locals[ref] = path, embed_lib(path)
             else:
@@ -277,9 +284,9 @@ def build_app(target, source, env):
     for ref in otool.dependencies(str(installed_bin)):
         if ref in locals:
             embedded = locals[ref][1]
-            otool.change_ref(str(installed_bin), ref, relative(embedded)) #change the reference to the library in the program binary
+            plan.change_ref(str(installed_bin), ref, relative(embedded)) #change the reference to the library in the program binary
     if strip:
-        system("strip '%s'" % installed_bin)
+        plan.strip(str(installed_bin))
 
 
     print "Installing embedded libs:"
@@ -305,6 +312,13 @@ def build_app(target, source, env):
         Execute(Copy(embedded_p, real_p)) #:/
         patch_lib(str(embedded_p))
 
+    print "Changing install names:"
+    try:
+        installnames.run(plan, util.workers(len(plan.order)))
+    finally:
+        for path in plan.order:
+            macho.forget(path)
+
 
 def emit_app(target, source, env):
     """The first source is the binary program file, the rest are files/folders to include in the App's Resources directory.
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Batched install name rewrites for OSConsX.build_app.
+
+A RewritePlan collects the new -id, the -change rewrites and the strip(1)
+of every binary of a bundle. run() then runs one install_name_tool(1) per
+binary with all its arguments, followed by its strip, with the binaries on
+a pool of worker threads. Rewriting a reference at a time runs
+install_name_tool once per reference, and each run rewrites the whole
+file.
+
+run() takes the function that runs a command as runner, so that
+build/tests/test_installnames.py can see which commands a plan runs.
+"""
+
+import multiprocessing.pool
+import subprocess
+import time
+
+INSTALL_NAME_TOOL = 'install_name_tool'
+
+
+class RewritePlan(object):
+
+    def __init__(self):
+        # path -> [id, [(old, new)], strip arguments or None]
+        self.binaries = {}
+        self.order = []
+
+    def _entry(self, binary):
+        if binary not in self.binaries:
+            self.binaries[binary] = [None, [], None]
+            self.order.append(binary)
+        return self.binaries[binary]
+
+    def change_id(self, binary, id):
+        self._entry(binary)[0] = id
+
+    def change_ref(self, binary, orig, new):
+        changes = self._entry(binary)[1]
+        if (orig, new) not in changes:
+            changes.append((orig, new))
+
+    def strip(self, binary, flags=()):
+        """Strips binary with flags after its install names are changed.
+        Stripping may fail without failing the plan: strip -S fails on
+        some libraries depending on how they were compiled."""
+        self._entry(binary)[2] = list(flags)
+
+    def commands(self, binary):
+        """Returns [(args, must succeed)] to run for binary."""
+        id, changes, strip = self.binaries[binary]
+        commands = []
+        args = [INSTALL_NAME_TOOL]
+        if id is not None:
+            args += ['-id', id]
+        for orig, new in changes:
+            args += ['-change', orig, new]
+        if len(args) > 1:
+            commands.append((args + [binary], True))
+        if strip is not None:
+            commands.append((['strip'] + strip + [binary], False))
+        return commands
+
+    def unbatched_count(self, binary):
+        """Returns how many commands a rewrite per reference would run."""
+        id, changes, strip = self.binaries[binary]
+        return (id is not None) + len(changes) + (strip is not None)
+
+
+def run(plan, jobs, runner=subprocess.call):
+    """Runs the commands of plan on jobs threads. Raises an Exception if an
+    install_name_tool fails, since it would leave a bundle that does not
+    load its libraries."""
+    binaries = list(plan.order)
+    if not binaries:
+        return
+
+    def rewrite(binary):
+        results = []
+        for args, required in plan.commands(binary):
+            result = runner(args)
+            results.append((args, result if required else 0))
+        return results
+
+    start = time.time()
+    pool = multiprocessing.pool.ThreadPool(max(min(jobs, len(binaries)), 1))
+    try:
+        results = pool.map(rewrite, binaries)
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = time.time() - start
+
+    batched = 0
+    unbatched = 0
+    for binary, commands in zip(binaries, results):
+        for args, result in commands:
+            if result != 0:
+                raise Exception('%s failed: %s' % (args[0], ' '.join(args)))
+            batched += 1
+        unbatched += plan.unbatched_count(binary)
+    print "Rewrote install names of %d binaries in %.1fs with %d commands " \
+        "instead of %d" % (len(binaries), elapsed, batched, unbatched)
+
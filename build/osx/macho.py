@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Reads the install names of Mach-O binaries without otool(1).
+
+load() reads LC_ID_DYLIB, the LC_*_DYLIB references and LC_RPATH from the
+load commands of a Mach-O file or of every architecture of a fat (universal)
+binary, from a memory map of the file. The results are memoized by path and
+invalidated by mtime and size.
+
+DependencyGraph resolves the references of a binary transitively, like
+dyld(1) would find them, and remembers every library it has seen, so that
+walking the app binary and then all plugins reads every library once.
+
+Since no Apple tools are needed this also works on Linux, where
+build/tests/test_macho.py checks it against the fixture binaries.
+"""
+
+import mmap
+import os
+import struct
+
+MH_MAGIC = 0xfeedface
+MH_MAGIC_64 = 0xfeedfacf
+FAT_MAGIC = 0xcafebabe
+FAT_MAGIC_64 = 0xcafebabf
+
+LC_REQ_DYLD = 0x80000000
+LC_LOAD_DYLIB = 0xc
+LC_ID_DYLIB = 0xd
+LC_LOAD_WEAK_DYLIB = 0x18 | LC_REQ_DYLD
+LC_RPATH = 0x1c | LC_REQ_DYLD
+LC_REEXPORT_DYLIB = 0x1f | LC_REQ_DYLD
+LC_LAZY_LOAD_DYLIB = 0x20
+LC_LOAD_UPWARD_DYLIB = 0x23 | LC_REQ_DYLD
+
+LOAD_COMMANDS = (LC_LOAD_DYLIB, LC_LOAD_WEAK_DYLIB, LC_REEXPORT_DYLIB,
+                 LC_LAZY_LOAD_DYLIB, LC_LOAD_UPWARD_DYLIB)
+
+
+class MachOError(Exception):
+    pass
+
+
+class MachO(object):
+    """The install names of a Mach-O binary: id (None for programs and
+    plugins), dylibs (the referenced libraries, in load order) and
+    rpaths."""
+
+    def __init__(self, path, id, dylibs, rpaths):
+        self.path = path
+        self.id = id
+        self.dylibs = dylibs
+        self.rpaths = rpaths
+
+    def __repr__(self):
+        return 'MachO(%r, id=%r, dylibs=%r, rpaths=%r)' % (
+            self.path, self.id, self.dylibs, self.rpaths)
+
+
+def _string(data, offset, end):
+    terminator = data.find('\0', offset, end)
+    return data[offset:terminator if terminator >= 0 else end]
+
+
+def _parse_thin(data, offset, size, result):
+    """Adds the install names of the Mach-O at offset in data to result."""
+    if size < 28:
+        raise MachOError('truncated Mach-O header')
+    for endian in ('<', '>'):
+        magic, = struct.unpack_from(endian + 'I', data, offset)
+        if magic in (MH_MAGIC, MH_MAGIC_64):
+            break
+    else:
+        raise MachOError('not a Mach-O file')
+    ncmds, sizeofcmds = struct.unpack_from(endian + 'II', data, offset + 16)
+    position = offset + (32 if magic == MH_MAGIC_64 else 28)
+    end = min(position + sizeofcmds, offset + size)
+    id, dylibs, rpaths = result
+    for _ in xrange(ncmds):
+        if position + 8 > end:
+            raise MachOError('truncated load commands')
+        cmd, cmdsize = struct.unpack_from(endian + 'II', data, position)
+        if cmdsize < 8 or position + cmdsize > end:
+            raise MachOError('bad load command size')
+        if cmd == LC_ID_DYLIB or cmd in LOAD_COMMANDS or cmd == LC_RPATH:
+            name_offset, = struct.unpack_from(endian + 'I', data,
+                                              position + 8)
+            name = _string(data, position + name_offset, position + cmdsize)
+            if cmd == LC_ID_DYLIB:
+                if not id:
+                    id.append(name)
+            elif cmd == LC_RPATH:
+                if name not in rpaths:
+                    rpaths.append(name)
+            elif name not in dylibs:
+                dylibs.append(name)
+        position += cmdsize
+
+
+def parse(data, path=None):
+    """Returns the MachO for the contents data (a string or mmap). Raises
+    MachOError if it is not a Mach-O or fat binary."""
+    if len(data) < 8:
+        raise MachOError('%s: not a Mach-O file' % path)
+    result = ([], [], [])
+    magic, = struct.unpack_from('>I', data, 0)
+    try:
+        if magic in (FAT_MAGIC, FAT_MAGIC_64):
+            count, = struct.unpack_from('>I', data, 4)
+            entry = 20 if magic == FAT_MAGIC else 32
+            for index in xrange(count):
+                if magic == FAT_MAGIC:
+                    offset, size = struct.unpack_from(
+                        '>II', data, 8 + index * entry + 8)
+                else:
+                    offset, size = struct.unpack_from(
+                        '>QQ', data, 8 + index * entry + 8)
+                _parse_thin(data, offset, min(size, len(data) - offset),
+                            result)
+        else:
+            _parse_thin(data, 0, len(data), result)
+    except struct.error:
+        raise MachOError('%s: truncated Mach-O file' % path)
+    except MachOError, e:
+        raise MachOError('%s: %s' % (path, e))
+    id, dylibs, rpaths = result
+    return MachO(path, id[0] if id else None, dylibs, rpaths)
+
+
+_cache = {}
+
+
+def load(path):
+    """Returns the MachO for the file at path. Raises MachOError if it is
+    not a Mach-O or fat binary (e.g. an .a archive)."""
+    st = os.stat(path)
+    key = (st.st_mtime, st.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, 'rb') as f:
+        if st.st_size == 0:
+            raise MachOError('%s: empty file' % path)
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            result = parse(data, path)
+        finally:
+            data.close()
+    _cache[path] = (key, result)
+    return result
+
+
+def forget(path):
+    """Drops the memoized MachO of path, e.g. after install_name_tool(1)
+    changed it within the resolution of its mtime."""
+    _cache.pop(path, None)
+
+
+class DependencyGraph(object):
+    """Finds the libraries binaries depend on that have to be bundled.
+
+    References are searched as absolute paths or in local and system (lists
+    of directories, see otool.embed_dependencies); libraries below the
+    system directories are not bundled and not followed."""
+
+    def __init__(self, local, system):
+        self.local = list(local)
+        self.system = list(system)
+        # reference -> absolute path
+        self.resolved = {}
+        # absolute path -> [(reference, absolute path)] it depends on
+        self.edges = {}
+
+    def is_system(self, path):
+        return any(path.startswith(directory) for directory in self.system)
+
+    def resolve(self, reference):
+        """Returns the absolute path of the library reference names."""
+        if reference in self.resolved:
+            return self.resolved[reference]
+        if reference.startswith('@'):
+            raise MachOError(
+                "Unable to resolve install name '%s'. Relative paths are "
+                "for already-bundled binaries." % reference)
+        if reference.startswith('/'):
+            path = reference
+        else:
+            # An unqualified name asks dyld(1) to search for the library.
+            for directory in [''] + self.local + self.system:
+                path = os.path.abspath(os.path.join(directory, reference))
+                if os.path.exists(path):
+                    break
+        if not os.path.exists(path):
+            raise MachOError("Dependent library '%s' not found. Make sure "
+                             "it is installed." % reference)
+        self.resolved[reference] = path
+        return path
+
+    def dependencies(self, path):
+        """Returns [(reference, absolute path)] for the libraries path
+        references directly, except itself."""
+        if path not in self.edges:
+            binary = load(path)
+            self.edges[path] = [(reference, self.resolve(reference))
+                                for reference in binary.dylibs
+                                if reference != binary.id]
+        return self.edges[path]
+
+    def closure(self, path):
+        """Returns the sorted [(reference, absolute path)] of all libraries
+        that path depends on, directly or not, and that are to be
+        bundled."""
+        result = {}
+        seen = set([path])
+        pending = [path]
+        while pending:
+            for reference, dependency in self.dependencies(pending.pop()):
+                if self.is_system(dependency):
+                    continue
+                result.setdefault(dependency, reference)
+                if dependency not in seen:
+                    seen.add(dependency)
+                    pending.append(dependency)
+        return sorted((reference, dependency) for dependency, reference
+                      in result.iteritems())
+
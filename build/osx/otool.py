@@ -35,6 +35,8 @@ import os
 
 import sys,os
 
+import macho
+
 
 
 def system(s):
@@ -67,42 +69,19 @@ LIBPATH = LOCAL_LIBPATH + SYSTEM_LIBPATH
 
 # otool parsing
 def otool(binary):
-	"return in a list of strings the OS X 'install names' of Mach-O binaries (dylibs and programs)"
+	"return in a list of strings the OS X 'install names' of Mach-O binaries (dylibs and programs), like `otool -L`: the -id first, if there is one"
 	"Do not run this on object code archive (.a) files, it is not designed for that."
-	#if not os.path.exists(binary): raise Exception("'%s' not found." % binary)
+	"The load commands are read by macho.load() from the file itself, so this needs no Apple tools and reads every binary once (until it changes)."
 	if not type(binary) == str: raise ValueError("otool() requires a path (as a string)")
-	print "otool(%s)" % binary
-	stdin, stdout, stderr = os.popen3('otool -L "%s"' % binary)
-	try:
-		header = stdout.readline() #discard the first line since it is just the name of the file or an error message (or if reading .as, the first item on the list)
-		if not binary+":\n" == header:
-			#as far as I know otool -L only parses .dylibs and .a (but if it does anything else we should cover that case here)
-			if header.startswith("Archive : "):
-				raise Exception("'%s' an archive (.a) file." % binary)
-			else:
-				raise Exception(stderr.readline().strip())
-		def parse(l):
-			return l[1:l.rfind("(")-1]
-		return [parse(l[:-1]) for l in stdout] #[:-1] is for stripping the trailing \n
-	finally:
-		stdin.close()
-		stdout.close()
-		stderr.close()
+	m = macho.load(binary)
+	return ([m.id] if m.id else []) + m.dylibs
 
 
 def dependencies(binary):
-	l = otool(binary)
-
-	#sometimes otool -L outputs the -id field, as the first row, which is not what we are trying to ask for here. Strip it out.
-	#XXX this is NOT strictly correct; IF there is a library with the exact same filename as this library
-	#AND we depend on it AND it happens to be the first in the loadlist, then this will break mysteriously
-	#there might be a combination of flags to otool that avoids this, or something, but bah
-	#it seems that dylibs have -id's, and program binaries do not. but I don't want to rely on that since I haven't an Apple doc proclaiming it, and anyway to tell the two apart requires other otool trickery that I just don't trust.
-	#This will work in probably every library that exists in reality, so it's "ok"
-	if os.path.basename(l[0]) == os.path.basename(binary):
-		id = l.pop(0)
-		#print "Removing -id field result %s from %s" % (id, binary)
-	return l
+	"the install names of the libraries binary loads, without its own -id"
+	#Mach-O binaries may depend on themselves; the -id is in a load command of its own, so unlike with otool -L there is no need to guess which line it is.
+	m = macho.load(binary)
+	return [e for e in m.dylibs if e != m.id]
 
 
 
@@ -122,10 +101,11 @@ def embed_dependencies(binary,
                               "/sw/local/lib"],
                        SYSTEM=["/System/Library/Frameworks",
                                "/Network/Library/Frameworks",
-                               "/usr/lib"]):
+                               "/usr/lib"],
+                       graph=None):
 
 	#Todo: split out the detection of frameworks vs regular dylibs -- return them as separate lists
-	"recursively locates all the dependent libs of a binary using `otool -L`"
+	"recursively locates all the dependent libs of a binary using macho.DependencyGraph"
 	"all output will be absolute paths"
 	"binary is a file path"
 	"this will crash if it cannot examine a referenced dylib, just as the app you are trying to find dependencies for will crash"
@@ -135,54 +115,28 @@ def embed_dependencies(binary,
 	"Note: sometimes Mach-O binaries depend on themselves. Deal with it."
 	#"ignore_missing means whether to ignore if we can't load a binary for examination (e.g. if you have references to plugins) XXX is the list"
 	#binary = os.path.abspath(binary)
-	todo = dependencies(binary)
-	done = []
-	orig = []
-	#aaah this code is so bad. it can be factored but i can't can't can't so TODO: REFACTOR
-
-	while todo: #this was written with recursion before, but because of the possibility of loops in the network of libs recursion would require passing a collector variable around in the recursion and when you get to that point you might as well just use a loop
-		e = todo.pop() #because of how this is written, popping from the end is a depth-first search. Popping from the front would be a breadth-first search. Neat!
-		#Figure out the absolute path to the library
-		#todo: this would make sense as a separate function, but the @ case would be awkward to handle and it's iffy about what it should
-		if e.startswith('/'):
-			p = e
-		elif e.startswith('@'): #it's a relative load path
-			raise Exception("Unable to make heads nor tails, sah, of install name '%s'. Relative paths are for already-bundled binaries, this function does not support them." % e)
-		else:
-			#experiments show that giving an unspecified path is asking dyld(1) to find the library for us. This covers that case.
-			#i will not do further experiments to figure out what dyld(1)'s specific search algorithm is (whether it looks at frameworks separate from dylibs) because that's not the public interface
-
-			for P in ['']+LOCAL+SYSTEM: #XXX should local have priority over system or vice versa? (also, '' is the handle the relative case)
-				p = os.path.abspath(os.path.join(P, e))
-				#print "SEARCHING IN LIBPATH; TRYING", p
-				if os.path.exists(p):
-					break
-			else:
-				p = e #fallthrough to the exception below #XXX icky bad logic, there must be a way to avoid saying exists() twice
-
-		if not os.path.exists(p):
-			raise Exception("Dependent library '%s' not found. Make sure it is installed." % e)
-
-		#sometimes the todo list will have redundant items placed on it; in the case that the items are named the same that could be avoided by relying on set() semantics
-		#however there are many equivalent ways to name files in Unix, so we have to check here after getting abspath
-		#proof that this makes the algorithm terminate: we record the absolute path to the file; even if there are multiple abspaths to one file (as can happen with symlinks sometimes) each differnt path means a different symlink file, of which there are only a finite number (since it's a finite disk)
-		if p not in done and not any(p.startswith(P) for P in SYSTEM):
-			done.append(p)
-			orig.append(e)
-			todo.extend(dependencies(p))
-
-	assert all(e.startswith("/") for e in done), "embed_dependencies() is broken, some path in this list is not absolute: %s" % (done,)
-	return sorted(zip(orig, done))
+	#pass a macho.DependencyGraph as graph to share what has been read and resolved between several binaries, e.g. an app and its plugins
+	if graph is None:
+		graph = macho.DependencyGraph(LOCAL, SYSTEM)
+	done = graph.closure(binary)
+	assert all(p.startswith("/") for e, p in done), "embed_dependencies() is broken, some path in this list is not absolute: %s" % (done,)
+	return done
 
 
 
 def change_id(binary, id):
 	"there is no way to "
-	return system("install_name_tool -id '%s' '%s'" % (id,  binary))
+	try:
+		return system("install_name_tool -id '%s' '%s'" % (id,  binary))
+	finally:
+		macho.forget(binary)
 
 def change_ref(binary, orig, new):
-	assert orig in dependencies(binary), "change_ref: '%s' not in otool -L '%s', the change will fail." % (orig, binary) #since install_name_tool(1) always fails silently, there's *no* way to tell if it worked or not; try to catch the one bad case we know of manually (and expensively)
-	return system("install_name_tool -change '%s' '%s' '%s'" % (orig, new, binary))
+	assert orig in dependencies(binary), "change_ref: '%s' not in otool -L '%s', the change will fail." % (orig, binary) #since install_name_tool(1) always fails silently, there's *no* way to tell if it worked or not; try to catch the one bad case we know of manually (cheaply, from the parsed load commands)
+	try:
+		return system("install_name_tool -change '%s' '%s' '%s'" % (orig, new, binary))
+	finally:
+		macho.forget(binary)
 
 #but what are we *really* doing here? The overall goal?
 #I'm looking for
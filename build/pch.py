@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""Precompiled header support for the PrecompiledHeaders feature.
+
+The prefix header is derived from the sources themselves: every header that
+at least pch_threshold percent of the C++ sources include unconditionally
+goes into mixxx_pch.h in the build directory. The header is only rewritten
+when that list changes, and the precompiled header is rebuilt by SCons when
+the prefix header, any header it includes or the compiler flags change.
+
+gnu: mixxx_pch.h.gch is built next to mixxx_pch.h and all C++ sources are
+compiled with -include mixxx_pch.h, which makes GCC and Clang pick up the
+.gch. msvs: mixxx_pch.pch is built from a stub with /Yc using SCons' PCH
+builder and used with /Yu and /FI.
+
+With pch_timing=1 the compile time of every object is recorded (separately
+for builds with and without precompiled headers) and "scons pch-report"
+compares them.
+"""
+
+import os
+import re
+
+import SCons.Action
+import SCons.Scanner.C
+import SCons.Util
+from SCons import Script
+
+import timing
+import util
+
+PCH_HEADER = 'mixxx_pch.h'
+PCH_STUB = 'mixxx_pch.cpp'
+DEFAULT_THRESHOLD = 15
+TIMINGS_FILE = 'compile_times'
+
+CXX_SUFFIXES = ['.cpp', '.cxx', '.cc']
+
+_include = re.compile(r'^\s*#\s*include\s*([<"])([^">]+)[">]')
+_conditional_start = re.compile(r'^\s*#\s*if')
+_conditional_end = re.compile(r'^\s*#\s*endif')
+
+
+def scan_includes(path):
+    """Returns the (is_system, name) includes of path that are not inside a
+    preprocessor conditional."""
+    includes = []
+    depth = 0
+    with open(path) as f:
+        for line in f:
+            if _conditional_start.match(line):
+                depth += 1
+            elif _conditional_end.match(line):
+                depth -= 1
+            elif depth == 0:
+                match = _include.match(line)
+                if match:
+                    includes.append((match.group(1) == '<', match.group(2)))
+    return includes
+
+
+def derive_prefix_headers(build, sources, threshold):
+    """Returns the headers that at least threshold percent of the C++
+    sources include, system headers first, most frequent first."""
+    src_dir = Script.Dir('#src').srcnode().abspath
+    counts = {}
+    scanned = 0
+    for source in sources:
+        if not isinstance(source, basestring) or source.startswith('#') or \
+                os.path.splitext(source)[1] not in CXX_SUFFIXES:
+            continue
+        try:
+            includes = scan_includes(build.env.File(source).srcnode().abspath)
+        except IOError:
+            continue
+        scanned += 1
+        for include in set(includes):
+            counts[include] = counts.get(include, 0) + 1
+
+    headers = []
+    for (system, name), count in counts.iteritems():
+        if count * 100 < threshold * scanned:
+            continue
+        # Project headers have to be found from the build directory, which
+        # rules out relative includes and generated headers like build.h.
+        if not system and not os.path.isfile(os.path.join(src_dir, name)):
+            continue
+        if os.path.splitext(name)[1] in CXX_SUFFIXES or \
+                name.endswith('.moc'):
+            continue
+        headers.append((system, name))
+    headers.sort(key=lambda (system, name): (not system,
+                                             -counts[(system, name)], name))
+    return headers
+
+
+def _prefix_header_contents(headers):
+    lines = ['// Generated from the includes most sources share. Do not edit.',
+             '#ifndef MIXXX_PCH_H',
+             '#define MIXXX_PCH_H',
+             '#ifdef __cplusplus']
+    for system, name in headers:
+        lines.append('#include %s' % ('<%s>' if system else '"%s"') % name)
+    lines.extend(['#endif', '#endif', ''])
+    return '\n'.join(lines)
+
+
+def _precompile_gnu(env, header):
+    # Compile the header with the flags of the sources, but without the
+    # -include of itself.
+    gch = env.Command(
+        env.File(PCH_HEADER + '.gch'), header,
+        SCons.Action.Action(
+            '$CXX -o $TARGET -x c++-header -c $CXXFLAGS $CCFLAGS '
+            '$_CCCOMCOM $SOURCE', '$PCHCOMSTR'),
+        source_scanner=SCons.Scanner.C.CScanner(),
+        CXXFLAGS=SCons.Util.CLVar(env['CXXFLAGS']))
+    env.Append(CXXFLAGS=['-include', header.abspath, '-Winvalid-pch'])
+    util.depend_on(env, gch, CXX_SUFFIXES)
+    return []
+
+
+def _precompile_msvs(env, header):
+    stub = env.File(PCH_STUB)
+    util.write_if_changed(stub.abspath, '#include "%s"\n' % header.abspath)
+    pch, obj = env.PCH(stub)
+    # The msvc tool adds /Yu and /Fp and makes all objects depend on PCH.
+    env['PCH'] = pch
+    env['PCHSTOP'] = header.abspath
+    env.Append(CXXFLAGS=['/FI%s' % header.abspath])
+    # A C++ precompiled header cannot be used for C sources.
+    env['CCCOM'] = env['CCCOM'].replace(
+        '$_CCCOMCOM', '$CPPFLAGS $_CPPDEFFLAGS $_CPPINCFLAGS $CCPDBFLAGS')
+    # The object of the stub holds the debug info of the precompiled header
+    # and has to be linked.
+    return [obj]
+
+
+def precompile(build, sources, threshold):
+    """Sets up the precompiled prefix header for sources. Returns the
+    additional sources to link."""
+    env = build.env
+    headers = derive_prefix_headers(build, sources, threshold)
+    if not headers:
+        print "Precompiled headers: no header is shared by %d%% of the sources" \
+            % threshold
+        return []
+    header = env.File(PCH_HEADER)
+    util.write_if_changed(header.abspath, _prefix_header_contents(headers))
+    print "Precompiled headers: %s" % ', '.join(name for system, name
+                                                in headers)
+    if build.toolchain_is_msvs:
+        return _precompile_msvs(env, header)
+    return _precompile_gnu(env, header)
+
+
+class CompileTimer(timing.CommandTimer):
+    """Records how long compiling each object takes."""
+
+    def __init__(self, build, mode):
+        suffixes = (build.env.subst('$OBJSUFFIX'),
+                    build.env.subst('$SHOBJSUFFIX'))
+        timing.CommandTimer.__init__(
+            self, os.path.join(build.get_cache_dir(), TIMINGS_FILE), mode,
+            lambda args, target: target.endswith(suffixes))
+
+    def report(self):
+        timings = self.load()
+        without = timings.get('nopch', {})
+        with_pch = timings.get('pch', {})
+        targets = sorted(set(without) & set(with_pch))
+        if not targets:
+            print "No objects were timed both with and without precompiled " \
+                "headers yet. Build once with pch=0 pch_timing=1 and once " \
+                "with pch=1 pch_timing=1."
+            return
+        print "%-60s %9s %9s %9s" % ('Object', 'no PCH', 'PCH', 'saved')
+        for target in targets:
+            print "%-60s %8.2fs %8.2fs %8.2fs" % (
+                target[-60:], without[target], with_pch[target],
+                without[target] - with_pch[target])
+        total_without = sum(without[target] for target in targets)
+        total_with = sum(with_pch[target] for target in targets)
+        print "%d objects: %.1fs without, %.1fs with precompiled headers, " \
+            "%.2fs (%.0f%%) saved per file on average" % (
+                len(targets), total_without, total_with,
+                (total_without - total_with) / len(targets),
+                100.0 * (total_without - total_with) / total_without
+                if total_without else 0.0)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""Finds the DLLs a Windows build of Mixxx needs.
+
+parse() reads the names of the DLLs a PE/COFF executable or DLL imports,
+from its import directory and its delay-load import directory. ImportCache
+keeps them in cache/pe_imports by the SHA-1 of the file, which is only
+recomputed when the mtime or size of the file changes.
+
+closure() walks the imports of the programs and plugins transitively and
+resolves them in a list of directories, like the winlib and $QTDIR. Names
+that are in none of them are taken to be part of Windows (KERNEL32.dll,
+msvcrt.dll and so on).
+
+InstallDllClosure copies the closure next to mixxx.exe instead of every DLL
+of the winlib. Since only the file formats are involved this runs on Linux,
+so it works when cross-compiling with mingw too. build/tests/test_peimports.py
+checks it against the fixture executables.
+"""
+
+import cPickle as pickle
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+
+CACHE_FILE = 'pe_imports'
+
+IMAGE_DIRECTORY_ENTRY_IMPORT = 1
+IMAGE_DIRECTORY_ENTRY_DELAY_IMPORT = 13
+PE32 = 0x10b
+PE32_PLUS = 0x20b
+
+
+class PEError(Exception):
+    pass
+
+
+def _string(data, offset):
+    end = data.find('\0', offset)
+    if end < 0:
+        raise PEError('unterminated name')
+    return data[offset:end]
+
+
+def parse(data, path=None):
+    """Returns the names of the DLLs the PE file with the contents data (a
+    string or mmap) imports, in the order of its import directories."""
+    try:
+        if data[:2] != 'MZ':
+            raise PEError('not a PE file')
+        header, = struct.unpack_from('<I', data, 0x3c)
+        if data[header:header + 4] != 'PE\0\0':
+            raise PEError('not a PE file')
+        sections, optional_size = struct.unpack_from('<2xH12xH', data,
+                                                     header + 4)
+        optional = header + 24
+        magic, = struct.unpack_from('<H', data, optional)
+        if magic == PE32:
+            image_base, = struct.unpack_from('<I', data, optional + 28)
+            directories = optional + 96
+        elif magic == PE32_PLUS:
+            image_base, = struct.unpack_from('<Q', data, optional + 24)
+            directories = optional + 112
+        else:
+            raise PEError('unknown optional header 0x%x' % magic)
+        count, = struct.unpack_from('<I', data, directories - 4)
+
+        table = []
+        for index in xrange(sections):
+            size, address, raw_size, raw_offset = struct.unpack_from(
+                '<8xIIII', data, optional + optional_size + index * 40)
+            table.append((address, max(size, raw_size), raw_offset))
+
+        def offset(rva):
+            for address, size, raw_offset in table:
+                if address <= rva < address + size:
+                    return rva - address + raw_offset
+            raise PEError('address 0x%x is in no section' % rva)
+
+        def directory(entry):
+            if entry >= count:
+                return None
+            rva, size = struct.unpack_from('<II', data,
+                                           directories + 8 * entry)
+            return offset(rva) if rva and size else None
+
+        names = []
+        position = directory(IMAGE_DIRECTORY_ENTRY_IMPORT)
+        while position is not None:
+            # IMAGE_IMPORT_DESCRIPTOR; a zeroed one ends the directory.
+            name, first_thunk = struct.unpack_from('<12xII', data, position)
+            if not name and not first_thunk:
+                break
+            names.append(_string(data, offset(name)))
+            position += 20
+        position = directory(IMAGE_DIRECTORY_ENTRY_DELAY_IMPORT)
+        while position is not None:
+            attributes, name = struct.unpack_from('<II', data, position)
+            if not name:
+                break
+            # Old linkers stored addresses instead of RVAs.
+            if not attributes & 1:
+                name -= image_base
+            names.append(_string(data, offset(name)))
+            position += 32
+    except struct.error:
+        raise PEError('%s: truncated PE file' % path)
+    except PEError, e:
+        raise PEError('%s: %s' % (path, e))
+    result = []
+    for name in names:
+        if name.lower() not in [seen.lower() for seen in result]:
+            result.append(name)
+    return result
+
+
+class ImportCache(object):
+    """The imports of files by their SHA-1, kept in the file path."""
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        try:
+            with open(path, 'rb') as f:
+                # path -> (mtime, size, sha1), sha1 -> imports
+                self.hashes, self.imports = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+            self.hashes, self.imports = {}, {}
+
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            with open(self.path + '.tmp', 'wb') as f:
+                pickle.dump((self.hashes, self.imports), f,
+                            pickle.HIGHEST_PROTOCOL)
+            os.rename(self.path + '.tmp', self.path)
+        except (IOError, OSError):
+            pass
+
+    def get(self, path):
+        """Returns the imports of the file at path."""
+        st = os.stat(path)
+        key = (st.st_mtime, st.st_size)
+        cached = self.hashes.get(path)
+        with open(path, 'rb') as f:
+            if st.st_size == 0:
+                raise PEError('%s: empty file' % path)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if cached is not None and cached[:2] == key:
+                    digest = cached[2]
+                else:
+                    digest = hashlib.sha1(data).hexdigest()
+                    self.hashes[path] = key + (digest,)
+                    self.changed = True
+                if digest not in self.imports:
+                    self.imports[digest] = parse(data, path)
+                    self.changed = True
+            finally:
+                data.close()
+        return self.imports[digest]
+
+
+def closure(roots, search_path, cache):
+    """Returns the absolute paths of the DLLs the files roots import,
+    directly or not, and are found in the directories search_path, and the
+    names of the DLLs that are not found there."""
+    # Windows looks up DLLs without regard to case.
+    found = {}
+    for directory in reversed(search_path):
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.lower().endswith('.dll'):
+                    found[name.lower()] = os.path.join(directory, name)
+    dlls = set()
+    missing = set()
+    seen = set(os.path.basename(root).lower() for root in roots)
+    pending = list(roots)
+    while pending:
+        for name in cache.get(pending.pop()):
+            key = name.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            if key in found:
+                dlls.add(found[key])
+                pending.append(found[key])
+            else:
+                missing.add(name)
+    return sorted(dlls), sorted(missing)
+
+
+def _copy_if_changed(source, target):
+    try:
+        st = os.stat(target)
+        if st.st_size == os.path.getsize(source) and \
+                st.st_mtime == os.path.getmtime(source):
+            return
+    except OSError:
+        pass
+    shutil.copy2(source, target)
+
+
+def install_dll_closure(target, source, env):
+    """Copies the DLLs that the sources need from the directories
+    DLL_SEARCH_PATH to DLL_INSTALL_DIR, with their .pdb files if DLL_PDBS is
+    set, and lists them in the target. DLLs that an earlier run copied and
+    that are no longer needed are removed."""
+    install_dir = env['DLL_INSTALL_DIR']
+    cache = ImportCache(os.path.join(env['CACHEDIR'], CACHE_FILE))
+    try:
+        dlls, missing = closure([node.abspath for node in source],
+                                env['DLL_SEARCH_PATH'], cache)
+    finally:
+        cache.save()
+
+    files = list(dlls)
+    if env.get('DLL_PDBS'):
+        for dll in dlls:
+            pdb = os.path.splitext(dll)[0] + '.pdb'
+            if os.path.exists(pdb):
+                files.append(pdb)
+    if not os.path.isdir(install_dir):
+        os.makedirs(install_dir)
+    for path in files:
+        _copy_if_changed(path, os.path.join(install_dir,
+                                            os.path.basename(path)))
+
+    installed = set(os.path.basename(path) for path in files)
+    manifest = target[0].abspath
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            for name in f.read().split('\n'):
+                path = os.path.join(install_dir, name)
+                if name and name not in installed and os.path.exists(path):
+                    os.remove(path)
+    with open(manifest, 'w') as f:
+        f.write(''.join('%s\n' % name for name in sorted(installed)))
+    print "Installed %d DLLs; %d more are expected from Windows: %s" % (
+        len(dlls), len(missing), ', '.join(missing))
+    return 0
+
+
+def install_dll_closure_string(target, source, env):
+    return 'Installing the DLLs of %d binaries to %s' % (
+        len(source), env['DLL_INSTALL_DIR'])
+
+
+def InstallDllClosure(env, target, source, install_dir, search_path,
+                      pdbs=False):
+    """Copies the DLLs that source (the programs and plugins) need from the
+    directories search_path to the directory install_dir. The target lists
+    what was copied. It is always rebuilt since the DLLs in search_path are
+    not among its dependencies."""
+    result = env.Command(target, source,
+                         env.Action(install_dll_closure,
+                                    install_dll_closure_string),
+                         DLL_INSTALL_DIR=env.Dir(install_dir).abspath,
+                         DLL_SEARCH_PATH=[env.Dir(directory).abspath
+                                          for directory in search_path],
+                         DLL_PDBS=pdbs)
+    env.AlwaysBuild(result)
+    return result
+
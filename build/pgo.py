@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Profile-guided optimization for optimize=pgo.
+
+optimize=pgo builds with the portable flags in two stages:
+
+1. As long as there is no usable profile, all sources are compiled with
+   instrumentation. "scons optimize=pgo test=1 pgo-train" builds the
+   instrumented mixxx-test, runs the training workload (the engine tests
+   and the benchmarks) and stores the collected profile in
+   cache/pgo/<build dir>/profile together with a manifest of the sources it
+   was trained on.
+2. Once a profile exists, "scons optimize=pgo" rebuilds everything with it.
+
+A profile is reused until more than pgo_drift percent of the sources it was
+trained on changed (or were added or removed). After that the build falls
+back to stage 1 until pgo-train runs again.
+
+GCC writes one .gcda file per object into the profile directory, Clang
+writes .profraw files that llvm-profdata merges into one .profdata file.
+"""
+
+import cPickle as pickle
+import hashlib
+import os
+import shutil
+import subprocess
+
+from SCons import Script
+
+PGO_DIR = 'pgo'
+MANIFEST_FILE = 'manifest'
+PROFDATA_FILE = 'mixxx.profdata'
+DEFAULT_DRIFT = 10
+
+STAGE_GENERATE = 'generate'
+STAGE_USE = 'use'
+
+SOURCE_SUFFIXES = ['.c', '.cpp', '.cxx', '.cc']
+
+# The training workload: the tests that exercise the engine and all
+# benchmarks.
+TRAINING_RUNS = [['--gtest_filter=*Engine*'],
+                 ['--benchmark']]
+
+
+def _hash_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except IOError:
+        return None
+
+
+class ProfileStore(object):
+
+    def __init__(self, build):
+        self.build = build
+        self.path = os.path.join(build.get_cache_dir(), PGO_DIR,
+                                 os.path.basename(build.build_dir))
+        self.train_dir = os.path.join(self.path, 'train')
+        self.profile_dir = os.path.join(self.path, 'profile')
+        self.manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        self.drift_threshold = int(Script.ARGUMENTS.get('pgo_drift',
+                                                        DEFAULT_DRIFT))
+        self.sources = []
+        self.drift = None
+
+    def set_sources(self, sources):
+        """Remembers the C/C++ sources of the build, which the manifest and
+        the drift are based on."""
+        self.sources = sorted(set(
+            self.build.env.File(source).srcnode().abspath
+            for source in sources
+            if isinstance(source, basestring) and
+            os.path.splitext(source)[1] in SOURCE_SUFFIXES))
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+            return None
+
+    def compute_drift(self):
+        """Returns the percentage of sources that changed since the profile
+        was trained, or None if there is no profile."""
+        manifest = self.load_manifest()
+        if not manifest or not os.path.isdir(self.profile_dir):
+            return None
+        changed = len(set(manifest) ^ set(self.sources))
+        for path in set(manifest) & set(self.sources):
+            if _hash_file(path) != manifest[path]:
+                changed += 1
+        return 100.0 * changed / max(len(manifest), 1)
+
+    def stage(self):
+        self.drift = self.compute_drift()
+        if self.drift is None or self.drift > self.drift_threshold:
+            return STAGE_GENERATE
+        return STAGE_USE
+
+    def report_current(self):
+        print "The PGO profile in %s is current (%.0f%% of the sources " \
+            "changed, pgo_drift=%d). Remove it to train again." % (
+                self.profile_dir, self.drift, self.drift_threshold)
+        return 0
+
+    def report_no_tests(self):
+        print "pgo-train runs mixxx-test, build with test=1."
+        return 1
+
+    def flags(self, stage):
+        """Returns the CCFLAGS and LINKFLAGS for stage."""
+        if self.build.compiler_is_clang:
+            if stage == STAGE_GENERATE:
+                flag = '-fprofile-instr-generate=%s' % os.path.join(
+                    self.train_dir, 'mixxx-%p.profraw')
+                return [flag], [flag]
+            return (['-fprofile-instr-use=%s' % os.path.join(
+                        self.profile_dir, PROFDATA_FILE),
+                     '-Wno-profile-instr-out-of-date',
+                     '-Wno-profile-instr-unprofiled'], [])
+        if stage == STAGE_GENERATE:
+            flag = '-fprofile-generate=%s' % self.train_dir
+            return [flag], [flag]
+        # Counters of threaded code are not exact, and sources that changed
+        # within the drift threshold no longer match their profile.
+        return (['-fprofile-use=%s' % self.profile_dir, '-fprofile-correction',
+                 '-Wno-error=coverage-mismatch', '-Wno-missing-profile'], [])
+
+    def train(self, test_program):
+        """Runs the training workload with the instrumented test_program and
+        stores the profile it collected. Returns 0 on success."""
+        if os.path.isdir(self.train_dir):
+            shutil.rmtree(self.train_dir)
+        os.makedirs(self.train_dir)
+        cwd = Script.Dir('#').abspath
+        for arguments in TRAINING_RUNS:
+            print "PGO training: %s %s" % (os.path.basename(test_program),
+                                           ' '.join(arguments))
+            result = subprocess.call([test_program] + arguments, cwd=cwd)
+            if result < 0:
+                print "PGO training: %s crashed" % test_program
+                return 1
+            if result > 0:
+                # Failing tests still exercise the engine.
+                print "WARNING: Not all training tests pass."
+
+        if not os.listdir(self.train_dir):
+            print "PGO training: no profile was written, is %s " \
+                "instrumented?" % test_program
+            return 1
+
+        if self.build.compiler_is_clang:
+            raw = [os.path.join(self.train_dir, name)
+                   for name in os.listdir(self.train_dir)
+                   if name.endswith('.profraw')]
+            profdata = self.build.env.get('LLVM_PROFDATA', 'llvm-profdata')
+            result = subprocess.call(
+                [profdata, 'merge', '-output=%s' %
+                 os.path.join(self.train_dir, PROFDATA_FILE)] + raw)
+            if result != 0:
+                return result
+
+        if os.path.isdir(self.profile_dir):
+            shutil.rmtree(self.profile_dir)
+        os.rename(self.train_dir, self.profile_dir)
+        manifest = dict((path, _hash_file(path)) for path in self.sources)
+        with open(self.manifest_path + '.tmp', 'wb') as f:
+            pickle.dump(manifest, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(self.manifest_path + '.tmp', self.manifest_path)
+        print "PGO profile stored in %s. Run scons optimize=pgo again to " \
+            "build with it." % self.profile_dir
+        return 0
@@ -1,13 +1,20 @@
-""" 
+"""
 protoc.py: Protoc Builder for SCons
 
-This Builder invokes protoc to generate C++ and Python 
-from a .proto file.  
- 
+This Builder invokes protoc to generate C++ and Python
+from a .proto file.
+
+All .proto files given to one Protoc call are compiled by a single protoc
+run. Its outputs are kept in cache/protoc, keyed by the contents of the
+.proto files, the protoc command line and the protoc version, and only
+written when they change.
+
+Python output is only generated if PROTOCPYTHONOUTDIR is set.
+
 NOTE: Java is not currently supported."""
 
 __author__ = "Scott Stafford"
- 
+
 import SCons.Action
 import SCons.Builder
 import SCons.Defaults
@@ -15,14 +22,106 @@ import SCons.Node.FS
 import SCons.Util
 
 from SCons.Script import File, Dir
- 
+
+import glob
+import hashlib
+import os
 import os.path
+import shutil
+import subprocess
 protocs = 'protoc'
 
-ProtocAction = SCons.Action.Action('$PROTOCCOM', '$PROTOCCOMSTR')
+CACHE_DIR = 'protoc'
+# Number of protoc runs whose outputs are kept in the cache.
+CACHE_ENTRIES = 8
+
+_versions = {}
+
+def protoc_version(env):
+    protoc = env.subst('$PROTOC')
+    if protoc not in _versions:
+        try:
+            process = subprocess.Popen([protoc, '--version'],
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT,
+                                       env=env['ENV'])
+            _versions[protoc] = process.communicate()[0].strip()
+        except OSError:
+            _versions[protoc] = ''
+    return _versions[protoc]
+
+def _read(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except IOError:
+        return None
+
+def _cache_key(target, source, env):
+    digest = hashlib.sha1(protoc_version(env))
+    digest.update(env.subst('$PROTOCCOM', target=target, source=source))
+    for src in source:
+        digest.update('\0%s\0' % src.path)
+        digest.update(_read(src.rfile().abspath) or '')
+    return digest.hexdigest()
+
+def _cache_entry(env, key):
+    cache_dir = env.get('CACHEDIR') or Dir('#cache').abspath
+    return os.path.join(cache_dir, CACHE_DIR, key)
+
+def _restore(entry, target):
+    outputs = [_read(os.path.join(entry, '%d' % i))
+               for i in xrange(len(target))]
+    if None in outputs:
+        return False
+    for node, output in zip(target, outputs):
+        if _read(node.abspath) != output:
+            node.get_dir()._create()
+            with open(node.abspath, 'wb') as f:
+                f.write(output)
+    # Keep recently used entries from being pruned.
+    os.utime(entry, None)
+    return True
+
+def _store(entry, target):
+    temp_entry = entry + '.tmp'
+    if os.path.isdir(temp_entry):
+        shutil.rmtree(temp_entry)
+    os.makedirs(temp_entry)
+    for i, node in enumerate(target):
+        shutil.copyfile(node.abspath, os.path.join(temp_entry, '%d' % i))
+    if os.path.isdir(entry):
+        shutil.rmtree(entry)
+    os.rename(temp_entry, entry)
+    entries = sorted((os.path.getmtime(path), path) for path in
+                     glob.glob(os.path.join(os.path.dirname(entry), '*'))
+                     if os.path.isdir(path))
+    for _, path in entries[:-CACHE_ENTRIES]:
+        shutil.rmtree(path, ignore_errors=True)
+
+ProtocCommand = SCons.Action.Action('$PROTOCCOM', '$PROTOCCOMSTR')
+def protoc(target, source, env):
+    entry = _cache_entry(env, _cache_key(target, source, env))
+    if _restore(entry, target):
+        return 0
+    result = ProtocCommand(target, source, env, show=0)
+    if result == 0:
+        try:
+            _store(entry, target)
+        except (IOError, OSError):
+            pass
+    return result
+
+def protoc_string(target, source, env):
+    return ProtocCommand.strfunction(target, source, env)
+
+ProtocAction = SCons.Action.Action(
+    protoc, strfunction=protoc_string,
+    varlist=['PROTOCCOM', 'PROTOC', 'PROTOCFLAGS', 'PROTOCPROTOPATH',
+             'PROTOCOUTDIR', 'PROTOCCPPOUTFLAG', 'PROTOCPYTHONOUTDIR',
+             'PROTOCFDSOUT'])
 def ProtocEmitter(target, source, env):
     dirOfCallingSConscript = Dir('.').srcnode()
-    env.Prepend(PROTOCPROTOPATH = dirOfCallingSConscript.path)
 
     source_with_corrected_path = []
     for src in source:
@@ -60,20 +159,32 @@ ProtocBuilder = SCons.Builder.Builder(action = ProtocAction,
                                    emitter = ProtocEmitter,
                                     srcsuffix = '$PROTOCSRCSUFFIX')
 
+def Protoc(env, target, source, *args, **kw):
+    """Compiles the .proto files source with a single protoc run. The
+    directory of the calling SConscript comes first in the proto path,
+    which is passed on without duplicates."""
+    dirOfCallingSConscript = Dir('.').srcnode()
+    proto_path = [dirOfCallingSConscript.path]
+    for path in SCons.Util.CLVar(kw.get('PROTOCPROTOPATH',
+                                        env['PROTOCPROTOPATH'])):
+        if path not in proto_path:
+            proto_path.append(path)
+    kw['PROTOCPROTOPATH'] = proto_path
+    result = ProtocBuilder.__call__(env, target, source, **kw)
+    # Outputs restored from the cache are only written if they changed.
+    env.Precious(result)
+    return result
+
 def generate(env):
     """Add Builders and construction variables for protoc to an Environment."""
-    try:
-         bld = env['BUILDERS']['Protoc']
-    except KeyError:
-        bld = ProtocBuilder
-        env['BUILDERS']['Protoc'] = bld
- 
+    env.AddMethod(Protoc, 'Protoc')
+
     env['PROTOC']        = env.Detect(protocs) or 'protoc'
     env['PROTOCFLAGS']   = SCons.Util.CLVar('')
     env['PROTOCPROTOPATH'] = SCons.Util.CLVar('')
     env['PROTOCCOM']     = '$PROTOC ${["-I%s"%x for x in PROTOCPROTOPATH]} $PROTOCFLAGS --cpp_out=$PROTOCCPPOUTFLAG$PROTOCOUTDIR ${PROTOCPYTHONOUTDIR and ("--python_out="+PROTOCPYTHONOUTDIR) or ""} ${PROTOCFDSOUT and ("-o"+PROTOCFDSOUT) or ""} ${SOURCES}'
     env['PROTOCOUTDIR'] = '${SOURCE.dir}'
-    env['PROTOCPYTHONOUTDIR'] = "python"
+    env['PROTOCPYTHONOUTDIR'] = ''
     env['PROTOCSRCSUFFIX']  = '.proto'
 
 def exists(env):
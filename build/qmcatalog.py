@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Batched lrelease for the Qm4 and Qm5 builders of the qt tools.
+
+All catalogs given to one Qm builder call are released by a single action
+that runs lrelease on a pool of worker threads, each .qm from its own .ts.
+A .qm is skipped if its .ts, the lrelease flags and the lrelease version are
+unchanged since it was last written (cache/qm_catalogs keeps their hashes).
+"""
+
+import cPickle as pickle
+import hashlib
+import multiprocessing.pool
+import os
+import subprocess
+
+import SCons.Action
+from SCons import Script
+
+import util
+
+MANIFEST_FILE = 'qm_catalogs'
+
+_versions = {}
+
+
+def lrelease_version(lrelease, env):
+    """Returns the version string of the lrelease executable lrelease."""
+    if lrelease not in _versions:
+        try:
+            process = subprocess.Popen([lrelease, '-version'],
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT,
+                                       env=env['ENV'])
+            _versions[lrelease] = process.communicate()[0].strip()
+        except OSError:
+            _versions[lrelease] = ''
+    return _versions[lrelease]
+
+
+def _manifest_path(env):
+    cache_dir = env.get('CACHEDIR') or Script.Dir('#cache').abspath
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    return os.path.join(cache_dir, MANIFEST_FILE)
+
+
+def _load_manifest(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+        return {}
+
+
+def _save_manifest(path, manifest):
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(manifest, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError):
+        pass
+
+
+def _hash_catalogs(paths, salt):
+    digest = hashlib.sha1(salt)
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class _Release(object):
+    """The lrelease action for the tool with the variable prefix (QT4 or
+    QT5)."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def __call__(self, target, source, env):
+        lrelease = env.subst('$%s_LRELEASE' % self.prefix)
+        flags = env.subst('$%s_LRELEASEFLAGS' % self.prefix).split()
+        salt = '\0'.join([lrelease_version(lrelease, env)] + flags)
+        ts_paths = [node.rfile().abspath for node in source]
+        manifest_path = _manifest_path(env)
+        manifest = _load_manifest(manifest_path)
+
+        jobs = []
+        for qm, ts_path in zip(target, ts_paths):
+            inputs = [ts_path]
+            key = _hash_catalogs(inputs, salt)
+            if manifest.get(qm.abspath) == key and \
+                    os.path.exists(qm.abspath):
+                continue
+            jobs.append((qm.abspath, inputs, key))
+        print "Releasing %d of %d translation catalogs" % (len(jobs),
+                                                           len(target))
+        if not jobs:
+            return 0
+
+        def release(job):
+            qm_path, inputs, _ = job
+            return subprocess.call([lrelease] + flags + inputs +
+                                   ['-qm', qm_path], env=env['ENV'])
+        pool = multiprocessing.pool.ThreadPool(util.workers(len(jobs)))
+        try:
+            results = pool.map(release, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+        failed = 0
+        for (qm_path, _, key), result in zip(jobs, results):
+            if result == 0:
+                manifest[qm_path] = key
+            else:
+                failed = result
+                manifest.pop(qm_path, None)
+        _save_manifest(manifest_path, manifest)
+        return failed
+
+    def strfunction(self, target, source, env):
+        return '%s %d catalogs' % (env.subst('$%s_LRELEASE' % self.prefix),
+                                   len(target))
+
+
+def action(prefix):
+    """Returns the action of the Qm builder of the tool with the variable
+    prefix (QT4 or QT5)."""
+    return SCons.Action.Action(_Release(prefix),
+                               '$%s_LRELEASECOMSTR' % prefix,
+                               varlist=['%s_LRELEASEFLAGS' % prefix])
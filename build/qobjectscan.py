@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Finds Q_OBJECT macros and #include directives in C++ sources for automoc.
+
+The file is tokenized in a single pass over a memory map of it: comments,
+string, character and raw string literals are skipped as whole tokens, so a
+Q_OBJECT or #include inside them is never reported, and no copy of the file
+with the comments removed is made. Blocks disabled with "#if 0" (or
+"#if false") are skipped as well. Other conditions cannot be evaluated here
+and count as enabled.
+
+For headers automoc only needs to know whether they contain a Q_OBJECT, so
+scanning stops at the first one unless the includes are wanted too.
+
+build/tests/test_qobjectscan.py checks the scanner.
+"""
+
+import itertools
+import mmap
+import re
+
+# Every alternative starts with a literal character, which lets the regex
+# engine skip to the next candidate position quickly. Directives are matched
+# with the newline before them; one on the first line is matched separately.
+_directive = r'''
+    (?P<directive>[ \t]*\#[ \t]*(?P<name>[a-z]+)
+        (?P<args>(?:[^\n\\/"]|\\.|/(?![/*])|"(?:[^"\\\n]|\\.)*")*))
+'''
+_token = re.compile(r'''
+      /(?P<comment>\*.*?(?:\*/|\Z) | /(?:[^\n\\]|\\.)*)
+    | R(?P<raw>(?:(?<![A-Za-z0-9_]R)|(?<=[^A-Za-z0-9_][uUL]R)|
+                  (?<=[^A-Za-z0-9_]u8R))
+          "(?P<delim>[^()\\\s"]{0,16})\(.*?\)(?P=delim)")
+    | "(?P<string>(?:[^"\\\n]|\\.)*")
+    | '(?P<char>(?<![A-Za-z0-9_]')(?:[^'\\\n]|\\.)*')
+    | \n''' + _directive + r'''
+    | Q(?P<qobject>_OBJECT)(?<![A-Za-z0-9_]Q_OBJECT)(?![A-Za-z0-9_])
+''', re.S | re.X)
+_first_directive = re.compile(_directive, re.S | re.X)
+
+_include_argument = re.compile(r'\s*"([^"]*)"')
+_false_condition = re.compile(r'\s*(0+|false)\s*$')
+
+
+def scan_buffer(buf, want_includes=True):
+    """Scans buf (a string or buffer) and returns a dict with 'q_object'
+    (whether it contains a Q_OBJECT) and 'includes' (the files #included
+    with quotes, in order). If want_includes is False, scanning stops at the
+    first Q_OBJECT."""
+    q_object = False
+    includes = []
+    # For every open conditional: whether it is disabled by its own
+    # condition, and whether it is disabled at all.
+    conditionals = []
+    disabled = False
+    first = _first_directive.match(buf)
+    tokens = _token.finditer(buf, first.end() if first else 0)
+    for match in itertools.chain([first] if first else [], tokens):
+        kind = match.lastgroup
+        if kind == 'qobject':
+            if disabled:
+                continue
+            q_object = True
+            if not want_includes:
+                break
+        elif kind == 'directive':
+            name = match.group('name')
+            if name in ('if', 'ifdef', 'ifndef'):
+                own = name == 'if' and \
+                    bool(_false_condition.match(match.group('args')))
+                conditionals.append((own, disabled or own))
+                disabled = disabled or own
+            elif name in ('else', 'elif') and conditionals:
+                own, _ = conditionals[-1]
+                parent = len(conditionals) > 1 and conditionals[-2][1]
+                if own:
+                    # The alternative of an "#if 0" block.
+                    conditionals[-1] = (False, parent)
+                    disabled = parent
+            elif name == 'endif' and conditionals:
+                conditionals.pop()
+                disabled = bool(conditionals) and conditionals[-1][1]
+            elif name == 'include' and not disabled:
+                argument = _include_argument.match(match.group('args'))
+                if argument:
+                    includes.append(argument.group(1))
+    return {'q_object': q_object, 'includes': includes}
+
+
+def scan_file(path, want_includes=True):
+    """Like scan_buffer for the contents of the file at path. Raises
+    IOError if it cannot be read."""
+    with open(path, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            # Empty files cannot be mapped.
+            return scan_buffer(f.read(), want_includes)
+        try:
+            return scan_buffer(buf, want_includes)
+        finally:
+            buf.close()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Dependency scanning of .qrc resource files for the qt4 and qt5 tools.
+
+A .qrc lists files and directories (which rcc includes recursively) relative
+to itself. res/mixxx.qrc pulls in thousands of skin and image files, so
+instead of listing every directory again on every scan we keep an index of
+the directory tree in cache/qrc_index. A directory's entry is reused as long
+as its mtime is unchanged, which is the case unless files were added to,
+removed from or renamed in that very directory. The parsed .qrc files are
+cached the same way, by mtime and size.
+
+The .qrc is parsed with a streaming XML reader. The dependencies are
+returned as nodes relative to the .qrc, sorted by path.
+"""
+
+import atexit
+import cPickle as pickle
+import os
+import xml.etree.ElementTree as ElementTree
+
+from SCons import Script
+
+INDEX_FILE = 'qrc_index'
+INDEX_VERSION = 1
+
+
+def parse_qrc(path):
+    """Returns the paths of the <file> entries of the .qrc at path."""
+    files = []
+    for _, element in ElementTree.iterparse(path):
+        if element.tag == 'file' and element.text:
+            files.append(element.text.strip())
+        element.clear()
+    return files
+
+
+class ResourceIndex(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.dirty = False
+        # directory -> (mtime, [(name, is_dir)])
+        self.directories = {}
+        # .qrc path -> ((mtime, size), [file entries])
+        self.qrc_files = {}
+        self._load()
+        atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                version, directories, qrc_files = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError, ValueError,
+                TypeError):
+            return
+        if version == INDEX_VERSION:
+            self.directories = directories
+            self.qrc_files = qrc_files
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            with open(self.path + '.tmp', 'wb') as f:
+                pickle.dump((INDEX_VERSION, self.directories, self.qrc_files),
+                            f, pickle.HIGHEST_PROTOCOL)
+            os.rename(self.path + '.tmp', self.path)
+        except (IOError, OSError):
+            return
+        self.dirty = False
+
+    def _entries(self, directory):
+        mtime = os.stat(directory).st_mtime
+        cached = self.directories.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        entries = sorted((name, os.path.isdir(os.path.join(directory, name)))
+                         for name in os.listdir(directory))
+        self.directories[directory] = (mtime, entries)
+        self.dirty = True
+        return entries
+
+    def files_below(self, basepath, path):
+        """Returns the files below basepath/path, relative to basepath."""
+        result = []
+        pending = [path]
+        while pending:
+            relative = pending.pop()
+            for name, is_dir in self._entries(os.path.join(basepath,
+                                                           relative)):
+                item = os.path.join(relative, name)
+                if is_dir:
+                    pending.append(item)
+                else:
+                    result.append(item)
+        return result
+
+    def qrc_entries(self, path):
+        st = os.stat(path)
+        key = (st.st_mtime, st.st_size)
+        cached = self.qrc_files.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        entries = parse_qrc(path)
+        self.qrc_files[path] = (key, entries)
+        self.dirty = True
+        return entries
+
+    def dependencies(self, qrc_path):
+        """Returns the files qrc_path includes, relative to its directory,
+        with directories expanded recursively."""
+        basepath = os.path.dirname(qrc_path)
+        result = set()
+        for entry in self.qrc_entries(qrc_path):
+            if os.path.isdir(os.path.join(basepath, entry)):
+                result.update(self.files_below(basepath, entry))
+            else:
+                result.add(entry)
+        return sorted(result)
+
+
+_indexes = {}
+
+
+def get_index(env):
+    """Returns the ResourceIndex stored in the cache directory of env."""
+    cache_dir = env.get('CACHEDIR') or Script.Dir('#cache').abspath
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    path = os.path.join(cache_dir, INDEX_FILE)
+    if path not in _indexes:
+        _indexes[path] = ResourceIndex(path)
+    return _indexes[path]
+
+
+def scan(node, env):
+    """Scanner function for .qrc nodes."""
+    # Generated .qrc files (see rccshard) only exist in the build directory.
+    for qrc in (node.srcnode().rfile(), node.rfile()):
+        if os.path.isfile(qrc.abspath):
+            break
+    else:
+        return []
+    directory = node.get_dir()
+    return [directory.File(path) for path in
+            get_index(env).dependencies(qrc.abspath)]
@@ -32,6 +32,7 @@ selection method.
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
+import hashlib
 import os.path
 import re
 import sys
@@ -43,6 +44,12 @@ import SCons.Scanner
 import SCons.Tool
 import SCons.Util
 
+import mocscan
+import qmcatalog
+import qrcscan
+import rccshard
+import uiccache
+
 class ToolQt5Warning(SCons.Warnings.Warning):
     pass
 
@@ -79,7 +86,6 @@ except NameError:
             result.reverse()
         return result
 
-qrcinclude_re = re.compile(r'<file[^>]*>([^<]*)</file>', re.M)
 
 def transformToWinePath(path) :
     return os.popen('winepath -w "%s"'%path).read().strip().replace('\\','/')
@@ -106,6 +112,12 @@ def checkMocIncluded(target, source, env):
             "Generated moc file '%s' is not included by '%s'" %
             (str(moc), str(cpp)))
 
+def writeMocsCompilation(target, source, env):
+    """Writes an aggregated mocs_compilation unit, see _Automoc."""
+    f = open(str(target[0]), 'w')
+    f.write(source[0].get_contents())
+    f.close()
+
 def find_file(filename, paths, node_factory):
     for dir in paths:
         node = node_factory(filename, dir)
@@ -121,14 +133,8 @@ class _Automoc:
 
     def __init__(self, objBuilderName):
         self.objBuilderName = objBuilderName
-        # some regular expressions:
-        # Q_OBJECT detection
-        self.qo_search = re.compile(r'[^A-Za-z0-9]Q_OBJECT[^A-Za-z0-9]')
-        # cxx and c comment 'eater'
-        self.ccomment = re.compile(r'/\*(.*?)\*/',re.S)
-        self.cxxcomment = re.compile(r'//.*$',re.M)
-        # we also allow Q_OBJECT in a literal string
-        self.literal_qobject = re.compile(r'"[^\n]*Q_OBJECT[^\n]*"')
+        # Q_OBJECT and #include detection, see mocscan and qobjectscan
+        self.scan_cache = None
         
     def create_automoc_options(self, env):
         """
@@ -139,6 +145,7 @@ class _Automoc:
         moc_options = {'auto_scan' : True,
                        'auto_scan_strategy' : 0,
                        'gobble_comments' : 0,
+                       'mocs_batch' : 0,
                        'debug' : 0,
                        'auto_cpppath' : True,
                        'cpppaths' : []}
@@ -159,6 +166,10 @@ class _Automoc:
             moc_options['debug'] = int(env.subst('$QT5_DEBUG'))
         except ValueError:
             pass
+        try:
+            moc_options['mocs_batch'] = int(env.subst('$QT5_MOCSBATCH'))
+        except ValueError:
+            pass
         try:
             if int(env.subst('$QT5_AUTOMOC_SCANCPPPATH')) == 0:
                 moc_options['auto_cpppath'] = False
@@ -172,8 +183,21 @@ class _Automoc:
         
         return moc_options
 
+    def find_header(self, env, moc_options, cpp):
+        """
+        Returns the header file alongside the cpp/cxx, or None.
+        """
+        for h_ext in header_extensions:
+            # try to find the header file in the corresponding source
+            # directory
+            hname = self.splitext(cpp.name)[0] + h_ext
+            h = find_file(hname, [cpp.get_dir()]+moc_options['cpppaths'], env.File)
+            if h:
+                return h
+        return None
+
     def __automoc_strategy_simple(self, env, moc_options, 
-                                  cpp, cpp_contents, out_sources):
+                                  cpp, cpp_scan, out_sources):
         """
         Default Automoc strategy (Q_OBJECT driven): detect a header file
         (alongside the current cpp/cxx) that contains a Q_OBJECT
@@ -182,24 +206,14 @@ class _Automoc:
         it gets MOCed too.
         """
         
-        h=None
-        for h_ext in header_extensions:
-            # try to find the header file in the corresponding source
-            # directory
-            hname = self.splitext(cpp.name)[0] + h_ext
-            h = find_file(hname, [cpp.get_dir()]+moc_options['cpppaths'], env.File)
-            if h:
-                if moc_options['debug']:
-                    print "scons: qt5: Scanning '%s' (header of '%s')" % (str(h), str(cpp))
-                h_contents = h.get_contents()
-                if moc_options['gobble_comments']:
-                    h_contents = self.ccomment.sub('', h_contents)
-                    h_contents = self.cxxcomment.sub('', h_contents)
-                h_contents = self.literal_qobject.sub('""', h_contents)
-                break
+        h = self.find_header(env, moc_options, cpp)
+        if h:
+            if moc_options['debug']:
+                print "scons: qt5: Scanning '%s' (header of '%s')" % (str(h), str(cpp))
+            h_scan = self.scan_cache.scan(h)
         if not h and moc_options['debug']:
             print "scons: qt5: no header for '%s'." % (str(cpp))
-        if h and self.qo_search.search(h_contents):
+        if h and h_scan['q_object']:
             # h file with the Q_OBJECT macro found -> add moc_cpp
             moc_cpp = env.Moc5(h)
             if moc_options['debug']:
@@ -207,17 +221,20 @@ class _Automoc:
             
             # Now, check whether the corresponding CPP file
             # includes the moc'ed output directly...
-            inc_moc_cpp = r'^\s*#\s*include\s+"%s"' % str(moc_cpp[0])
-            if cpp and re.search(inc_moc_cpp, cpp_contents, re.M):
+            if cpp and str(moc_cpp[0]) in cpp_scan['includes']:
                 if moc_options['debug']:
                     print "scons: qt5: CXX file '%s' directly includes the moc'ed output '%s', no compiling required" % (str(cpp), str(moc_cpp))
                 env.Depends(cpp, moc_cpp)
+            elif moc_options['mocs_batch'] > 0:
+                if moc_options['debug']:
+                    print "scons: qt5: compiling '%s' in a mocs_compilation unit" % (str(moc_cpp))
+                self.batched_mocs.extend(moc_cpp)
             else:
                 moc_o = self.objBuilder(moc_cpp)
                 if moc_options['debug']:
                     print "scons: qt5: compiling '%s' to '%s'" % (str(cpp), str(moc_o))
                 out_sources.extend(moc_o)
-        if cpp and self.qo_search.search(cpp_contents):
+        if cpp and cpp_scan['q_object']:
             # cpp file with Q_OBJECT macro found -> add moc
             # (to be included in cpp)
             moc = env.Moc5(cpp)
@@ -226,7 +243,7 @@ class _Automoc:
                 print "scons: qt5: found Q_OBJECT macro in '%s', moc'ing to '%s'" % (str(cpp), str(moc))
 
     def __automoc_strategy_include_driven(self, env, moc_options,
-                                          cpp, cpp_contents, out_sources):
+                                          cpp, cpp_scan, out_sources):
         """
         Automoc strategy #1 (include driven): searches for "include"
         statements of MOCed files in the current cpp/cxx file.
@@ -241,33 +258,22 @@ class _Automoc:
             cxx_moc = "%s%s%s" % (env.subst('$QT5_XMOCCXXPREFIX'),
                                   self.splitext(cpp.name)[0],
                                   env.subst('$QT5_XMOCCXXSUFFIX'))
-            inc_h_moc = r'#include\s+"%s"' % h_moc
-            inc_cxx_moc = r'#include\s+"%s"' % cxx_moc
+            inc_h_moc = '#include "%s"' % h_moc
+            inc_cxx_moc = '#include "%s"' % cxx_moc
             
             # Search for special includes in qtsolutions style
-            if cpp and re.search(inc_h_moc, cpp_contents):
+            if cpp and h_moc in cpp_scan['includes']:
                 # cpp file with #include directive for a MOCed header found -> add moc
                 
                 # Try to find header file                    
-                h=None
-                hname=""
-                for h_ext in header_extensions:
-                    # Try to find the header file in the
-                    # corresponding source directory
-                    hname = self.splitext(cpp.name)[0] + h_ext
-                    h = find_file(hname, [cpp.get_dir()]+moc_options['cpppaths'], env.File)
-                    if h:
-                        if moc_options['debug']:
-                            print "scons: qt5: Scanning '%s' (header of '%s')" % (str(h), str(cpp))
-                        h_contents = h.get_contents()
-                        if moc_options['gobble_comments']:
-                            h_contents = self.ccomment.sub('', h_contents)
-                            h_contents = self.cxxcomment.sub('', h_contents)
-                        h_contents = self.literal_qobject.sub('""', h_contents)
-                        break
+                h = self.find_header(env, moc_options, cpp)
+                if h:
+                    if moc_options['debug']:
+                        print "scons: qt5: Scanning '%s' (header of '%s')" % (str(h), str(cpp))
+                    h_scan = self.scan_cache.scan(h)
                 if not h and moc_options['debug']:
                     print "scons: qt5: no header for '%s'." % (str(cpp))
-                if h and self.qo_search.search(h_contents):
+                if h and h_scan['q_object']:
                     # h file with the Q_OBJECT macro found -> add moc_cpp
                     moc_cpp = env.XMoc5(h)
                     env.Ignore(moc_cpp, moc_cpp)
@@ -285,9 +291,9 @@ class _Automoc:
                     if moc_options['debug']:
                         print "scons: qt5: found no Q_OBJECT macro in '%s', but a moc'ed version '%s' gets included in '%s'" % (str(h), inc_h_moc, cpp.name)
 
-            if cpp and re.search(inc_cxx_moc, cpp_contents):
+            if cpp and cxx_moc in cpp_scan['includes']:
                 # cpp file with #include directive for a MOCed cxx file found -> add moc
-                if self.qo_search.search(cpp_contents):
+                if cpp_scan['q_object']:
                     moc = env.XMoc5(target=cxx_moc, source=cpp)
                     env.Ignore(moc, moc)
                     added = True
@@ -300,8 +306,49 @@ class _Automoc:
             if not added:
                 # Fallback to default Automoc strategy (Q_OBJECT driven)
                self.__automoc_strategy_simple(env, moc_options, cpp,
-                                              cpp_contents, out_sources)
+                                              cpp_scan, out_sources)
         
+    def __compile_mocs_batched(self, env, target, moc_options):
+        """
+        Compiles the moc'ed headers collected in self.batched_mocs in
+        aggregated mocs_compilation units that #include about
+        QT5_MOCSBATCH of them each, instead of one object per header.
+        Every unit depends on its moc files, so touching a header only
+        re-mocs that header and recompiles its unit.
+
+        A header goes into the unit picked by a hash of its path, so adding
+        or removing a header only changes its own unit. The number of units
+        is a power of two, so it only changes, and the headers are only
+        shuffled, when the number of headers doubles or halves.
+        """
+        mocs = sorted(set(self.batched_mocs), key=lambda entry : str(entry))
+        size = moc_options['mocs_batch']
+        count = 1
+        while count * size < len(mocs):
+            count *= 2
+        batches = {}
+        for moc in mocs:
+            index = int(hashlib.md5(str(moc)).hexdigest(), 16) % count
+            batches.setdefault(index, []).append(moc)
+        target_dir = target[0].get_dir()
+        name = self.splitext(target[0].name)[0].replace('.', '_')
+        objects = []
+        for index, batch in sorted(batches.iteritems()):
+            unit = target_dir.File('mocs_compilation_%s_%d%s' % (
+                name, index, env.subst('$CXXFILESUFFIX')))
+            # The unit only changes when the list of moc files does.
+            contents = ''.join(['#include "%s"\n' % os.path.relpath(
+                moc.get_abspath(), target_dir.get_abspath()).replace('\\', '/')
+                                for moc in batch])
+            env.Command(unit, env.Value(contents), SCons.Action.Action(
+                writeMocsCompilation, '$QT5_MOCSCOMSTR'))
+            unit_o = self.objBuilder(unit)
+            env.Depends(unit_o, batch)
+            if moc_options['debug']:
+                print "scons: qt5: compiling %d moc files in '%s'" % (len(batch), str(unit))
+            objects.extend(unit_o)
+        return objects
+
     def __call__(self, target, source, env):
         """
         Smart autoscan function. Gets the list of objects for the Program
@@ -324,6 +371,25 @@ class _Automoc:
         # make a deep copy for the result; MocH objects will be appended
         out_sources = source[:]
 
+        # moc'ed headers to compile in mocs_compilation units
+        self.batched_mocs = []
+
+        # Scan all files we do not know yet at once
+        self.scan_cache = mocscan.get_cache(env)
+        if moc_options['auto_scan']:
+            scan_nodes = []
+            for obj in source:
+                if isinstance(obj, basestring) or not obj.has_builder():
+                    continue
+                cpp = obj.sources[0]
+                if not self.splitext(str(cpp))[1] in cxx_suffixes:
+                    continue
+                scan_nodes.append(cpp)
+                h = self.find_header(env, moc_options, cpp)
+                if h:
+                    scan_nodes.append(h)
+            self.scan_cache.prefetch(scan_nodes)
+
         for obj in source:
             if not moc_options['auto_scan']:
                 break
@@ -342,21 +408,20 @@ class _Automoc:
                 # c or fortran source
                 continue
             try:
-                cpp_contents = cpp.get_contents()
-                if moc_options['gobble_comments']:
-                    cpp_contents = self.ccomment.sub('', cpp_contents)
-                    cpp_contents = self.cxxcomment.sub('', cpp_contents)
-                cpp_contents = self.literal_qobject.sub('""', cpp_contents)
+                cpp_scan = self.scan_cache.scan(cpp)
             except: continue # may be an still not generated source
             
             if moc_options['auto_scan_strategy'] == 0:
                 # Default Automoc strategy (Q_OBJECT driven)
                 self.__automoc_strategy_simple(env, moc_options,
-                                               cpp, cpp_contents, out_sources)
+                                               cpp, cpp_scan, out_sources)
             else:
                 # Automoc strategy #1 (include driven)
                 self.__automoc_strategy_include_driven(env, moc_options,
-                                                       cpp, cpp_contents, out_sources)
+                                                       cpp, cpp_scan, out_sources)
+
+        if self.batched_mocs:
+            out_sources.extend(self.__compile_mocs_batched(env, target, moc_options))
 
         # restore the original env attributes (FIXME)
         self.objBuilder.env = objBuilderEnv
@@ -403,27 +468,9 @@ def _detect(env):
 
 
 def __scanResources(node, env, path, arg):
-    # Helper function for scanning .qrc resource files
-    # I've been careful on providing names relative to the qrc file
-    # If that was not needed this code could be simplified a lot
-    def recursiveFiles(basepath, path) :
-        result = []
-        for item in os.listdir(os.path.join(basepath, path)) :
-            itemPath = os.path.join(path, item)
-            if os.path.isdir(os.path.join(basepath, itemPath)) :
-                result += recursiveFiles(basepath, itemPath)
-            else:
-                result.append(itemPath)
-        return result
-    contents = node.get_contents()
-    includes = qrcinclude_re.findall(contents)
-    qrcpath = os.path.dirname(node.path)
-    dirs = [included for included in includes if os.path.isdir(os.path.join(qrcpath,included))]
-    # dirs need to include files recursively
-    for dir in dirs :
-        includes.remove(dir)
-        includes+=recursiveFiles(qrcpath,dir)
-    return includes
+    # Helper function for scanning .qrc resource files. Directories are
+    # included recursively. See qrcscan for the caching.
+    return qrcscan.scan(node, env)
 
 #
 # Scanners
@@ -565,6 +612,10 @@ __ts_builder = SCons.Builder.Builder(
         suffix = '.ts',
         source_factory = SCons.Node.FS.Entry)
 __qm_builder = SCons.Builder.Builder(
+        action = qmcatalog.action('QT5'),
+        src_suffix = '.ts',
+        suffix = '.qm')
+__qm_merge_builder = SCons.Builder.Builder(
         action = SCons.Action.Action('$QT5_LRELEASECOM','$QT5_LRELEASECOMSTR'),
         src_suffix = '.ts',
         suffix = '.qm')
@@ -575,6 +626,12 @@ __qrc_builder = SCons.Builder.Builder(
         suffix = '$QT5_QRCCXXSUFFIX',
         prefix = '$QT5_QRCCXXPREFIX',
         single_source = 1)
+__rcc_binary_builder = SCons.Builder.Builder(
+        action = SCons.Action.Action('$QT5_RCCBINARYCOM', '$QT5_QRCCOMSTR'),
+        source_scanner = __qrcscanner,
+        src_suffix = '$QT5_QRCSUFFIX',
+        suffix = '$QT5_RCCBINARYSUFFIX',
+        single_source = 1)
 __ex_moc_builder = SCons.Builder.Builder(
         action = SCons.Action.CommandGeneratorAction(__moc_generator_from_h, {'cmdstr':'$QT5_MOCCOMSTR'}))
 __ex_uic_builder = SCons.Builder.Builder(
@@ -605,17 +662,14 @@ def Ts5(env, target, source=None, *args, **kw):
     except ValueError:
         pass
     
-    result = []
-    for t in target:
-        obj = __ts_builder.__call__(env, t, source, **kw)
-        # Prevent deletion of the .ts file, unless explicitly specified
-        if not clean_ts:
-            env.NoClean(obj)
-        # Always make our target "precious", such that it is not deleted
-        # prior to a rebuild
-        env.Precious(obj)
-        # Add to resulting target list        
-        result.extend(obj)
+    # A single lupdate run extracts the messages once for all targets.
+    result = __ts_builder.__call__(env, target, source, **kw)
+    # Prevent deletion of the .ts file, unless explicitly specified
+    if not clean_ts:
+        env.NoClean(result)
+    # Always make our target "precious", such that it is not deleted
+    # prior to a rebuild
+    env.Precious(result)
 
     return result
 
@@ -623,6 +677,10 @@ def Qm5(env, target, source=None, *args, **kw):
     """
     A pseudo-Builder wrapper around the LRELEASE executable of Qt5.
         lrelease [options] ts-files [-qm qm-file]
+    With one source per target, every target is released from the source
+    at the same position, and all of them by one action, see qmcatalog.
+    Otherwise every target is released from all the sources, by its own
+    lrelease run.
     """
     if not SCons.Util.is_List(target):
         target = [target]
@@ -631,9 +689,15 @@ def Qm5(env, target, source=None, *args, **kw):
     if not SCons.Util.is_List(source):
         source = [source]
 
-    result = []    
-    for t in target:
-        result.extend(__qm_builder.__call__(env, t, source, **kw))
+    if len(target) != len(source):
+        result = []
+        for t in target:
+            result.extend(__qm_merge_builder.__call__(env, t, source, **kw))
+        return result
+
+    result = __qm_builder.__call__(env, target, source, **kw)
+    # Unchanged catalogs are not released again, so keep them.
+    env.Precious(result)
 
     return result
 
@@ -655,6 +719,31 @@ def Qrc5(env, target, source=None, *args, **kw):
 
     return result
 
+def QrcShards5(env, source, shards, *args, **kw):
+    """
+    Splits the .qrc source into shards (see rccshard) in the current
+    directory and compiles each of them with the RCC executable of Qt5.
+    Returns the generated C++ files.
+    """
+    result = []
+    for qrc in rccshard.write_shards(env, env.File(source), shards,
+                                     env.Dir('.')):
+        result.extend(__qrc_builder.__call__(env, None, qrc, **kw))
+
+    return result
+
+def RccBinary5(env, source, shards=1, *args, **kw):
+    """
+    Like QrcShards5, but builds binary resource bundles (rcc -binary) that
+    are registered at runtime with QResource::registerResource().
+    """
+    result = []
+    for qrc in rccshard.write_shards(env, env.File(source), shards,
+                                     env.Dir('.')):
+        result.extend(__rcc_binary_builder.__call__(env, None, qrc, **kw))
+
+    return result
+
 def ExplicitMoc5(env, target, source, *args, **kw):
     """
     A pseudo-Builder wrapper around the MOC executable of Qt5.
@@ -733,11 +822,13 @@ def generate(env):
 
         QT5_AUTOSCAN = 1, # Should the qt5 tool try to figure out, which sources are to be moc'ed?
         QT5_AUTOSCAN_STRATEGY = 0, # While scanning for files to moc, should we search for includes in qtsolutions style?
-        QT5_GOBBLECOMMENTS = 0, # If set to 1, comments are removed before scanning cxx/h files.
+        QT5_GOBBLECOMMENTS = 0, # Unused, comments are always skipped when scanning cxx/h files.
         QT5_CPPDEFINES_PASSTOMOC = 1, # If set to 1, all CPPDEFINES get passed to the moc executable.
         QT5_CLEAN_TS = 0, # If set to 1, translation files (.ts) get cleaned on 'scons -c'
         QT5_AUTOMOC_SCANCPPPATH = 1, # If set to 1, the CPPPATHs (or QT5_AUTOMOC_CPPPATH) get scanned for moc'able files
         QT5_AUTOMOC_CPPPATH = [], # Alternative paths that get scanned for moc files
+        QT5_MOCSBATCH = 0, # If set to N > 0, the moc'ed headers get compiled in mocs_compilation units of N files
+        QT5_MOCSCOMSTR = 'Generating $TARGET',
 
         # Some Qt5 specific flags. I don't expect someone wants to
         # manipulate those ...
@@ -760,6 +851,7 @@ def generate(env):
         QT5_QRCSUFFIX = '.qrc',
         QT5_QRCCXXSUFFIX = '$CXXFILESUFFIX',
         QT5_QRCCXXPREFIX = 'qrc_',
+        QT5_RCCBINARYSUFFIX = '.rcc',
         QT5_MOCDEFPREFIX = '-D',
         QT5_MOCDEFSUFFIX = '',
         QT5_MOCDEFINES = '${_defines(QT5_MOCDEFPREFIX, CPPDEFINES, QT5_MOCDEFSUFFIX, __env__)}',
@@ -768,8 +860,9 @@ def generate(env):
 
         # Commands for the qt5 support ...
         QT5_UICCOM = '$QT5_UIC $QT5_UICFLAGS -o $TARGET $SOURCE',
-        QT5_LUPDATECOM = '$QT5_LUPDATE $QT5_LUPDATEFLAGS $SOURCES -ts $TARGET',
+        QT5_LUPDATECOM = '$QT5_LUPDATE $QT5_LUPDATEFLAGS $SOURCES -ts $TARGETS',
         QT5_LRELEASECOM = '$QT5_LRELEASE $QT5_LRELEASEFLAGS -qm $TARGET $SOURCES',
+        QT5_RCCBINARYCOM = '$QT5_RCC $QT5_QRCFLAGS -binary $SOURCE -o $TARGET',
         
         # Specialized variables for the Extended Automoc support
         # (Strategy #1 for qtsolutions)
@@ -784,20 +877,29 @@ def generate(env):
         env.AddMethod(Ts5, "Ts5")
         env.AddMethod(Qm5, "Qm5")
         env.AddMethod(Qrc5, "Qrc5")
+        env.AddMethod(QrcShards5, "QrcShards5")
+        env.AddMethod(RccBinary5, "RccBinary5")
         env.AddMethod(ExplicitMoc5, "ExplicitMoc5")
         env.AddMethod(ExplicitUic5, "ExplicitUic5")
+        env.AddMethod(uiccache.UicFanout, "UicFanout")
     except AttributeError:
         # Looks like we use a pre-0.98 version of SCons...
         from SCons.Script.SConscript import SConsEnvironment
         SConsEnvironment.Ts5 = Ts5
         SConsEnvironment.Qm5 = Qm5
         SConsEnvironment.Qrc5 = Qrc5
+        SConsEnvironment.QrcShards5 = QrcShards5
+        SConsEnvironment.RccBinary5 = RccBinary5
         SConsEnvironment.ExplicitMoc5 = ExplicitMoc5
         SConsEnvironment.ExplicitUic5 = ExplicitUic5
+        SConsEnvironment.UicFanout = uiccache.UicFanout
 
     # Interface builder
+    # Outputs are cached by content and only written when they change, see
+    # uiccache.
     uic5builder = Builder(
-        action = SCons.Action.Action('$QT5_UICCOM', '$QT5_UICCOMSTR'),
+        action = uiccache.action('QT5'),
+        emitter = uiccache.emitter('QT5'),
         src_suffix='$QT5_UISUFFIX',
         suffix='$QT5_UICDECLSUFFIX',
         prefix='$QT5_UICDECLPREFIX',
@@ -807,7 +909,9 @@ def generate(env):
     env['BUILDERS']['Uic5'] = uic5builder
 
     # Metaobject builder
-    mocBld = Builder(action={}, prefix={}, suffix={})
+    # moc does not wait for the uic output the sources include, see uiccache.
+    mocBld = Builder(action={}, prefix={}, suffix={},
+                     source_scanner=uiccache.moc_scanner)
     for h in header_extensions:
         act = SCons.Action.CommandGeneratorAction(__moc_generator_from_h, {'cmdstr':'$QT5_MOCCOMSTR'})    
         mocBld.add_action(h, act)
@@ -822,7 +926,8 @@ def generate(env):
 
     # Metaobject builder for the extended auto scan feature 
     # (Strategy #1 for qtsolutions)
-    xMocBld = Builder(action={}, prefix={}, suffix={})
+    xMocBld = Builder(action={}, prefix={}, suffix={},
+                      source_scanner=uiccache.moc_scanner)
     for h in header_extensions:
         act = SCons.Action.CommandGeneratorAction(__mocx_generator_from_h, {'cmdstr':'$QT5_MOCCOMSTR'})
         xMocBld.add_action(h, act)
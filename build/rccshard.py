@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Splits .qrc files into shards for the QrcShards and RccBinary builders of
+the qt4 and qt5 tools.
+
+rcc compiles a .qrc into a single C++ file that embeds all its resources.
+For res/mixxx.qrc that file is huge, slow to compile and rebuilt in full
+whenever any image changes. write_shards splits the resources into N .qrc
+files that rcc compiles separately, and in parallel. A resource is assigned
+to a shard by a hash of its resource path, so adding or removing resources
+does not move the others and an edited file only rebuilds its own shard.
+
+The shards keep the prefixes, languages and resource paths of the original,
+so nothing changes at runtime. Directories are expanded (with the directory
+index of qrcscan) so that their files are spread over the shards as well.
+"""
+
+import os
+import xml.etree.ElementTree as ElementTree
+import zlib
+from xml.sax.saxutils import escape, quoteattr
+
+import qrcscan
+import util
+
+
+def _resource_path(path):
+    return path.replace(os.sep, '/')
+
+
+def read_resources(path, index):
+    """Returns [(prefix, lang, [(resource path, file)])] for the <qresource>
+    elements of the .qrc at path. The files are relative to the .qrc."""
+    basepath = os.path.dirname(path)
+    resources = []
+    for qresource in ElementTree.parse(path).getroot().findall('qresource'):
+        files = []
+        for element in qresource.findall('file'):
+            if not element.text:
+                continue
+            entry = element.text.strip()
+            alias = element.get('alias', entry)
+            if not os.path.isdir(os.path.join(basepath, entry)):
+                files.append((alias, entry))
+                continue
+            # rcc skips hidden files when it includes a directory.
+            for item in index.files_below(basepath, entry):
+                if os.path.basename(item).startswith('.'):
+                    continue
+                relative = os.path.relpath(item, entry)
+                files.append((alias.rstrip('/') + '/' +
+                              _resource_path(relative), item))
+        resources.append((qresource.get('prefix', '/'),
+                          qresource.get('lang'), sorted(files)))
+    return resources
+
+
+def shard_of(resource_path, shards):
+    return (zlib.crc32(resource_path) & 0xffffffff) % shards
+
+
+def _format_qrc(resources):
+    lines = ['<!DOCTYPE RCC><RCC version="1.0">']
+    for prefix, lang, files in resources:
+        attributes = ' prefix=%s' % quoteattr(prefix)
+        if lang is not None:
+            attributes += ' lang=%s' % quoteattr(lang)
+        lines.append('<qresource%s>' % attributes)
+        for alias, path in files:
+            lines.append('    <file alias=%s>%s</file>' % (
+                quoteattr(alias), escape(_resource_path(path))))
+        lines.append('</qresource>')
+    lines.append('</RCC>')
+    return '\n'.join(lines) + '\n'
+
+
+def write_shards(env, qrc, shards, directory):
+    """Splits the .qrc node qrc into shards .qrc files named
+    <name>_shard<i>.qrc in the directory node directory and returns their
+    paths. Only shards whose contents changed are written."""
+    path = qrc.srcnode().rfile().abspath
+    name = os.path.splitext(os.path.basename(path))[0]
+    target_dir = directory.abspath
+    if not os.path.isdir(target_dir):
+        os.makedirs(target_dir)
+    # The files are relative to the .qrc, rcc resolves them relative to the
+    # shard.
+    basepath = os.path.relpath(os.path.dirname(path), target_dir)
+
+    shard_resources = [[] for _ in xrange(shards)]
+    for prefix, lang, files in read_resources(path, qrcscan.get_index(env)):
+        assigned = [[] for _ in xrange(shards)]
+        for alias, entry in files:
+            assigned[shard_of(alias, shards)].append(
+                (alias, os.path.join(basepath, entry)))
+        for resources, shard_files in zip(shard_resources, assigned):
+            if shard_files:
+                resources.append((prefix, lang, shard_files))
+
+    paths = []
+    for i, resources in enumerate(shard_resources):
+        shard_path = os.path.join(target_dir, '%s_shard%d.qrc' % (name, i))
+        util.write_if_changed(shard_path, _format_qrc(resources))
+        paths.append(shard_path)
+    return paths
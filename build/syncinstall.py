@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Incremental installs of resource trees for "scons install".
+
+InstallTree installs files and directory trees into a directory like
+env.Install, but keeps a manifest of what it installed there: the path,
+size and SHA-1 of every file, and the size and mtime the installed copy had.
+A later run only installs the files whose contents changed or whose
+installed copy was touched, on a pool of worker threads, and removes the
+files that are no longer among the sources. The SHA-1 of a source file is
+only recomputed when its mtime or size changes, so an install with nothing
+to do only looks at the files.
+
+Files are cloned (reflinked) where the file system supports it and copied
+otherwise. With install_link=hardlink they are hard linked if cloning fails
+and the destination is on the same file system, which is the fastest but
+makes the installed files the source files: a change to either changes
+both. install_link=copy always copies.
+"""
+
+import cPickle as pickle
+import errno
+import hashlib
+import multiprocessing.pool
+import os
+import shutil
+
+import SCons.Action
+import SCons.Errors
+
+import util
+
+MANIFEST_DIR = 'install'
+HASH_FILE = 'install_hashes'
+# ioctl of Linux that makes a file share the extents of another one.
+FICLONE = 0x40049409
+
+LINK_METHODS = {
+    'hardlink': ('reflink', 'hardlink', 'copy'),
+    'reflink': ('reflink', 'copy'),
+    'copy': ('copy',),
+}
+
+
+def _load(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+        return {}
+
+
+def _save(path, data):
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError):
+        pass
+
+
+def _sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), ''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _sources(nodes):
+    """Returns {path relative to the install directory: source path} for
+    the files and directory trees nodes."""
+    files = {}
+    for node in nodes:
+        path = node.abspath
+        if os.path.isdir(path):
+            parent = os.path.dirname(path)
+            for root, dirs, names in os.walk(path):
+                for name in names:
+                    source = os.path.join(root, name)
+                    files[os.path.relpath(source, parent)] = source
+        else:
+            files[os.path.basename(path)] = path
+    return files
+
+
+def _reflink(source, target):
+    # There is no fcntl on Windows; install_file then copies instead.
+    import fcntl
+    with open(source, 'rb') as src:
+        with open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(source, target)
+
+
+def install_file(source, target, methods):
+    """Installs source as target with the first of methods that works and
+    returns its name."""
+    if os.path.lexists(target):
+        os.remove(target)
+    for method in methods:
+        try:
+            if method == 'reflink':
+                _reflink(source, target)
+            elif method == 'hardlink':
+                os.link(source, target)
+            else:
+                shutil.copy2(source, target)
+            return method
+        except (IOError, OSError, ImportError):
+            if method == 'copy':
+                raise
+            if os.path.lexists(target):
+                os.remove(target)
+    return None
+
+
+def sync_install(target, source, env):
+    install_dir = env['INSTALL_TREE_DIR']
+    methods = LINK_METHODS[env['INSTALL_TREE_LINK']]
+    hashes_path = os.path.join(env['CACHEDIR'], HASH_FILE)
+    # source path -> (size, mtime, sha1)
+    hashes = _load(hashes_path)
+    # path relative to install_dir -> (size, sha1, installed size and mtime)
+    manifest = _load(target[0].abspath)
+
+    files = _sources(source)
+    entries = {}
+    changed = []
+    hashes_changed = False
+    for path, source_path in files.iteritems():
+        st = os.stat(source_path)
+        cached = hashes.get(source_path)
+        if cached is None or cached[:2] != (st.st_size, st.st_mtime):
+            cached = (st.st_size, st.st_mtime, _sha1(source_path))
+            hashes[source_path] = cached
+            hashes_changed = True
+        entry = (st.st_size, cached[2])
+        old = manifest.get(path)
+        try:
+            installed = os.stat(os.path.join(install_dir, path))
+            installed = (installed.st_size, installed.st_mtime)
+        except OSError:
+            installed = None
+        if old is not None and old[:2] == entry and old[2] == installed:
+            entries[path] = old
+        else:
+            entries[path] = entry
+            changed.append(path)
+    if hashes_changed:
+        _save(hashes_path, hashes)
+
+    removed = [path for path in manifest if path not in files]
+    for path in removed:
+        installed = os.path.join(install_dir, path)
+        if os.path.lexists(installed):
+            os.remove(installed)
+        # Remove the directories this leaves empty.
+        directory = os.path.dirname(installed)
+        while directory.startswith(install_dir + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+    for directory in set(os.path.dirname(os.path.join(install_dir, path))
+                         for path in changed):
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def install(path):
+        installed = os.path.join(install_dir, path)
+        method = install_file(files[path], installed, methods)
+        st = os.stat(installed)
+        return method, (st.st_size, st.st_mtime)
+
+    results = []
+    if changed:
+        pool = multiprocessing.pool.ThreadPool(util.workers(len(changed)))
+        try:
+            results = pool.map(install, changed)
+        finally:
+            pool.close()
+            pool.join()
+    counts = {}
+    for path, (method, installed) in zip(changed, results):
+        entries[path] = entries[path] + (installed,)
+        counts[method] = counts.get(method, 0) + 1
+
+    manifest_dir = os.path.dirname(target[0].abspath)
+    if not os.path.isdir(manifest_dir):
+        os.makedirs(manifest_dir)
+    _save(target[0].abspath, entries)
+    print "%s: %d of %d files installed%s, %d removed" % (
+        install_dir, len(changed), len(files),
+        ' (%s)' % ', '.join('%d %s' % (count, method) for method, count
+                            in sorted(counts.iteritems()))
+        if counts else '', len(removed))
+    return 0
+
+
+def sync_install_string(target, source, env):
+    return 'Install tree: "%s"' % env['INSTALL_TREE_DIR']
+
+
+def InstallTree(env, directory, source, link='reflink'):
+    """Installs the files and directory trees source into directory, like
+    env.Install. link is one of LINK_METHODS."""
+    if link not in LINK_METHODS:
+        raise SCons.Errors.UserError('install_link must be one of %s' %
+                                     ', '.join(sorted(LINK_METHODS)))
+    install_dir = env.Dir(directory).abspath
+    manifest = os.path.join(
+        env['CACHEDIR'], MANIFEST_DIR,
+        hashlib.sha1(install_dir).hexdigest()[:16] + '.manifest')
+    result = env.Command(manifest, source,
+                         SCons.Action.Action(sync_install,
+                                             sync_install_string),
+                         INSTALL_TREE_DIR=install_dir,
+                         INSTALL_TREE_LINK=link)
+    # It is cheap when nothing changed, and also repairs the installed
+    # files when they were changed or removed. The manifest is read before
+    # it is rewritten, so SCons must not remove it.
+    env.AlwaysBuild(result)
+    env.Precious(result)
+    return result
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Tests of the build scripts. Run them from the top of the tree with
+
+    python -m unittest discover -s build/tests -t .
+
+The build modules import each other as top-level modules, like SCons tools
+do, so build/ and build/osx/ are put on sys.path here. Tests of modules that
+need SCons are skipped when it cannot be imported.
+"""
+
+import os
+import sys
+
+BUILD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for directory in (BUILD_DIR, os.path.join(BUILD_DIR, 'osx')):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+
+def fixture(*path):
+    """Returns the path of a file in build/tests/fixtures, see
+    fixtures/make_fixtures.py."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fixtures', *path)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""Writes the fixture binaries of the build script tests.
+
+There are no Apple or Windows tools here, so the Mach-O and PE fixtures are
+put together from their file formats, with just the load commands and
+import directories the readers look at. pe/cli-32.exe and pe/cli-64.exe are
+real executables: the launchers of setuptools 70.3 (MIT license) built with
+MSVC. Run it from the top of the tree
+after changing it and check in the files it writes:
+
+    python build/tests/fixtures/make_fixtures.py
+"""
+
+import os
+import struct
+import subprocess
+import tempfile
+
+FIXTURES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MH_MAGIC = 0xfeedface
+MH_MAGIC_64 = 0xfeedfacf
+MH_EXECUTE = 2
+MH_DYLIB = 6
+FAT_MAGIC = 0xcafebabe
+LC_LOAD_DYLIB = 0xc
+LC_ID_DYLIB = 0xd
+LC_LOAD_WEAK_DYLIB = 0x80000018
+LC_RPATH = 0x8000001c
+LC_REEXPORT_DYLIB = 0x8000001f
+
+
+def macho_thin(filetype, commands, bits=64, endian='<'):
+    """Returns a Mach-O with the load commands [(cmd, string)]."""
+    body = ''
+    for cmd, name in commands:
+        header_size = 12 if cmd == LC_RPATH else 24
+        payload = name + '\0'
+        size = (header_size + len(payload) + 7) & ~7
+        body += struct.pack(endian + 'III', cmd, size, header_size)
+        if header_size == 24:
+            # Timestamp, current and compatibility version of a dylib.
+            body += struct.pack(endian + 'III', 2, 0x10000, 0x10000)
+        body += payload.ljust(size - header_size, '\0')
+    magic = MH_MAGIC_64 if bits == 64 else MH_MAGIC
+    header = struct.pack(endian + 'IiiIIII', magic, 7, 3, filetype,
+                         len(commands), len(body), 0)
+    if bits == 64:
+        header += struct.pack(endian + 'I', 0)
+    return header + body
+
+
+def macho_fat(thins):
+    """Returns a universal binary of the Mach-O files thins."""
+    header = struct.pack('>II', FAT_MAGIC, len(thins))
+    offset = 4096
+    data = ''
+    for thin in thins:
+        header += struct.pack('>iiIII', 7, 3, offset + len(data), len(thin),
+                              12)
+        data += thin.ljust(4096, '\0')
+    return header.ljust(offset, '\0') + data
+
+
+MACHO_FIXTURES = {
+    # A library that references another one by an unqualified name.
+    'libfoo.dylib': macho_thin(MH_DYLIB, [
+        (LC_ID_DYLIB, '/usr/local/lib/libfoo.dylib'),
+        (LC_LOAD_DYLIB, 'libbar.dylib'),
+        (LC_RPATH, '@loader_path/../lib')]),
+    'libbar.dylib': macho_thin(MH_DYLIB, [
+        (LC_ID_DYLIB, 'libbar.dylib'),
+        (LC_LOAD_DYLIB, 'libbar.dylib')]),
+    # A big-endian 32-bit program (PowerPC).
+    'program': macho_thin(MH_EXECUTE, [
+        (LC_LOAD_DYLIB, 'libfoo.dylib'),
+        (LC_LOAD_WEAK_DYLIB, 'libbar.dylib')], bits=32, endian='>'),
+    # i386 and x86_64 that reference the same library.
+    'universal': macho_fat([
+        macho_thin(MH_EXECUTE, [(LC_LOAD_DYLIB, '/a.dylib')], bits=32),
+        macho_thin(MH_EXECUTE, [(LC_LOAD_DYLIB, '/a.dylib'),
+                                (LC_REEXPORT_DYLIB, '@rpath/QtCore')])]),
+}
+
+
+PE32 = 0x10b
+PE32_PLUS = 0x20b
+IMAGE_DIRECTORY_ENTRY_IMPORT = 1
+IMAGE_DIRECTORY_ENTRY_DELAY_IMPORT = 13
+
+
+def pe(imports, delay_imports=(), bits=32):
+    """Returns a PE file with a single section that holds the import
+    directories for the DLL names imports and delay_imports."""
+    section_rva = 0x1000
+    section_offset = 0x200
+    # Names first, then the descriptors.
+    strings = ''
+    name_rvas = []
+    for name in list(imports) + list(delay_imports):
+        name_rvas.append(section_rva + len(strings))
+        strings += name + '\0'
+    strings = strings.ljust((len(strings) + 3) & ~3, '\0')
+    import_rva = section_rva + len(strings)
+    descriptors = ''
+    for rva in name_rvas[:len(imports)]:
+        descriptors += struct.pack('<IIIII', 0, 0, 0, rva, 0x2000)
+    descriptors += '\0' * 20
+    delay_rva = section_rva + len(strings) + len(descriptors)
+    delays = ''
+    for rva in name_rvas[len(imports):]:
+        delays += struct.pack('<II24x', 1, rva)
+    delays += '\0' * 32
+    section = strings + descriptors + delays
+
+    if bits == 32:
+        optional = struct.pack('<H26xI60xI', PE32, 0x400000, 16)
+    else:
+        optional = struct.pack('<H22xQ76xI', PE32_PLUS, 0x140000000, 16)
+    entries = [(0, 0)] * 16
+    entries[IMAGE_DIRECTORY_ENTRY_IMPORT] = (import_rva, len(descriptors))
+    if delay_imports:
+        entries[IMAGE_DIRECTORY_ENTRY_DELAY_IMPORT] = (delay_rva, len(delays))
+    for rva, size in entries:
+        optional += struct.pack('<II', rva, size)
+    headers = 'MZ'.ljust(0x3c, '\0') + struct.pack('<I', 0x40)
+    headers += 'PE\0\0' + struct.pack('<HHIIIHH', 0x14c, 1, 0, 0, 0,
+                                       len(optional), 0x2102)
+    headers += optional
+    headers += struct.pack('<8sIIIIIIHHI', '.idata', len(section),
+                           section_rva, len(section), section_offset,
+                           0, 0, 0, 0, 0xc0000040)
+    return headers.ljust(section_offset, '\0') + section
+
+
+PE_FIXTURES = {
+    # Names differ from the files in case, and appear twice.
+    'app.exe': pe(['KERNEL32.dll', 'FIXTURE.DLL', 'kernel32.dll']),
+    'Fixture.dll': pe(['msvcrt.dll'], ['fixture-dep.dll'], bits=64),
+    'fixture-dep.dll': pe(['Fixture.dll']),
+}
+
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_STRSZ = 10
+DT_SONAME = 14
+DT_RUNPATH = 29
+PT_LOAD = 1
+PT_DYNAMIC = 2
+
+
+def elf(needed, soname=None, runpath=None, elfclass=2, endian='<'):
+    """Returns an ELF shared object with just a dynamic section."""
+    strings = '\0'
+    offsets = {}
+    for string in list(needed) + [soname, runpath]:
+        if string is not None and string not in offsets:
+            offsets[string] = len(strings)
+            strings += string + '\0'
+    entries = [(DT_NEEDED, offsets[name]) for name in needed]
+    if soname is not None:
+        entries.append((DT_SONAME, offsets[soname]))
+    if runpath is not None:
+        entries.append((DT_RUNPATH, offsets[runpath]))
+    if elfclass == 1:
+        header_size, phentsize, dynamic_entry = 52, 32, endian + 'iI'
+    else:
+        header_size, phentsize, dynamic_entry = 64, 56, endian + 'qQ'
+    phoff = header_size
+    strtab_offset = phoff + 2 * phentsize
+    dynamic_offset = strtab_offset + ((len(strings) + 7) & ~7)
+    # The strings are loaded at 0x1000 above their file offset.
+    base = 0x1000
+    entries.append((DT_STRTAB, base + strtab_offset))
+    entries.append((DT_STRSZ, len(strings)))
+    entries.append((DT_NULL, 0))
+    dynamic = ''.join(struct.pack(dynamic_entry, tag, value)
+                      for tag, value in entries)
+    size = dynamic_offset + len(dynamic)
+    ident = '\x7fELF' + chr(elfclass) + chr(1 if endian == '<' else 2) + \
+        '\x01'
+    ident = ident.ljust(16, '\0')
+    if elfclass == 1:
+        header = ident + struct.pack(endian + 'HHIIIIIHHHHHH', 3, 3, 1, 0,
+                                     phoff, 0, 0, header_size, phentsize, 2,
+                                     40, 0, 0)
+        headers = struct.pack(endian + 'IIIIIIII', PT_LOAD, 0, base, base,
+                              size, size, 4, 0x1000)
+        headers += struct.pack(endian + 'IIIIIIII', PT_DYNAMIC,
+                               dynamic_offset, base + dynamic_offset, 0,
+                               len(dynamic), len(dynamic), 6, 4)
+    else:
+        header = ident + struct.pack(endian + 'HHIQQQIHHHHHH', 3, 62, 1, 0,
+                                     phoff, 0, 0, header_size, phentsize, 2,
+                                     64, 0, 0)
+        headers = struct.pack(endian + 'IIQQQQQQ', PT_LOAD, 4, 0, base, base,
+                              size, size, 0x1000)
+        headers += struct.pack(endian + 'IIQQQQQQ', PT_DYNAMIC, 6,
+                               dynamic_offset, base + dynamic_offset, 0,
+                               len(dynamic), len(dynamic), 8)
+    data = header + headers + strings
+    return data.ljust(dynamic_offset, '\0') + dynamic
+
+
+ELF_FIXTURES = {
+    # A big-endian 32-bit library (e.g. PowerPC).
+    'libbig-endian.so.1': elf(['libsndfile.so.1'], elfclass=1, endian='>'),
+}
+
+# Linked with the gcc and ld of an x86_64 Linux system: bin/program needs
+# lib/libfixture.so.1 through its DT_RPATH, which needs lib/libfixture-dep.so.1
+# through its DT_RUNPATH, which needs libmissing.so.1, which is not there.
+GCC = ['gcc', '-nostdlib', '-s', '-Wl,--no-as-needed',
+       '-Wl,-z,max-page-size=0x1000', '-Wl,--hash-style=gnu',
+       '-Wl,--build-id=none', '-Wl,-rpath-link,.']
+ELF_LINKS = [
+    ('libmissing.so.1', ['-shared', '-Wl,-soname,libmissing.so.1']),
+    ('lib/libfixture-dep.so.1', ['-shared', '-Wl,-soname,libfixture-dep.so.1',
+                                 'libmissing.so.1']),
+    ('lib/libfixture.so.1', ['-shared', '-Wl,-soname,libfixture.so.1',
+                             '-Wl,--enable-new-dtags',
+                             '-Wl,-rpath,$ORIGIN:/opt/qt/lib',
+                             'lib/libfixture-dep.so.1']),
+    ('bin/program', ['-Wl,-e,0', '-Wl,--disable-new-dtags',
+                     '-Wl,-rpath,$ORIGIN/../lib', 'lib/libfixture.so.1',
+                     '-lc']),
+]
+
+
+def link_elf_fixtures(directory):
+    directory = os.path.join(FIXTURES_DIR, directory)
+    source = tempfile.NamedTemporaryFile(suffix='.c')
+    source.write('int fixture;\n')
+    source.flush()
+    for path, args in ELF_LINKS:
+        if not os.path.isdir(os.path.join(directory, os.path.dirname(path))):
+            os.makedirs(os.path.join(directory, os.path.dirname(path)))
+        subprocess.check_call(GCC + ['-o', path, source.name] + args,
+                              cwd=directory)
+    os.remove(os.path.join(directory, 'libmissing.so.1'))
+
+
+def write(directory, fixtures):
+    directory = os.path.join(FIXTURES_DIR, directory)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name, data in sorted(fixtures.iteritems()):
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(data)
+
+
+if __name__ == '__main__':
+    write('macho', MACHO_FIXTURES)
+    write('pe', PE_FIXTURES)
+    write('elf', ELF_FIXTURES)
+    link_elf_fixtures('elf')
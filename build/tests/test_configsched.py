@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Checks that configuring with forked workers leaves the environment exactly
+as the serial walk of SConscript.env does."""
+
+import shutil
+import tempfile
+import unittest
+
+try:
+    import SCons.SConf
+    import SCons.Util
+    import configcache
+    import configsched
+except ImportError:
+    configsched = None
+
+
+class FakeEnvironment(object):
+    """The parts of a SCons Environment that configure() and the configure
+    cache use."""
+
+    def __init__(self):
+        self._dict = {'ENV': {}, 'CPPPATH': [], 'CPPDEFINES': [], 'LIBS': []}
+
+    def Dictionary(self):
+        return self._dict
+
+    def __getitem__(self, key):
+        return self._dict[key]
+
+    def __setitem__(self, key, value):
+        self._dict[key] = value
+
+    def __delitem__(self, key):
+        del self._dict[key]
+
+    def get(self, key, default=None):
+        return self._dict.get(key, default)
+
+    def Append(self, **values):
+        for key, value in values.iteritems():
+            self._dict[key] = self._dict.get(key, []) + value
+
+    def subst(self, string):
+        return '' if string.startswith('$') else string
+
+    def ParseConfig(self, command):
+        pass
+
+
+class FakeBuild(object):
+
+    def __init__(self, cache_dir):
+        self.env = FakeEnvironment()
+        self.flags = {}
+        self.platform = self.machine = self.build = self.toolchain = 'test'
+        self.crosscompile = self.static_dependencies = False
+        self.cache_dir = cache_dir
+
+    def get_cache_dir(self):
+        return self.cache_dir
+
+
+class FakeConf(object):
+    logstream = None
+
+
+# Names of the dependencies configured in-process, i.e. not in a worker.
+configured = []
+
+
+class Dependency(object):
+
+    def __init__(self):
+        self.name = self.__class__.__name__
+
+    def depends(self, build):
+        return []
+
+    def enabled(self, build):
+        return True
+
+    def configure(self, build, conf):
+        configured.append(self.name)
+
+
+class Headers(Dependency):
+
+    def configure(self, build, conf):
+        Dependency.configure(self, build, conf)
+        build.env.Append(CPPPATH=['/opt/headers/include'])
+
+
+class Probe(Dependency):
+    """Finds a different result depending on whether Headers, a sibling
+    that precedes it, was configured."""
+
+    def configure(self, build, conf):
+        Dependency.configure(self, build, conf)
+        if '/opt/headers/include' in build.env['CPPPATH']:
+            build.env.Append(CPPDEFINES=['__PROBE_FOUND__'])
+        else:
+            build.env.Append(LIBS=['probe-fallback'])
+
+
+class Library(Dependency):
+
+    def configure(self, build, conf):
+        Dependency.configure(self, build, conf)
+        build.env.Append(LIBS=['library'])
+        build.flags['library'] = 1
+
+
+class Core(Dependency):
+
+    def depends(self, build):
+        return [Headers, Library, Probe]
+
+    def configure(self, build, conf):
+        Dependency.configure(self, build, conf)
+        build.env.Append(CPPDEFINES=['__CORE__'])
+
+
+class Optional(Dependency):
+
+    def depends(self, build):
+        return [Probe]
+
+    def configure(self, build, conf):
+        Dependency.configure(self, build, conf)
+        build.env['OPTIONAL'] = str(len(build.env['LIBS']))
+
+
+def configure(build, jobs):
+    """Configures like SConscript.env with jobs workers. Returns the
+    snapshot of the environment and the flags."""
+    conf = FakeConf()
+    cache = configcache.ConfigureCache(build)
+    scheduler = configsched.ConfigureScheduler(build, conf, cache)
+    scheduler.jobs = jobs
+    features = [Core(), Optional()]
+    scheduler.prefetch(features)
+    visited = set()
+
+    def visit(dependency_class):
+        if dependency_class in visited:
+            return
+        visited.add(dependency_class)
+        dependency = dependency_class()
+        scheduler.configure(dependency, build, conf)
+        for sub_dependency in dependency.depends(build):
+            visit(sub_dependency)
+
+    for feature in features:
+        scheduler.configure(feature, build, conf)
+        if feature.enabled(build):
+            for dependency in feature.depends(build):
+                visit(dependency)
+    return configcache.snapshot_environment(build.env), build.flags
+
+
+@unittest.skipIf(configsched is None, 'SCons is not available')
+class ConfigureSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        del configured[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_parallel_environment_is_the_serial_one(self):
+        serial = configure(FakeBuild(self.cache_dir), 1)
+        self.assertEqual(configured, ['Core', 'Headers', 'Library', 'Probe',
+                                      'Optional'])
+        self.assertIn('__PROBE_FOUND__', serial[0]['CPPDEFINES'])
+        del configured[:]
+        parallel = configure(FakeBuild(self.cache_dir), 4)
+        self.assertEqual(parallel, serial)
+        # Every node was configured in a worker and its result applied.
+        self.assertEqual(configured, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from build.tests import fixture
+
+import elfdeps
+
+PROGRAM = fixture('elf', 'bin', 'program')
+LIBFIXTURE = fixture('elf', 'lib', 'libfixture.so.1')
+LIBFIXTURE_DEP = fixture('elf', 'lib', 'libfixture-dep.so.1')
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_program(self):
+        program = elfdeps.load(PROGRAM)
+        self.assertEqual(program.soname, None)
+        self.assertEqual(program.needed, ['libfixture.so.1', 'libc.so.6'])
+        self.assertEqual(program.rpath, ['$ORIGIN/../lib'])
+        self.assertEqual(program.runpath, None)
+
+    def test_library(self):
+        library = elfdeps.load(LIBFIXTURE)
+        self.assertEqual(library.soname, 'libfixture.so.1')
+        self.assertEqual(library.needed, ['libfixture-dep.so.1'])
+        self.assertEqual(library.rpath, None)
+        self.assertEqual(library.runpath, ['$ORIGIN', '/opt/qt/lib'])
+
+    def test_big_endian_32_bit(self):
+        library = elfdeps.load(fixture('elf', 'libbig-endian.so.1'))
+        self.assertEqual(library.elfclass, 1)
+        self.assertEqual(library.needed, ['libsndfile.so.1'])
+
+    def test_not_elf(self):
+        self.assertRaises(elfdeps.ElfError, elfdeps.parse, 'MZ\x90\0')
+        with open(LIBFIXTURE, 'rb') as f:
+            self.assertRaises(elfdeps.ElfError, elfdeps.parse, f.read(70))
+
+
+class ResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_closure(self):
+        resolver = elfdeps.Resolver(system=[])
+        self.assertEqual(resolver.closure([PROGRAM], PROGRAM), {
+            'libfixture.so.1': LIBFIXTURE,
+            'libfixture-dep.so.1': LIBFIXTURE_DEP,
+            'libmissing.so.1': None,
+        })
+
+    def test_search_order(self):
+        copy = os.path.join(self.temp_dir, 'libfixture-dep.so.1')
+        shutil.copy(LIBFIXTURE_DEP, copy)
+        shutil.copy(LIBFIXTURE, self.temp_dir)
+        resolver = elfdeps.Resolver(library_path=[self.temp_dir], system=[])
+        program = elfdeps.load(PROGRAM)
+        library = elfdeps.load(LIBFIXTURE)
+        # DT_RPATH comes before LD_LIBRARY_PATH, which comes before
+        # DT_RUNPATH.
+        self.assertEqual(resolver.resolve('libfixture.so.1', program,
+                                          program), (LIBFIXTURE, 1))
+        self.assertEqual(resolver.resolve('libfixture-dep.so.1', library,
+                                          program), (copy, 1))
+
+    def test_ld_so_conf(self):
+        conf = os.path.join(self.temp_dir, 'ld.so.conf')
+        os.mkdir(conf + '.d')
+        with open(conf, 'w') as f:
+            f.write('include ld.so.conf.d/*.conf\n/opt/lib # comment\n')
+        with open(os.path.join(conf + '.d', 'qt.conf'), 'w') as f:
+            f.write('/opt/qt/lib\nhwcap 0 nosegneg\n')
+        self.assertEqual(elfdeps.ld_so_conf(conf), ['/opt/qt/lib', '/opt/lib'])
+
+    def test_system_libraries(self):
+        self.assertTrue(elfdeps.is_system_library('libc.so.6'))
+        self.assertTrue(elfdeps.is_system_library('libxcb-xkb.so.1'))
+        self.assertFalse(elfdeps.is_system_library('libQt5Core.so.5'))
+
+
+if __name__ == '__main__':
+    unittest.main()
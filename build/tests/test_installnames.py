@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import installnames
+from installnames import INSTALL_NAME_TOOL
+
+LIBFOO = 'Frameworks/libfoo.dylib'
+PROGRAM = 'MacOS/mixxx'
+
+
+class Recorder(object):
+    """Stands in for install_name_tool and strip: records the commands and
+    fails those of the binaries in fail."""
+
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, args):
+        self.calls.append(list(args))
+        return 1 if args[-1] in self.fail else 0
+
+
+def plan():
+    plan = installnames.RewritePlan()
+    plan.change_id(LIBFOO, '@executable_path/../Frameworks/libfoo.dylib')
+    for _ in range(2):
+        plan.change_ref(LIBFOO, '/usr/local/lib/libbar.dylib',
+                        '@executable_path/../Frameworks/libbar.dylib')
+    plan.strip(LIBFOO, ['-S'])
+    plan.change_ref(PROGRAM, '/usr/local/lib/libfoo.dylib',
+                    '@executable_path/../Frameworks/libfoo.dylib')
+    plan.strip(PROGRAM)
+    return plan
+
+
+class RunTest(unittest.TestCase):
+
+    def test_one_install_name_tool_per_binary(self):
+        recorder = Recorder()
+        installnames.run(plan(), 2, recorder)
+        self.assertEqual(sorted(recorder.calls), sorted([
+            [INSTALL_NAME_TOOL,
+             '-id', '@executable_path/../Frameworks/libfoo.dylib',
+             '-change', '/usr/local/lib/libbar.dylib',
+             '@executable_path/../Frameworks/libbar.dylib', LIBFOO],
+            ['strip', '-S', LIBFOO],
+            [INSTALL_NAME_TOOL,
+             '-change', '/usr/local/lib/libfoo.dylib',
+             '@executable_path/../Frameworks/libfoo.dylib', PROGRAM],
+            ['strip', PROGRAM],
+        ]))
+        # The commands of a binary run in order.
+        for binary in (LIBFOO, PROGRAM):
+            calls = [args for args in recorder.calls if args[-1] == binary]
+            self.assertEqual([args[0] for args in calls],
+                             [INSTALL_NAME_TOOL, 'strip'])
+
+    def test_unbatched_count(self):
+        rewrites = plan()
+        self.assertEqual(rewrites.unbatched_count(LIBFOO), 3)
+        self.assertEqual(rewrites.unbatched_count(PROGRAM), 2)
+
+    def test_failures(self):
+        rewrites = installnames.RewritePlan()
+        rewrites.strip(PROGRAM, ['-S'])
+        # strip may fail.
+        installnames.run(rewrites, 1, Recorder(fail=[PROGRAM]))
+        rewrites.change_id(PROGRAM, '@executable_path/mixxx')
+        self.assertRaises(Exception, installnames.run, rewrites, 1,
+                          Recorder(fail=[PROGRAM]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+
+from build.tests import fixture
+
+import macho
+
+
+def read(name):
+    with open(fixture('macho', name), 'rb') as f:
+        return f.read()
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_library(self):
+        result = macho.parse(read('libfoo.dylib'))
+        self.assertEqual(result.id, '/usr/local/lib/libfoo.dylib')
+        self.assertEqual(result.dylibs, ['libbar.dylib'])
+        self.assertEqual(result.rpaths, ['@loader_path/../lib'])
+
+    def test_big_endian_program(self):
+        result = macho.parse(read('program'))
+        self.assertEqual(result.id, None)
+        self.assertEqual(result.dylibs, ['libfoo.dylib', 'libbar.dylib'])
+        self.assertEqual(result.rpaths, [])
+
+    def test_universal(self):
+        result = macho.parse(read('universal'))
+        self.assertEqual(result.dylibs, ['/a.dylib', '@rpath/QtCore'])
+
+    def test_not_macho(self):
+        self.assertRaises(macho.MachOError, macho.parse, '!<arch>\n')
+        self.assertRaises(macho.MachOError, macho.parse,
+                          read('libfoo.dylib')[:40])
+
+
+class LoadTest(unittest.TestCase):
+
+    def test_memoized_until_forgotten(self):
+        path = fixture('macho', 'libfoo.dylib')
+        first = macho.load(path)
+        self.assertIs(macho.load(path), first)
+        macho.forget(path)
+        self.assertIsNot(macho.load(path), first)
+
+
+class DependencyGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = fixture('macho')
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_closure(self):
+        graph = macho.DependencyGraph([self.directory], [])
+        self.assertEqual(graph.closure(self.path('program')),
+                         [('libbar.dylib', self.path('libbar.dylib')),
+                          ('libfoo.dylib', self.path('libfoo.dylib'))])
+        # A library does not depend on itself.
+        self.assertEqual(graph.dependencies(self.path('libbar.dylib')), [])
+
+    def test_system_libraries_are_not_bundled(self):
+        graph = macho.DependencyGraph([], [self.directory])
+        self.assertEqual(graph.closure(self.path('program')), [])
+
+    def test_unresolvable(self):
+        graph = macho.DependencyGraph([self.directory], [])
+        self.assertRaises(macho.MachOError, graph.resolve, '@rpath/QtCore')
+        self.assertRaises(macho.MachOError, graph.resolve, 'libmissing.dylib')
+
+
+if __name__ == '__main__':
+    unittest.main()
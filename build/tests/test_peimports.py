@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from build.tests import fixture
+
+import peimports
+
+# What the setuptools launchers, built with MSVC 2015 or later, import.
+LAUNCHER_IMPORTS = [
+    'KERNEL32.dll', 'VCRUNTIME140.dll', 'api-ms-win-crt-heap-l1-1-0.dll',
+    'api-ms-win-crt-filesystem-l1-1-0.dll',
+    'api-ms-win-crt-runtime-l1-1-0.dll', 'api-ms-win-crt-stdio-l1-1-0.dll',
+    'api-ms-win-crt-string-l1-1-0.dll', 'api-ms-win-crt-math-l1-1-0.dll',
+    'api-ms-win-crt-locale-l1-1-0.dll', 'api-ms-win-crt-process-l1-1-0.dll',
+]
+
+
+def read(name):
+    with open(fixture('pe', name), 'rb') as f:
+        return f.read()
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_msvc_executables(self):
+        self.assertEqual(peimports.parse(read('cli-32.exe')),
+                         LAUNCHER_IMPORTS)
+        self.assertEqual(peimports.parse(read('cli-64.exe')),
+                         LAUNCHER_IMPORTS)
+
+    def test_names_are_compared_without_case(self):
+        self.assertEqual(peimports.parse(read('app.exe')),
+                         ['KERNEL32.dll', 'FIXTURE.DLL'])
+
+    def test_delay_imports(self):
+        self.assertEqual(peimports.parse(read('Fixture.dll')),
+                         ['msvcrt.dll', 'fixture-dep.dll'])
+
+    def test_not_pe(self):
+        self.assertRaises(peimports.PEError, peimports.parse, '\x7fELF')
+        self.assertRaises(peimports.PEError, peimports.parse,
+                          read('app.exe')[:0x60])
+
+
+class ClosureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = peimports.ImportCache(os.path.join(self.temp_dir,
+                                                        'pe_imports'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_closure(self):
+        directory = fixture('pe')
+        dlls, missing = peimports.closure([fixture('pe', 'app.exe')],
+                                          [self.temp_dir, directory],
+                                          self.cache)
+        self.assertEqual(dlls, [os.path.join(directory, 'Fixture.dll'),
+                                os.path.join(directory, 'fixture-dep.dll')])
+        self.assertEqual(missing, ['KERNEL32.dll', 'msvcrt.dll'])
+
+    def test_cache(self):
+        path = fixture('pe', 'Fixture.dll')
+        imports = self.cache.get(path)
+        self.cache.save()
+        cache = peimports.ImportCache(self.cache.path)
+        self.assertEqual(cache.imports, {cache.hashes[path][2]: imports})
+        self.assertEqual(cache.get(path), imports)
+        self.assertFalse(cache.changed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import qobjectscan
+
+
+class ScanBufferTest(unittest.TestCase):
+
+    def assertScan(self, source, q_object, includes=()):
+        self.assertEqual(qobjectscan.scan_buffer(source),
+                         {'q_object': q_object, 'includes': list(includes)},
+                         repr(source))
+
+    def test_q_object(self):
+        self.assertScan('class A : public QObject {\n  Q_OBJECT\n};\n', True)
+        self.assertScan('Q_OBJECT', True)
+
+    def test_identifiers_containing_q_object(self):
+        self.assertScan('Q_OBJECTS MY_Q_OBJECT Q_OBJECT_FOO\n', False)
+
+    def test_comments(self):
+        self.assertScan('// Q_OBJECT\n', False)
+        self.assertScan('/* Q_OBJECT\n */\n', False)
+        self.assertScan('/* unterminated Q_OBJECT', False)
+        self.assertScan('// continued \\\n Q_OBJECT\n', False)
+
+    def test_literals(self):
+        self.assertScan('const char* s = "Q_OBJECT";\n', False)
+        self.assertScan('const char* s = "\\" Q_OBJECT";\n', False)
+        self.assertScan("char c = '\"'; Q_OBJECT\n", True)
+
+    def test_raw_strings(self):
+        self.assertScan('const char* s = R"(Q_OBJECT)";\n', False)
+        self.assertScan('const char* s = R"x(")" Q_OBJECT)x";\n', False)
+        self.assertScan('const char* s = u8R"(a)"; Q_OBJECT\n', True)
+
+    def test_disabled_blocks(self):
+        self.assertScan('#if 0\nQ_OBJECT\n#include "a.h"\n#endif\n', False)
+        self.assertScan('#if 0\n#ifdef X\n#endif\nQ_OBJECT\n#else\n'
+                        '#include "b.h"\n#endif\n', False, ['b.h'])
+        self.assertScan('#if 0\n#else\nQ_OBJECT\n#endif\n', True)
+        self.assertScan('#if 0\n#if 1\nQ_OBJECT\n#else\nQ_OBJECT\n#endif\n'
+                        '#endif\n', False)
+
+    def test_unknown_conditions_are_enabled(self):
+        self.assertScan('#ifdef FOO\nQ_OBJECT\n#endif\n', True)
+
+    def test_includes(self):
+        self.assertScan('#include "foo.h"\n  #  include "moc_foo.cpp"\n'
+                        '#include <QObject>\n', False,
+                        ['foo.h', 'moc_foo.cpp'])
+        self.assertScan('#include "foo.moc" // Q_OBJECT\n', False,
+                        ['foo.moc'])
+
+    def test_includes_in_literals_and_comments(self):
+        self.assertScan('#define X "#include \\"no.h\\""\n#include "yes.h"\n',
+                        False, ['yes.h'])
+        self.assertScan('f("\n#include \\"no.h\\"");\n', False)
+        self.assertScan('/*\n#include "no.h"\n*/\n#include "yes.h"\n', False,
+                        ['yes.h'])
+
+    def test_stops_at_the_first_q_object(self):
+        self.assertEqual(
+            qobjectscan.scan_buffer('Q_OBJECT\n#include "a.h"\n',
+                                    want_includes=False),
+            {'q_object': True, 'includes': []})
+
+
+class ScanFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, contents):
+        path = os.path.join(self.directory, 'file.h')
+        with open(path, 'wb') as f:
+            f.write(contents)
+        return path
+
+    def test_file(self):
+        path = self.write('#include "a.h"\nclass A {\n  Q_OBJECT\n};\n')
+        self.assertEqual(qobjectscan.scan_file(path),
+                         {'q_object': True, 'includes': ['a.h']})
+
+    def test_empty_file(self):
+        self.assertEqual(qobjectscan.scan_file(self.write('')),
+                         {'q_object': False, 'includes': []})
+
+    def test_missing_file(self):
+        self.assertRaises(IOError, qobjectscan.scan_file,
+                          os.path.join(self.directory, 'missing.h'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Measures how long the commands SCons spawns take.
+
+A CommandTimer wraps SPAWN and records the wall time of every successful
+command it selects, keyed by the file the command writes. At exit the times
+are merged into a pickle in cache/ under a mode (e.g. "pch" and "nopch"), so
+different configurations can be compared across runs.
+"""
+
+import atexit
+import cPickle as pickle
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# The peak resident set size (in kB) of the last command a measured spawn
+# (see measured_spawn) ran in this thread.
+usage = threading.local()
+
+
+def command_target(args):
+    """Returns the file a compiler or linker command line writes, if any."""
+    for index, arg in enumerate(args):
+        if arg == '-o' and index + 1 < len(args):
+            target = args[index + 1]
+        elif arg.startswith('/Fo'):
+            target = arg[len('/Fo'):]
+        elif arg.upper().startswith('/OUT:'):
+            target = arg[len('/OUT:'):]
+        else:
+            continue
+        return target.strip('"')
+    return None
+
+
+def is_compile(args):
+    return '-c' in args or '/c' in args
+
+
+def measured_spawn(spawn):
+    """Returns a SPAWN function that runs commands like SCons' POSIX spawn
+    but reaps them with wait4() to store their peak RSS in usage.peak_rss.
+    Returns spawn itself where wait4() is unavailable or if it already
+    measures (wrappers of a measured spawn set their measured attribute)."""
+    if getattr(spawn, 'measured', False) or not hasattr(os, 'wait4'):
+        return spawn
+
+    def spawn_measured(sh, escape, cmd, args, env):
+        usage.peak_rss = 0
+        try:
+            process = subprocess.Popen([sh, '-c', ' '.join(args)], env=env,
+                                       close_fds=True)
+        except OSError:
+            return 127
+        _, status, rusage = os.wait4(process.pid, 0)
+        # Keep Popen from waiting for the process again.
+        process.returncode = status
+        # ru_maxrss is in bytes on OS X and in kB elsewhere.
+        usage.peak_rss = rusage.ru_maxrss / 1024 \
+            if sys.platform == 'darwin' else rusage.ru_maxrss
+        if os.WIFSIGNALED(status):
+            return -os.WTERMSIG(status)
+        return os.WEXITSTATUS(status)
+    spawn_measured.measured = True
+    return spawn_measured
+
+
+class CommandTimer(object):
+    """Records the time of the commands for which select(args, target)
+    returns True."""
+
+    def __init__(self, path, mode, select):
+        self.path = path
+        self.mode = mode
+        self.select = select
+        self.times = {}
+        self.lock = threading.Lock()
+
+    def install(self, env):
+        spawn = env['SPAWN']
+
+        def timed_spawn(sh, escape, cmd, args, spawn_env):
+            start = time.time()
+            result = spawn(sh, escape, cmd, args, spawn_env)
+            target = command_target(args)
+            if result == 0 and target and self.select(args, target):
+                with self.lock:
+                    self.times[target] = time.time() - start
+            return result
+        env['SPAWN'] = timed_spawn
+        atexit.register(self.save)
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+            return {}
+
+    def save(self):
+        if not self.times:
+            return
+        timings = self.load()
+        timings.setdefault(self.mode, {}).update(self.times)
+        with open(self.path + '.tmp', 'wb') as f:
+            pickle.dump(timings, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(self.path + '.tmp', self.path)
+        self.times = {}
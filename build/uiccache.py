@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed uic for the Uic4 and Uic5 builders of the qt tools.
+
+The ui_*.h headers uic generates are included by many translation units. The
+outputs are kept in cache/uic, keyed by the contents of the .ui, the name of
+the form, the uic flags and the uic version, so a form uic has seen before
+(e.g. after switching branches back and forth) does not run uic again. A
+header is only written if its contents change, which leaves its timestamp
+alone otherwise.
+
+moc does not need the uic output a header includes, so the moc builders
+scan their sources with moc_scanner, which skips the headers generated here.
+That way moc runs in parallel with uic instead of waiting for it.
+
+"scons uic-fanout" reports which translation units include each generated
+header (see report_fanout), i.e. what editing a form costs to rebuild.
+"""
+
+import glob
+import hashlib
+import os
+import subprocess
+import tempfile
+
+import SCons.Action
+import SCons.Scanner
+import SCons.Scanner.C
+from SCons import Script
+
+CACHE_DIR = 'uic'
+# Outputs of older versions of a form that are kept in the cache.
+MAX_VERSIONS = 4
+
+# The absolute paths of all headers the Uic builders generate.
+outputs = set()
+
+_versions = {}
+
+
+def uic_version(uic, env):
+    """Returns the version string of the uic executable uic."""
+    if uic not in _versions:
+        try:
+            process = subprocess.Popen([uic, '-v'], stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT,
+                                       env=env['ENV'])
+            _versions[uic] = process.communicate()[0].strip()
+        except OSError:
+            _versions[uic] = ''
+    return _versions[uic]
+
+
+def _cache_dir(env):
+    path = os.path.join(env.get('CACHEDIR') or Script.Dir('#cache').abspath,
+                        CACHE_DIR)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+def _prune(cache_dir, form):
+    entries = sorted((os.path.getmtime(path), path) for path in
+                     glob.glob(os.path.join(cache_dir, form + '-*.h')))
+    for _, path in entries[:-MAX_VERSIONS]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class _Uic(object):
+    """The uic action for the tool with the variable prefix (QT4 or
+    QT5)."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def _command(self, env, output, source):
+        return [env.subst('$%s_UIC' % self.prefix)] + \
+            env.subst('$%s_UICFLAGS' % self.prefix).split() + \
+            ['-o', output, source]
+
+    def __call__(self, target, source, env):
+        ui = source[0].rfile().abspath
+        contents = _read(ui)
+        if contents is None:
+            print "Cannot read %s" % ui
+            return 1
+        form = os.path.splitext(source[0].name)[0]
+        uic = env.subst('$%s_UIC' % self.prefix)
+        key = hashlib.sha1('\0'.join([
+            contents, source[0].name, uic_version(uic, env),
+            env.subst('$%s_UICFLAGS' % self.prefix)])).hexdigest()
+        cache_dir = _cache_dir(env)
+        cached = os.path.join(cache_dir, '%s-%s.h' % (form, key))
+
+        output = _read(cached)
+        if output is None:
+            handle, temp_path = tempfile.mkstemp(suffix='.h', dir=cache_dir)
+            os.close(handle)
+            try:
+                result = subprocess.call(
+                    self._command(env, temp_path, source[0].abspath),
+                    env=env['ENV'])
+                if result != 0:
+                    return result
+                output = _read(temp_path)
+                os.rename(temp_path, cached)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            _prune(cache_dir, form)
+        else:
+            # Keep recently used outputs from being pruned.
+            os.utime(cached, None)
+
+        path = target[0].abspath
+        if _read(path) != output:
+            with open(path, 'wb') as f:
+                f.write(output)
+        return 0
+
+    def strfunction(self, target, source, env):
+        return ' '.join(self._command(env, str(target[0]), str(source[0])))
+
+
+def action(prefix):
+    """Returns the action of the Uic builder of the tool with the variable
+    prefix (QT4 or QT5)."""
+    return SCons.Action.Action(_Uic(prefix), '$%s_UICCOMSTR' % prefix,
+                               varlist=['%s_UIC' % prefix,
+                                        '%s_UICFLAGS' % prefix])
+
+
+def emitter(prefix):
+    """Returns the emitter of the Uic builder of the tool with the variable
+    prefix."""
+    def emit(target, source, env):
+        # The action leaves unchanged headers alone, so SCons must not
+        # remove them before it runs.
+        env.Precious(target)
+        for node in target:
+            outputs.add(node.abspath)
+        # A different uic may generate different code.
+        uic = env.WhereIs(env.subst('$%s_UIC' % prefix))
+        if uic:
+            env.Depends(target, uic)
+        return target, source
+    return emit
+
+
+_cpp_scanner = SCons.Scanner.C.CScanner()
+
+
+def _scan_without_uic_outputs(node, env, path=()):
+    return [dependency for dependency in _cpp_scanner(node, env, path)
+            if dependency.abspath not in outputs]
+
+
+moc_scanner = SCons.Scanner.Scanner(
+    function=_scan_without_uic_outputs, name='mocsource',
+    path_function=SCons.Scanner.FindPathDirs('CPPPATH'), recursive=1)
+
+
+def report_fanout(objects):
+    """Prints the translation units that include each generated header,
+    based on the dependencies SCons stored for objects in its last run."""
+    fanout = dict((path, []) for path in outputs)
+    unknown = 0
+    for node in objects:
+        implicit = node.implicit or node.get_stored_implicit()
+        if not implicit:
+            unknown += 1
+            continue
+        unit = str(node.sources[0]) if node.sources else str(node)
+        for dependency in implicit:
+            if dependency.abspath in fanout:
+                fanout[dependency.abspath].append(unit)
+    for path, units in sorted(fanout.iteritems(),
+                              key=lambda item: (-len(item[1]), item[0])):
+        print "%s: %d translation units" % (os.path.basename(path),
+                                            len(units))
+        for unit in sorted(units):
+            print "    %s" % unit
+    if unknown:
+        print "%d of %d objects were not built yet, build first for a " \
+            "complete report." % (unknown, len(objects))
+    return 0
+
+
+def UicFanout(env, library):
+    """Registers the uic-fanout alias, which reports on the objects of the
+    library node."""
+    report = SCons.Action.Action(
+        lambda target, source, env: report_fanout(library.sources), None)
+    env.AlwaysBuild(env.Alias('uic-fanout', [], report))
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Unity (jumbo) builds.
+
+With unity=N, the plain C++ sources of all active dependencies are grouped
+by directory into batches of about N files. Each batch is compiled as a
+single translation unit that #includes its files, so the Qt headers they
+share are only parsed once per batch.
+
+The batch files are written to unity/ in the build directory. Their contents
+only depend on the list of sources, and they are only rewritten when that
+changes.
+
+A file cannot always be merged with others:
+
+* Files that include moc output ("moc_foo.cpp" or "foo.moc") have to be
+  compiled on their own so automoc keeps handling them.
+* Files with internal-linkage definitions (an anonymous namespace, static or
+  const definitions at file scope, macros) may clash with the same names in
+  another file of the batch. At most one of them goes into each batch, as
+  its last file, the rest are compiled on their own.
+* Files in UNITY_EXCLUDE.
+
+Since automoc only looks at the header of the batch file, we moc the headers
+of the batched files here.
+"""
+
+import os
+import re
+
+import SCons.Node.FS
+from SCons import Script
+
+import depends
+import util
+
+UNITY_DIR = 'unity'
+
+# Sources that are never batched. main.cpp is left out of mixxx-test.
+UNITY_EXCLUDE = ['main.cpp']
+
+CXX_SUFFIXES = ['.cpp', '.cxx', '.cc']
+HEADER_EXTENSIONS = ['.h', '.hxx', '.hpp', '.hh']
+
+_moc_include = re.compile(r'^\s*#\s*include\s*["<]([^">]*/)?'
+                          r'(moc_[^">]*|[^">]*\.moc)[">]', re.M)
+_internal_linkage = re.compile(
+    r'^(namespace\s*\{|static\s|const\s|constexpr\s|\s*#\s*define\s)', re.M)
+_ccomment = re.compile(r'/\*.*?\*/', re.S)
+_cxxcomment = re.compile(r'//.*$', re.M)
+_q_object = re.compile(r'[^A-Za-z0-9_]Q_OBJECT[^A-Za-z0-9_]')
+
+
+def _strip_comments(contents):
+    return _cxxcomment.sub('', _ccomment.sub('', contents))
+
+
+def get_unity_size():
+    return int(Script.ARGUMENTS.get('unity', 0))
+
+
+def _classify(path):
+    """Returns 'plain', 'internal' or None if path cannot be batched."""
+    try:
+        with open(path) as f:
+            contents = _strip_comments(f.read())
+    except IOError:
+        return None
+    if _moc_include.search(contents):
+        return None
+    if _internal_linkage.search(contents):
+        return 'internal'
+    return 'plain'
+
+
+def _batches(plain, internal, size):
+    """Splits the files of one directory into batches of about size files.
+    Every batch gets at most one file with internal linkage definitions, as
+    its last file. Returns the batches and the files left over."""
+    count = max(1, (len(plain) + len(internal) + size - 1) // size)
+    batches = [plain[i::count] for i in xrange(count)]
+    for batch, path in zip(batches, internal):
+        batch.append(path)
+    return [batch for batch in batches if len(batch) > 1], \
+        internal[count:] + [batch[0] for batch in batches if len(batch) == 1]
+
+
+def _batch_name(directory, index):
+    name = directory.lstrip('#').replace('/', '_').replace('\\', '_')
+    return '%s_%d.cpp' % (name or 'src', index)
+
+
+def _moc_headers(build, env, source_nodes):
+    """Returns the moc outputs of the headers of source_nodes that contain a
+    Q_OBJECT, like automoc would have."""
+    moc = env.Moc5 if depends.Qt.qt5_enabled(build) else env.Moc4
+    cpppaths = env.get('QT5_AUTOMOC_CPPPATH', []) or env.get('CPPPATH', [])
+    cpppaths = [env.Dir(env.subst(path)) if isinstance(path, basestring)
+                else path for path in cpppaths]
+    mocs = []
+    for node in source_nodes:
+        base = os.path.splitext(node.name)[0]
+        for extension in HEADER_EXTENSIONS:
+            header = SCons.Node.FS.find_file(
+                base + extension, [node.get_dir()] + cpppaths)
+            if header is None:
+                continue
+            if _q_object.search(_strip_comments(header.get_contents())):
+                mocs.extend(moc(header))
+            break
+    return mocs
+
+
+def batch_sources(build, sources):
+    """Replaces the plain C++ sources in sources by unity batches of about
+    unity=N files. Returns sources unchanged if unity builds are off."""
+    size = get_unity_size()
+    if size < 2:
+        return sources
+    env = build.env
+    if build.toolchain_is_msvs:
+        # Batches easily exceed the default number of sections.
+        env.Append(CCFLAGS='/bigobj')
+
+    directories = {}
+    result = []
+    for source in sources:
+        if not isinstance(source, basestring) or \
+                os.path.splitext(source)[1] not in CXX_SUFFIXES or \
+                source in UNITY_EXCLUDE:
+            result.append(source)
+            continue
+        kind = _classify(env.File(source).srcnode().abspath)
+        if kind is None:
+            result.append(source)
+            continue
+        plain, internal = directories.setdefault(
+            os.path.dirname(source), ([], []))
+        (plain if kind == 'plain' else internal).append(source)
+
+    unity_dir = env.Dir(UNITY_DIR).abspath
+    if not os.path.isdir(unity_dir):
+        os.makedirs(unity_dir)
+    written = set()
+    batched = []
+    for directory in sorted(directories):
+        plain, internal = directories[directory]
+        batches, left_over = _batches(sorted(plain), sorted(internal), size)
+        result.extend(left_over)
+        for index, batch in enumerate(batches):
+            name = _batch_name(directory, index)
+            nodes = [env.File(source) for source in batch]
+            contents = ''.join(
+                '#include "%s"\n' % os.path.relpath(
+                    node.srcnode().abspath, unity_dir).replace('\\', '/')
+                for node in nodes)
+            util.write_if_changed(os.path.join(unity_dir, name), contents)
+            written.add(name)
+            result.append(os.path.join(UNITY_DIR, name))
+            batched.extend(nodes)
+
+    # Remove batches of earlier configurations.
+    for name in os.listdir(unity_dir):
+        if name not in written:
+            os.remove(os.path.join(unity_dir, name))
+
+    print "Unity build: %d files in %d batches" % (len(batched), len(written))
+    return result + _moc_headers(build, env, batched)
@@ -1,11 +1,24 @@
+import SCons.Builder
 from SCons import Script
+import cPickle as pickle
+import copy
+import hashlib
+import multiprocessing
 import os
 import os.path
-import re
 import stat
+import subprocess
 
 CURRENT_VCS = None
 
+# Revision counts of the last HEAD commits we built, so computing the
+# revision does not require walking the whole history on every build.
+REVISION_CACHE_FILE = 'git_revisions'
+REVISION_CACHE_SIZE = 64
+
+# Memoized information about the git checkout, see get_git_snapshot().
+GIT_SNAPSHOT = None
+
 
 def get_current_vcs():
     if CURRENT_VCS is not None:
@@ -16,16 +29,26 @@ def get_current_vcs():
 
 
 def on_git():
+    return get_git_snapshot().git_dir is not None
+
+
+def find_git_dir():
+    """Returns the git directory of the checkout containing the current
+    directory or None."""
     cwd = os.getcwd()
     basename = " "
     while len(basename) > 0:
-        try:
-            os.stat(os.path.join(cwd, ".git"))
-            return True
-        except:
-            pass
+        dot_git = os.path.join(cwd, ".git")
+        if os.path.isdir(dot_git):
+            return dot_git
+        # Worktrees and submodules have a .git file pointing to the real
+        # git directory.
+        contents = _read_git_file(dot_git)
+        if contents is not None and contents.startswith('gitdir: '):
+            return os.path.normpath(
+                os.path.join(cwd, contents[len('gitdir: '):]))
         cwd, basename = os.path.split(cwd)
-    return False
+    return None
 
 
 def get_revision():
@@ -50,6 +73,16 @@ def get_modified():
     return None
 
 
+def is_modified():
+    """Returns whether the checkout has uncommitted changes."""
+    global CURRENT_VCS
+    if CURRENT_VCS is None:
+        CURRENT_VCS = get_current_vcs()
+    if CURRENT_VCS == "git":
+        return get_git_snapshot().dirty()
+    return False
+
+
 def get_branch_name():
     global CURRENT_VCS
     if CURRENT_VCS is None:
@@ -70,29 +103,201 @@ def export_source(source, dest):
     return None
 
 
+def _read_git_file(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+def resolve_git_ref(git_dir, ref):
+    """Returns the sha of ref (e.g. refs/heads/master) without running git."""
+    common_dir = git_dir
+    commondir = _read_git_file(os.path.join(git_dir, 'commondir'))
+    if commondir:
+        common_dir = os.path.normpath(os.path.join(git_dir, commondir))
+    for directory in (git_dir, common_dir):
+        sha = _read_git_file(os.path.join(directory, ref))
+        if sha:
+            return sha
+    packed_refs = _read_git_file(os.path.join(common_dir, 'packed-refs'))
+    for line in (packed_refs or '').splitlines():
+        if line.startswith('#') or line.startswith('^'):
+            continue
+        fields = line.split(' ', 1)
+        if len(fields) == 2 and fields[1] == ref:
+            return fields[0]
+    return None
+
+
+def read_git_head(git_dir):
+    """Returns (branch name, sha) of HEAD. The branch name is '(no branch)'
+    for a detached HEAD."""
+    head = _read_git_file(os.path.join(git_dir, 'HEAD')) or ''
+    if head.startswith('ref: '):
+        ref = head[len('ref: '):]
+        branch_name = ref
+        if ref.startswith('refs/heads/'):
+            branch_name = ref[len('refs/heads/'):]
+        return branch_name, resolve_git_ref(git_dir, ref)
+    return '(no branch)', head or None
+
+
+def count_first_parent_commits(sha, known):
+    """Returns the number of commits on the first-parent history of sha.
+
+    known maps shas to their count. We stop reading the history at the first
+    known commit, so this only walks the commits added since then. Returns
+    None if git cannot be run."""
+    try:
+        process = subprocess.Popen(['git', 'rev-list', '--first-parent', sha],
+                                   stdout=subprocess.PIPE)
+    except OSError:
+        return None
+    count = 0
+    try:
+        for line in process.stdout:
+            commit = line.strip()
+            if commit in known:
+                return count + known[commit]
+            count += 1
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+    return count
+
+
+class GitSnapshot(object):
+    """Revision information of the checkout, computed at most once per build.
+
+    A single git status gives the HEAD sha and the modified files, which
+    also make the dirty flag. It does not write the index, so a build never
+    changes the repository. The branch name is read from the git directory.
+    The revision count is cached in the cache directory keyed by the HEAD
+    sha, so only a HEAD that was not built before needs a git rev-list."""
+
+    def __init__(self):
+        self.git_dir = find_git_dir()
+        # Set by the build, see set_git_cache_dir().
+        self.cache_dir = None
+        self._branch_name = None
+        self._head = None
+        self._revision = None
+        self._modified = None
+        if self.git_dir is not None:
+            self._branch_name, self._head = read_git_head(self.git_dir)
+
+    def branch_name(self):
+        return self._branch_name
+
+    def revision(self):
+        if self._revision is None:
+            self._read_status()
+            self._revision = self._compute_revision()
+        return self._revision
+
+    def modified(self):
+        self._read_status()
+        return self._modified
+
+    def dirty(self):
+        return len(self.modified()) > 0
+
+    def _read_status(self):
+        if self._modified is not None:
+            return
+        self._modified = ''
+        # --no-optional-locks keeps git status from writing the refreshed
+        # stat data back to the index. Like "git status" this only lists
+        # modified tracked files.
+        try:
+            process = subprocess.Popen(
+                ['git', '--no-optional-locks', 'status', '--porcelain=v2',
+                 '--branch', '--untracked-files=no'],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            output = process.communicate()[0]
+        except OSError:
+            return
+        if process.returncode != 0:
+            return
+        modified = []
+        for line in output.splitlines():
+            if line.startswith('# branch.oid '):
+                oid = line[len('# branch.oid '):]
+                self._head = None if oid == '(initial)' else oid
+            elif line[:2] in ('1 ', '2 ', 'u '):
+                # The path is the last field, and a rename ("2") is followed
+                # by a tab and the original path.
+                fields = {'1': 8, '2': 9, 'u': 10}[line[0]]
+                modified.append(line.split(' ', fields)[-1].split('\t')[0])
+        self._modified = '\n'.join(modified)
+
+    def _cache_path(self):
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, REVISION_CACHE_FILE)
+
+    def _compute_revision(self):
+        if self._head is None:
+            # Unborn branch, or no git and a ref we cannot resolve.
+            return 0
+        path = self._cache_path()
+        recent = []
+        if path is not None:
+            try:
+                with open(path, 'rb') as f:
+                    recent = pickle.load(f)
+            except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+                pass
+        known = dict(recent)
+        if self._head in known:
+            return known[self._head]
+
+        revision = count_first_parent_commits(self._head, known)
+        if revision is None:
+            # Without git we cannot count, and must not cache that either.
+            return 0
+        if path is None:
+            return revision
+        recent = [(sha, count) for sha, count in recent if sha != self._head]
+        recent.append((self._head, revision))
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(recent[-REVISION_CACHE_SIZE:], f,
+                            pickle.HIGHEST_PROTOCOL)
+            os.rename(path + '.tmp', path)
+        except (IOError, OSError):
+            pass
+        return revision
+
+
+def get_git_snapshot():
+    global GIT_SNAPSHOT
+    if GIT_SNAPSHOT is None:
+        GIT_SNAPSHOT = GitSnapshot()
+    return GIT_SNAPSHOT
+
+
+def set_git_cache_dir(cache_dir):
+    """Makes the revision count cached in cache_dir."""
+    get_git_snapshot().cache_dir = cache_dir
+
+
 def get_git_revision():
-    return len(os.popen("git log --pretty=oneline --first-parent").read().splitlines())
+    return get_git_snapshot().revision()
 
 
 def get_git_modified():
-    modified_matcher = re.compile(
-        "^#.*:   (?P<filename>.*?)$")  # note output might be translated
-    modified_files = []
-    for line in os.popen("git status").read().splitlines():
-        match = modified_matcher.match(line)
-        if match:
-            match = match.groupdict()
-            modified_files.append(match['filename'].strip())
-    return "\n".join(modified_files)
+    return get_git_snapshot().modified()
 
 
 def get_git_branch_name():
-    # this returns the branch name or 'HEAD' in case of detached HEAD
-    branch_name = os.popen(
-        "git rev-parse --abbrev-ref HEAD").readline().strip()
-    if branch_name == 'HEAD':
-        branch_name = '(no branch)'
-    return branch_name
+    # this returns the branch name or '(no branch)' in case of detached HEAD
+    return get_git_snapshot().branch_name()
 
 
 def export_git(source, dest):
@@ -123,6 +328,16 @@ def get_mixxx_version():
     return version
 
 
+def workers(jobs):
+    """Returns the number of threads to run jobs independent tasks with
+    inside a single action: the -j value, or the number of CPUs when SCons
+    itself runs one command at a time, but not more than jobs."""
+    num_jobs = Script.GetOption('num_jobs') or 1
+    if num_jobs < 2:
+        num_jobs = multiprocessing.cpu_count()
+    return max(min(num_jobs, jobs), 1)
+
+
 def get_flags(env, argflag, default=0):
     """
     * get value passed as an argument to scons as argflag=value
@@ -164,16 +379,78 @@ def CheckForPKG(context, name, version=""):
     return ret
 
 
-def write_build_header(path):
-    f = open(path, 'w')
+# Checks whether the compiler accepts flags for a C++ source
+def CheckCXXFlags(context, flags):
+    context.Message("Checking whether the compiler accepts %s... " %
+                    ' '.join(flags))
+    saved = copy.copy(context.env['CCFLAGS'])
+    context.env.Append(CCFLAGS=flags)
+    ret = context.TryCompile('int main() { return 0; }\n', '.cpp')
+    context.env.Replace(CCFLAGS=saved)
+    context.Result(ret)
+    return ret
+
+
+# Checks whether a C++ program links with flags
+def CheckLinkFlags(context, flags):
+    context.Message("Checking whether the linker accepts %s... " %
+                    ' '.join(flags))
+    saved = copy.copy(context.env['LINKFLAGS'])
+    context.env.Append(LINKFLAGS=flags)
+    ret = context.TryLink('int main() { return 0; }\n', '.cpp')
+    context.env.Replace(LINKFLAGS=saved)
+    context.Result(ret)
+    return ret
+
+
+def depend_on(env, node, suffixes):
+    """Makes every object env builds from a source with one of suffixes
+    depend on node."""
+    def emitter(target, source, env):
+        env.Depends(target, node)
+        return target, source
+    for name in ('StaticObject', 'SharedObject'):
+        builder = env['BUILDERS'][name]
+        if not isinstance(builder.emitter, dict):
+            continue
+        for suffix in suffixes:
+            if suffix in builder.emitter:
+                builder.add_emitter(suffix, SCons.Builder.ListEmitter(
+                    [builder.emitter[suffix], emitter]))
+
+
+def write_if_changed(path, contents):
+    """Writes contents to path unless the file already holds exactly these
+    contents, so its mtime only changes when the contents do. Returns
+    whether the file was written."""
     try:
-        branch_name = get_branch_name()
-        modified = len(get_modified()) > 0
-        # Do not emit BUILD_BRANCH on release branches.
-        if branch_name and not branch_name.startswith('release'):
-            f.write('#define BUILD_BRANCH "%s"\n' % branch_name)
-        f.write('#define BUILD_REV "%s%s"\n' % (get_revision(),
-                                                '+' if modified else ''))
-    finally:
-        f.close()
+        with open(path, 'rb') as f:
+            if hashlib.sha1(f.read()).digest() == \
+                    hashlib.sha1(contents).digest():
+                return False
+    except IOError:
+        pass
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(contents)
+    os.rename(temp_path, path)
+    return True
+
+
+def get_build_header(build_flags=None):
+    """Returns the contents of build.h."""
+    lines = []
+    branch_name = get_branch_name()
+    # Do not emit BUILD_BRANCH on release branches.
+    if branch_name and not branch_name.startswith('release'):
+        lines.append('#define BUILD_BRANCH "%s"\n' % branch_name)
+    lines.append('#define BUILD_REV "%s%s"\n' % (get_revision(),
+                                                 '+' if is_modified() else ''))
+    if build_flags is not None:
+        lines.append('#define BUILD_FLAGS "%s"\n' % build_flags)
+    return ''.join(lines)
+
+
+def write_build_header(path, build_flags=None):
+    if write_if_changed(path, get_build_header(build_flags)):
         os.chmod(path, stat.S_IRWXU | stat.S_IRWXG |stat.S_IRWXO)
@@ -69,6 +69,9 @@ int main(int argc, char * argv[]) {
     mixxx::Logging::initialize();
 
     MixxxApplication a(argc, argv);
+#ifdef MIXXX_RESOURCE_BUNDLES
+    MixxxApplication::registerResourceBundles(MIXXX_RESOURCE_BUNDLES);
+#endif
 
     // Support utf-8 for all translation strings. Not supported in Qt 5.
     // TODO(rryan): Is this needed when we switch to qt5? Some sources claim it
@@ -1,5 +1,7 @@
 
 
+#include <QDir>
+#include <QResource>
 #include <QtDebug>
 #include <QTouchEvent>
 
@@ -22,6 +24,25 @@ MixxxApplication::MixxxApplication(int& argc, char** argv)
 MixxxApplication::~MixxxApplication() {
 }
 
+// static
+void MixxxApplication::registerResourceBundles(int count) {
+    // QResource maps the bundles into memory instead of reading them.
+    QDir dir(applicationDirPath());
+#ifdef __APPLE__
+    // In Mixxx.app they are in Contents/Resources, next to Contents/MacOS.
+    if (!dir.exists("mixxx_shard0.rcc") &&
+            dir.exists("../Resources/mixxx_shard0.rcc")) {
+        dir.cd("../Resources");
+    }
+#endif
+    for (int i = 0; i < count; ++i) {
+        QString bundle = dir.filePath(QString("mixxx_shard%1.rcc").arg(i));
+        if (!QResource::registerResource(bundle)) {
+            qWarning() << "Could not register resource bundle" << bundle;
+        }
+    }
+}
+
 #if QT_VERSION < QT_VERSION_CHECK(5, 0, 0)
 bool MixxxApplication::notify(QObject* target, QEvent* event) {
     switch (event->type()) {
@@ -11,6 +11,11 @@ class MixxxApplication : public QApplication {
   public:
     MixxxApplication(int& argc, char** argv);
     virtual ~MixxxApplication();
+
+    // Registers the binary resource bundles mixxx_shard<i>.rcc (i < count)
+    // next to the executable, see qrc_binary=1 in the build.
+    static void registerResourceBundles(int count);
+
 #if QT_VERSION < QT_VERSION_CHECK(5, 0, 0)
     virtual bool notify(QObject*, QEvent*);
 #endif
@@ -25,6 +25,9 @@ int main(int argc, char **argv) {
 
     // Otherwise, run the test suite:
     MixxxTest::ApplicationScope applicationScope(argc, argv);
+#ifdef MIXXX_RESOURCE_BUNDLES
+    MixxxApplication::registerResourceBundles(MIXXX_RESOURCE_BUNDLES);
+#endif
 
     if (run_benchmarks) {
         benchmark::RunSpecifiedBenchmarks();